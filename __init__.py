@@ -1 +1,5 @@
-from cp import (Controller, command, argument, reader)
\ No newline at end of file
+from cp import (Controller, command, argument, reader, stream,
+                ArgumentError)
+from resources import (resource, Pool, TCPTransport, SerialTransport,
+                       TransportError)
+from cache import invalidate
@@ -0,0 +1,119 @@
+"""
+aio.py
+jlazear
+
+asyncio support for cp commands (Python 3 only).
+
+Commands may be coroutine functions (`async def`). They are run on a single
+asyncio event loop in a dedicated thread, next to the GUI's event loop, so a
+controller may keep many instrument transactions in flight at once, e.g.
+polling several devices or waiting on socket responses, without tying up a
+worker thread per transaction. Results are handed back to the GUI through
+`concurrent.futures.Future`s, like those of the other commands (see
+`dispatch`).
+
+All of the coroutine commands of a process share the loop returned by
+`event_loop`, so connections (e.g. `asyncio` streams) opened by one command
+may be used by the others.
+
+Example:
+
+    @Controller
+    class Ctrl(object):
+        @command
+        async def query(self, msg='*IDN?'):
+            reader, writer = await asyncio.open_connection('localhost', 5025)
+            ...
+
+    future = event_loop().submit(ctrl.query(msg='*IDN?'))
+"""
+
+import inspect
+import threading
+
+
+def iscoroutinefunction(f):
+    """True if `f`, or the function wrapped by it (see `functools.wraps`),
+    is a coroutine function. Always False on Python 2."""
+    check = getattr(inspect, 'iscoroutinefunction', None)
+    if check is None:
+        return False
+    while True:
+        if check(f):
+            return True
+        try:
+            f = f.__wrapped__
+        except AttributeError:
+            return False
+
+
+def iscoroutine(obj):
+    check = getattr(inspect, 'iscoroutine', None)
+    return check is not None and check(obj)
+
+
+class EventLoopThread(object):
+    """
+    An asyncio event loop running forever in a daemon thread.
+    """
+    def __init__(self, name='cp-asyncio'):
+        import asyncio  # Only imported when a coroutine command is run
+        self.loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=name)
+        self.thread.daemon = True
+        self.thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        import asyncio
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self._ready.set)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def submit(self, coro):
+        """
+        Schedule the coroutine object `coro` on the loop. Returns a
+        `concurrent.futures.Future` for its result. May be called from any
+        thread.
+        """
+        import asyncio
+        if not iscoroutine(coro):
+            raise TypeError('{0!r} is not a coroutine'.format(coro))
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run the coroutine object `coro` on the loop and wait for its
+        result. Must not be called from the loop's thread."""
+        return self.submit(coro).result(timeout)
+
+    def stop(self, timeout=None):
+        """Stop the loop, once the callbacks already scheduled have run."""
+        if self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        if threading.current_thread() is not self.thread:
+            self.thread.join(timeout)
+
+
+_loop = None
+_lock = threading.Lock()
+
+
+def event_loop():
+    """The `EventLoopThread` shared by the coroutine commands, started the
+    first time this is called."""
+    global _loop
+    with _lock:
+        if _loop is None or not _loop.thread.is_alive():
+            _loop = EventLoopThread()
+        return _loop
+
+
+def run(coro, timeout=None):
+    """Run the coroutine object `coro` on the shared loop and return its
+    result."""
+    return event_loop().run(coro, timeout)
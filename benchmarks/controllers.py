@@ -0,0 +1,190 @@
+"""
+Overhead of cp's command machinery.
+
+Measures, for synthetic controllers of 10 to 1000 commands (see
+`harness.make_controller`), how long decorating the commands and building
+the command registry take, and the per-invocation overhead of running a
+command the way the GUI does: looking up its spec, conditioning its raw
+(string) arguments and submitting it to the `Dispatcher`, as
+`MainFrame.onCommand` does, then waiting for its callback. None of this
+requires wx.
+
+Usage:
+
+    python benchmarks/controllers.py [-n REPEAT] [--sizes 10,100,1000]
+                                     [--calls N] [--json] [-o FILE]
+"""
+
+import sys
+import threading
+
+import harness
+
+
+RAW = {'x': '1.5', 'n': '3', 'values': '[1, 2, 3]'}
+
+
+def bench_decoration(ncommands, repeat):
+    """Time to decorate the commands of a controller and to build its
+    registry, which is what defining a `Controller` class costs."""
+    from registry import registry_for
+    decoration = harness.measure(lambda: harness.make_controller(ncommands),
+                                 repeat)
+    classes = [harness.make_controller(ncommands) for _ in range(repeat)]
+    times = []
+    for cls in classes:
+        start = harness._clock()
+        registry_for(cls)
+        times.append(harness._clock() - start)
+    introspection = harness.summarize(times)
+    cls = classes[0]
+    registry = registry_for(cls)
+    names = registry.names()
+    lookup = harness.measure(lambda: [registry[name] for name in names],
+                             repeat)
+    return {'decoration': decoration,
+            'introspection': introspection,
+            'decoration_per_command': decoration['median']/ncommands,
+            'introspection_per_command': introspection['median']/ncommands,
+            'lookup_per_command': lookup['median']/ncommands}
+
+
+def make_finish(spec):
+    """The `finish` of `MainFrame.make_finish`, without wx, for the
+    synthetic commands, whose return values are neither streams nor file
+    names to wait for."""
+    from stream import isstream
+
+    def _finish(retval):
+        if isstream(retval, spec.stream is not None):
+            raise TypeError('Streaming commands are not benchmarked')
+        return retval
+    return _finish
+
+
+class GuiPath(object):
+    """
+    Runs commands through the same steps as `MainFrame.onCommand`, with the
+    callback called directly by the worker thread instead of through
+    `wx.CallAfter`.
+    """
+    def __init__(self, controller, registry, workers=4):
+        from dispatch import Dispatcher
+        self.registry = registry
+        self.dispatcher = Dispatcher(controller, max_workers=workers)
+
+    def on_command(self, name, raw, callback):
+        spec = self.registry[name]
+        argdict = spec.conditioner(raw)
+        self.dispatcher.submit(name, argdict, callback=callback,
+                               executor=spec.executor,
+                               finish=make_finish(spec))
+
+    def call(self, name, raw):
+        """Run the command and wait for its callback."""
+        done = threading.Event()
+        self.on_command(name, raw, lambda name, future: done.set())
+        done.wait()
+
+    def burst(self, names, raw):
+        """Run the commands `names` all at once and wait for all of their
+        callbacks."""
+        done = threading.Event()
+        remaining = [len(names)]
+        lock = threading.Lock()
+
+        def _callback(name, future):
+            with lock:
+                remaining[0] -= 1
+                if not remaining[0]:
+                    done.set()
+        for name in names:
+            self.on_command(name, raw, _callback)
+        done.wait()
+
+    def close(self):
+        self.dispatcher.shutdown(wait=True)
+
+
+def bench_dispatch(ncommands, ncalls, repeat):
+    """
+    Per-invocation cost of running commands through the GUI's path: the
+    latency of one call at a time, its conditioning and direct-call parts,
+    and the time per call of bursts of `ncalls` calls.
+    """
+    from registry import registry_for
+    cls = harness.make_controller(ncommands)
+    controller = cls()
+    registry = registry_for(cls)
+    names = [harness.command_name(i % ncommands) for i in range(ncalls)]
+    path = GuiPath(controller, registry)
+    try:
+        for name in names[:min(ncalls, 100)]:  # Warm up the thread pool
+            path.call(name, RAW)
+        latencies = []
+        for name in names:
+            start = harness._clock()
+            path.call(name, RAW)
+            latencies.append(harness._clock() - start)
+        burst = harness.measure(lambda: path.burst(names, RAW), repeat)
+    finally:
+        path.close()
+    spec = registry[names[0]]
+    conditioning = harness.measure(lambda: spec.conditioner(RAW), repeat,
+                                   ncalls)
+    kwargs = spec.conditioner(RAW)
+    method = getattr(controller, names[0])
+    direct = harness.measure(lambda: method(**kwargs), repeat, ncalls)
+    latency = harness.percentiles(latencies)
+    latency['mean'] = sum(latencies)/len(latencies)
+    return {'latency': latency,
+            'conditioning': conditioning['median'],
+            'direct_call': direct['median'],
+            'overhead': latency['p50'] - direct['median'],
+            'burst_per_call': burst['median']/ncalls,
+            'calls_per_second': ncalls/burst['median']}
+
+
+def run(sizes=harness.SIZES, repeat=5, ncalls=2000):
+    """Run the benchmarks. Returns their results by controller size."""
+    results = {}
+    for ncommands in sizes:
+        result = bench_decoration(ncommands, repeat)
+        result['dispatch'] = bench_dispatch(ncommands, ncalls, repeat)
+        results[str(ncommands)] = result
+    return results
+
+
+def text(document):
+    params = document['parameters']
+    print('{0:>9} {1:>12} {2:>12} {3:>10} {4:>10} {5:>10} {6:>12}'.format(
+        'commands', 'decorate ms', 'registry ms', 'p50 us', 'p99 us',
+        'over. us', 'burst call/s'))
+    for ncommands in params['sizes']:
+        r = document['results'][str(ncommands)]
+        d = r['dispatch']
+        print('{0:>9} {1:>12.2f} {2:>12.2f} {3:>10.1f} {4:>10.1f} {5:>10.1f} '
+              '{6:>12.0f}'.format(ncommands, 1e3*r['decoration']['median'],
+                                  1e3*r['introspection']['median'],
+                                  1e6*d['latency']['p50'],
+                                  1e6*d['latency']['p99'],
+                                  1e6*d['overhead'], d['calls_per_second']))
+
+
+def main(argv=None):
+    parser = harness.make_parser(__doc__)
+    parser.add_argument('--sizes', type=harness.parse_sizes,
+                        default=harness.SIZES,
+                        help='numbers of commands, e.g. 10,100,1000')
+    parser.add_argument('--calls', type=int, default=2000,
+                        help='command invocations per measurement')
+    args = parser.parse_args(argv)
+    results = run(args.sizes, args.repeat, args.calls)
+    document = harness.report('controllers', results, sizes=list(args.sizes),
+                              repeat=args.repeat, calls=args.calls)
+    harness.emit(document, args, text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""
+Shared helpers of the cp benchmarks.
+
+Timing, synthetic controllers and the JSON report format used by every
+benchmark script, so that their results can be collected by `run.py` and
+compared between revisions. Importing this module puts the repository root
+first on `sys.path`, so the benchmarks measure the working tree rather than
+an installed cp.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if sys.path[0] != ROOT:
+    sys.path.insert(0, ROOT)
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+# Controller sizes (numbers of commands) measured by default
+SIZES = (10, 100, 1000)
+
+
+def measure(func, repeat=5, number=1):
+    """
+    Call `func()` `number` times in each of `repeat` runs. Returns a dict of
+    the time per call (in seconds) of the fastest run ('min'), the median
+    run ('median') and the mean over all runs ('mean').
+    """
+    times = []
+    for _ in range(repeat):
+        start = _clock()
+        for _ in range(number):
+            func()
+        times.append((_clock() - start)/number)
+    return summarize(times, number)
+
+
+def summarize(times, number=1):
+    """The statistics of `measure` for a list of times per call."""
+    times = sorted(times)
+    return {'min': times[0],
+            'median': times[len(times)//2],
+            'mean': sum(times)/len(times),
+            'repeat': len(times),
+            'number': number}
+
+
+def percentiles(times, ps=(50, 90, 99)):
+    """Dict of the `ps` percentiles of `times`, keyed 'p50' etc., with the
+    maximum as 'max'."""
+    times = sorted(times)
+    result = dict(('p{0}'.format(p),
+                   times[min(len(times) - 1, int(p/100.*len(times)))])
+                  for p in ps)
+    result['max'] = times[-1]
+    return result
+
+
+def make_controller(ncommands, name='Synthetic'):
+    """
+    Make a controller class with `ncommands` commands, decorated as a real
+    controller would be. Every command takes a float, an int and a list
+    argument, conditioned by `argument`, and returns its first argument.
+    Commands are named cmd0000, cmd0001, ...
+
+    The class is not wrapped by `Controller`, which would start the GUI
+    when it is instantiated; use `registry.registry_for` for its metadata.
+    """
+    from cp import argument, command
+    namespace = {'__doc__': 'Synthetic controller of {0} commands.'.format(
+        ncommands)}
+    for i in range(ncommands):
+        namespace[command_name(i)] = _make_command(command, argument, i)
+    return type(name, (object,), namespace)
+
+
+def command_name(i):
+    return 'cmd{0:04d}'.format(i)
+
+
+def _make_command(command, argument, i):
+    def f(self, x=1., n=1, values=None):
+        return x
+    f.__name__ = command_name(i)
+    f.__doc__ = 'Synthetic command {0}.'.format(i)
+    f = argument('x', 'float')(f)
+    f = argument('n', 'int')(f)
+    f = argument('values', 'list')(f)
+    return command(group='group{0}'.format(i % 10))(f)
+
+
+def parse_sizes(text):
+    """'10,100,1000' -> (10, 100, 1000)"""
+    return tuple(int(s) for s in text.split(',') if s.strip())
+
+
+def make_parser(doc, **defaults):
+    """The argument parser common to the benchmark scripts: --repeat,
+    --json and --output."""
+    parser = argparse.ArgumentParser(description=doc.split('\n\n')[1])
+    parser.add_argument('-n', '--repeat', type=int,
+                        default=defaults.get('repeat', 5))
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON')
+    parser.add_argument('-o', '--output', default=None,
+                        help='also write the JSON results to this file')
+    return parser
+
+
+def report(name, results, **params):
+    """The JSON document of the results of the benchmark `name`."""
+    return {'benchmark': name,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'parameters': params,
+            'results': results}
+
+
+def emit(document, args, text=None):
+    """
+    Write `document` as JSON to `args.output`, if set, and print it as JSON
+    if `args.json` is set, or else call `text(document)` to print it for
+    humans.
+    """
+    dumped = json.dumps(document, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(dumped + '\n')
+    if args.json or text is None:
+        sys.stdout.write(dumped + '\n')
+    else:
+        text(document)
+
+
+def error_result(e):
+    """The result of a benchmark that could not run because of `e`."""
+    return {'error': '{0}: {1}'.format(type(e).__name__, e)}
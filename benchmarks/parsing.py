@@ -0,0 +1,173 @@
+"""
+Parse throughput of the readers.
+
+Writes synthetic data files in the formats that commands commonly write
+(ASCII-Hex and decimal text, and binary capture files for reference) and
+measures how fast each reader that handles the format reads a whole file,
+in MB/s of file and rows/s. The pyoscope readers are included when pyoscope
+is installed.
+
+Usage:
+
+    python benchmarks/parsing.py [-n REPEAT] [--mbytes MB] [--columns N]
+                                 [--formats hex,decimal,...] [--json]
+                                 [-o FILE]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import harness
+
+
+# Format -> (module, reader class name) of the readers of the format
+READERS = {
+    'hex': [('cpreaders', 'MMapHexReader'), ('cpreaders', 'HexTailReader'),
+            ('readers', 'HexReader')],
+    'hex_variable': [('cpreaders', 'MMapHexReader'),
+                     ('cpreaders', 'HexTailReader'),
+                     ('readers', 'HexReader')],
+    'decimal': [('cpreaders', 'MMapDecReader'), ('cpreaders', 'TailReader'),
+                ('readers', 'DefaultReader')],
+    'decimal_float': [('cpreaders', 'MMapDecReader'),
+                      ('cpreaders', 'TailReader'),
+                      ('readers', 'DefaultReader')],
+    'capture': [('cpreaders', 'CaptureReader')],
+}
+
+FORMATS = ('hex', 'hex_variable', 'decimal', 'decimal_float', 'capture')
+
+# Format -> (numpy.savetxt format of a value, delimiter)
+_TEXT = {'hex': ('%04X', ' '),
+         'hex_variable': ('%X', ' '),
+         'decimal': ('%04d', ' '),
+         'decimal_float': ('%.6g', ',')}
+
+
+def make_values(nrows, ncolumns, fmt):
+    """Random values like those of an ADC, or floats for 'decimal_float'."""
+    import numpy as np
+    rng = np.random.RandomState(0)
+    if fmt == 'decimal_float':
+        return rng.standard_normal((nrows, ncolumns))
+    return rng.randint(0, 1 << 12, size=(nrows, ncolumns))
+
+
+def write_file(dirname, fmt, mbytes, ncolumns):
+    """
+    Write a file of about `mbytes` MB of `ncolumns` columns in the format
+    `fmt` in `dirname`. Returns its name and its number of rows.
+    """
+    import numpy as np
+    columns = ['c{0}'.format(i) for i in range(ncolumns)]
+    filename = os.path.join(dirname, 'data.' + fmt)
+    if fmt == 'capture':
+        from capture import CaptureWriter
+        nrows = int(mbytes*1e6)//(8*ncolumns)
+        values = make_values(nrows, ncolumns, fmt)
+        with CaptureWriter(filename, columns, 'f8') as w:
+            w.write(values)
+        return filename, nrows
+    valuefmt, delimiter = _TEXT[fmt]
+    sample = make_values(1000, ncolumns, fmt)
+    rowbytes = _text_size(sample, valuefmt, delimiter)/1000.
+    nrows = int(mbytes*1e6/rowbytes)
+    values = make_values(nrows, ncolumns, fmt)
+    with open(filename, 'wb') as f:
+        f.write('# columns: {0}\n'.format(', '.join(columns)).encode('ascii'))
+        np.savetxt(f, values, fmt=valuefmt, delimiter=delimiter)
+    return filename, nrows
+
+
+def _text_size(values, valuefmt, delimiter):
+    import io
+    import numpy as np
+    buf = io.BytesIO()
+    np.savetxt(buf, values, fmt=valuefmt, delimiter=delimiter)
+    return len(buf.getvalue())
+
+
+def load_reader(modname, clsname):
+    module = __import__(modname)
+    return getattr(module, clsname)
+
+
+def bench_reader(readerclass, filename, repeat):
+    """Time for a new `readerclass` to read all of `filename`."""
+    def _read():
+        reader = readerclass(filename)
+        try:
+            reader.init_data()
+        finally:
+            close = getattr(reader, 'close', None)
+            if close is not None:
+                close()
+    _read()  # Warm up the page cache and the imports
+    return harness.measure(_read, repeat)
+
+
+def run(formats=FORMATS, mbytes=8., ncolumns=4, repeat=3):
+    """Run the benchmarks. Returns their results by format and reader."""
+    results = {}
+    dirname = tempfile.mkdtemp(prefix='cp-bench-')
+    try:
+        for fmt in formats:
+            filename, nrows = write_file(dirname, fmt, mbytes, ncolumns)
+            size = os.path.getsize(filename)
+            result = {'bytes': size, 'rows': nrows, 'readers': {}}
+            for modname, clsname in READERS[fmt]:
+                try:
+                    readerclass = load_reader(modname, clsname)
+                    timing = bench_reader(readerclass, filename, repeat)
+                except Exception as e:  # E.g. pyoscope is not installed
+                    result['readers'][clsname] = harness.error_result(e)
+                    continue
+                timing['mbytes_per_second'] = size/timing['median']/1e6
+                timing['rows_per_second'] = nrows/timing['median']
+                result['readers'][clsname] = timing
+            results[fmt] = result
+            os.remove(filename)
+    finally:
+        shutil.rmtree(dirname, ignore_errors=True)
+    return results
+
+
+def text(document):
+    for fmt in document['parameters']['formats']:
+        result = document['results'][fmt]
+        print('{0} ({1:.1f} MB, {2} rows)'.format(fmt, result['bytes']/1e6,
+                                                  result['rows']))
+        for name, r in sorted(result['readers'].items()):
+            if 'error' in r:
+                print('    {0:<16} failed: {1}'.format(name, r['error']))
+            else:
+                print('    {0:<16} {1:9.1f} ms {2:9.1f} MB/s {3:12.0f} '
+                      'rows/s'.format(name, 1e3*r['median'],
+                                      r['mbytes_per_second'],
+                                      r['rows_per_second']))
+
+
+def main(argv=None):
+    parser = harness.make_parser(__doc__, repeat=3)
+    parser.add_argument('--mbytes', type=float, default=8.,
+                        help='size of each data file in MB')
+    parser.add_argument('--columns', type=int, default=4)
+    parser.add_argument('--formats', default=','.join(FORMATS),
+                        help='formats to read, of ' + ', '.join(FORMATS))
+    args = parser.parse_args(argv)
+    formats = [fmt for fmt in args.formats.split(',') if fmt]
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        parser.error('unknown formats: ' + ', '.join(sorted(unknown)))
+    results = run(formats, args.mbytes, args.columns, args.repeat)
+    document = harness.report('parsing', results, formats=formats,
+                              mbytes=args.mbytes, columns=args.columns,
+                              repeat=args.repeat)
+    harness.emit(document, args, text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
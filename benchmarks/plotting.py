@@ -0,0 +1,197 @@
+"""
+Cost of the GUI: building the command frame and updating the plot.
+
+Measures how long `MainFrame` takes to build for synthetic controllers of 10
+to 1000 commands (see `harness.make_controller`), and the time per frame of
+the plot update loop, `GraphBindings.on_timer`, plotting 1e3 to 1e7 points
+of a capture file with the WXAgg canvas of the real GUI. Each frame is
+forced to redraw, as if new data had arrived; 'idle' frames, where the data
+did not change, are measured as well.
+
+Requires wx, pyoscope and a display. On a headless machine, run it on a
+virtual X server:
+
+    xvfb-run -s '-screen 0 1280x1024x24' python benchmarks/plotting.py
+
+Usage:
+
+    python benchmarks/plotting.py [-n REPEAT] [--sizes 10,100,1000]
+                                  [--points 1e3,1e5,1e7] [--frames N]
+                                  [--json] [-o FILE]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import harness
+
+
+POINTS = (1000, 10000, 100000, 1000000, 10000000)
+
+
+def parse_points(text):
+    """'1e3,1e5' -> (1000, 100000)"""
+    return tuple(int(float(s)) for s in text.split(',') if s.strip())
+
+
+def check_display():
+    """Raise RuntimeError if there is no display for wx to use."""
+    if sys.platform.startswith('linux') and not (
+            os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY')):
+        raise RuntimeError('No display; run on a virtual X server, e.g. '
+                           'with xvfb-run')
+
+
+def make_app(ncommands=10):
+    """Make the GUI of a synthetic controller of `ncommands` commands, as
+    `Controller` does, without entering its main loop."""
+    check_display()
+    from gui.app import CPApp
+    controller = harness.make_controller(ncommands)()
+    return CPApp(controller)
+
+
+def bench_mainframe(app, ncommands, repeat):
+    """Time to build (and show) the `MainFrame` of a controller of
+    `ncommands` commands. The registry is built beforehand."""
+    import wx
+    from dispatch import Dispatcher
+    from gui.mainframe import MainFrame
+    from registry import registry_for
+    cls = harness.make_controller(ncommands)
+    controller = cls()
+    registry_for(cls)
+    dispatcher = Dispatcher(controller, callafter=wx.CallAfter)
+    times = []
+    try:
+        for _ in range(repeat):
+            start = harness._clock()
+            frame = MainFrame(controller, dispatcher)
+            frame.Show()
+            times.append(harness._clock() - start)
+            frame.timer.Stop()
+            frame.Destroy()
+            wx.Yield()
+    finally:
+        dispatcher.shutdown(wait=True)
+    return harness.summarize(times)
+
+
+def write_capture(dirname, npoints, blockrows=1 << 20):
+    """Write a capture file of `npoints` rows of a time column and two
+    noisy sine waves. Returns its name."""
+    import numpy as np
+    from capture import CaptureWriter
+    filename = os.path.join(dirname, 'plot{0}.cap'.format(npoints))
+    rng = np.random.RandomState(0)
+    with CaptureWriter(filename, ['t', 'a', 'b'], blockrows=blockrows) as w:
+        for start in range(0, npoints, blockrows):
+            t = np.arange(start, min(start + blockrows, npoints))*1e-3
+            w.write({'t': t,
+                     'a': np.sin(t) + 0.1*rng.standard_normal(len(t)),
+                     'b': np.cos(t) + 0.1*rng.standard_normal(len(t))})
+    return filename
+
+
+def bench_on_timer(app, filename, nframes):
+    """
+    Plot `filename` as `MainFrame.showResult` does, then time `nframes`
+    updates of the plot, forced to redraw, and `nframes` idle updates.
+    """
+    import wx
+    from cpreaders import CaptureReader
+    pyo = app.pyo
+    bindings = app.binder.graphbindings
+    timer = bindings.timer
+    pyo.switch_file(filename, CaptureReader)
+    pyo.plot()
+    bindings.on_timer(None)  # Sets up the channels and the first plot
+    timer.Stop()
+    wx.Yield()
+    redraws = []
+    idles = []
+    for _ in range(nframes):
+        bindings.signature = None  # As if the file had changed
+        start = harness._clock()
+        bindings.on_timer(None)
+        redraws.append(harness._clock() - start)
+        timer.Stop()
+        wx.Yield()  # Paint, outside of the timing
+    for _ in range(nframes):
+        start = harness._clock()
+        bindings.on_timer(None)
+        idles.append(harness._clock() - start)
+        timer.Stop()
+    result = harness.percentiles(redraws)
+    result['median'] = harness.summarize(redraws)['median']
+    result['idle'] = harness.summarize(idles)['median']
+    result['fps'] = 1./result['median']
+    return result
+
+
+def run(sizes=harness.SIZES, points=POINTS, repeat=5, nframes=20):
+    """Run the benchmarks. Returns their results, or the error that kept
+    them from running."""
+    try:
+        app = make_app()
+    except Exception as e:  # E.g. no wx, pyoscope or display
+        return harness.error_result(e)
+    results = {'mainframe': {}, 'on_timer': {}}
+    for ncommands in sizes:
+        results['mainframe'][str(ncommands)] = bench_mainframe(
+            app, ncommands, repeat)
+    dirname = tempfile.mkdtemp(prefix='cp-bench-')
+    try:
+        for npoints in points:
+            filename = write_capture(dirname, npoints)
+            results['on_timer'][str(npoints)] = bench_on_timer(
+                app, filename, nframes)
+            app.pyo.reader.close()
+            os.remove(filename)
+    finally:
+        shutil.rmtree(dirname, ignore_errors=True)
+        app.binder.mainbindings.on_close(None)
+    return results
+
+
+def text(document):
+    results = document['results']
+    if 'error' in results:
+        print('Not run: {0}'.format(results['error']))
+        return
+    params = document['parameters']
+    print('{0:>9} {1:>14}'.format('commands', 'MainFrame ms'))
+    for ncommands in params['sizes']:
+        r = results['mainframe'][str(ncommands)]
+        print('{0:>9} {1:>14.1f}'.format(ncommands, 1e3*r['median']))
+    print('{0:>9} {1:>10} {2:>10} {3:>8} {4:>10}'.format(
+        'points', 'frame ms', 'p90 ms', 'fps', 'idle ms'))
+    for npoints in params['points']:
+        r = results['on_timer'][str(npoints)]
+        print('{0:>9} {1:>10.1f} {2:>10.1f} {3:>8.1f} {4:>10.2f}'.format(
+            npoints, 1e3*r['median'], 1e3*r['p90'], r['fps'],
+            1e3*r['idle']))
+
+
+def main(argv=None):
+    parser = harness.make_parser(__doc__)
+    parser.add_argument('--sizes', type=harness.parse_sizes,
+                        default=harness.SIZES,
+                        help='numbers of commands, e.g. 10,100,1000')
+    parser.add_argument('--points', type=parse_points, default=POINTS,
+                        help='numbers of points plotted, e.g. 1e3,1e5,1e7')
+    parser.add_argument('--frames', type=int, default=20,
+                        help='plot updates timed per number of points')
+    args = parser.parse_args(argv)
+    results = run(args.sizes, args.points, args.repeat, args.frames)
+    document = harness.report('plotting', results, sizes=list(args.sizes),
+                              points=list(args.points), repeat=args.repeat,
+                              frames=args.frames)
+    harness.emit(document, args, text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""
+Run all of the cp benchmarks.
+
+Runs the benchmarks of startup time (startup.py), of the command machinery
+(controllers.py), of the readers (parsing.py) and of the GUI (plotting.py,
+which is reported as not run without wx, pyoscope or a display) and writes
+their results as a single JSON document, so that runs on different revisions
+can be compared. The benchmarks that could not be run are listed on
+stderr. With --compare, the medians are compared with those of an earlier
+run and the benchmarks that got slower by more than --threshold are listed.
+
+Usage:
+
+    python benchmarks/run.py [-o results.json] [--only parsing,controllers]
+                             [--quick] [--compare old.json]
+                             [--threshold 0.2]
+"""
+
+import argparse
+import json
+import sys
+
+import harness
+
+import controllers
+import parsing
+import plotting
+import startup
+
+
+BENCHMARKS = ('startup', 'controllers', 'parsing', 'plotting')
+
+
+def run(names=BENCHMARKS, quick=False):
+    """Run the benchmarks `names`. With `quick`, they are run on smaller
+    inputs with fewer repeats, e.g. as a smoke test."""
+    repeat = 2 if quick else 5
+    results = {}
+    for name in names:
+        sys.stderr.write('Running {0}...\n'.format(name))
+        if name == 'startup':
+            results[name] = startup.run(3 if quick else 10)
+        elif name == 'controllers':
+            results[name] = controllers.run(
+                (10, 100) if quick else harness.SIZES, repeat,
+                200 if quick else 2000)
+        elif name == 'parsing':
+            results[name] = parsing.run(mbytes=1. if quick else 8.,
+                                        repeat=repeat)
+        elif name == 'plotting':
+            results[name] = plotting.run(
+                (10, 100) if quick else harness.SIZES,
+                (1000, 100000) if quick else plotting.POINTS,
+                repeat, 5 if quick else 20)
+    return results
+
+
+def flatten(results, prefix=''):
+    """
+    The medians of `results` by path, e.g.
+    'parsing/hex/readers/MMapHexReader', the path of each dict of timing
+    statistics of `harness.measure`.
+    """
+    flat = {}
+    for key, value in results.items():
+        if not isinstance(value, dict):
+            continue
+        path = prefix + str(key)
+        if isinstance(value.get('median'), (int, float)):
+            flat[path] = value['median']
+        flat.update(flatten(value, path + '/'))
+    return flat
+
+
+def errors(results, prefix=''):
+    """
+    The errors of the measurements that could not be made, by path, e.g.
+    {'plotting': 'RuntimeError: No display; ...'}.
+    """
+    found = {}
+    for key, value in results.items():
+        if not isinstance(value, dict):
+            continue
+        path = prefix + str(key)
+        if value.get('error'):
+            found[path] = value['error']
+        found.update(errors(value, path + '/'))
+    return found
+
+
+def compare(old, new, threshold=0.2):
+    """
+    Compare the results of two runs. Returns a list of (path, old median,
+    new median, ratio) of the measurements that are more than `threshold`
+    (as a fraction) slower in `new`, slowest first.
+    """
+    old = flatten(old['results'])
+    new = flatten(new['results'])
+    slower = []
+    for path in sorted(set(old) & set(new)):
+        if old[path] > 0 and new[path] > old[path]*(1 + threshold):
+            slower.append((path, old[path], new[path], new[path]/old[path]))
+    slower.sort(key=lambda item: -item[3])
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('-o', '--output', default=None,
+                        help='write the JSON results to this file instead '
+                        'of printing them')
+    parser.add_argument('--only', default=','.join(BENCHMARKS),
+                        help='benchmarks to run, of ' + ', '.join(BENCHMARKS))
+    parser.add_argument('--quick', action='store_true',
+                        help='smaller inputs and fewer repeats')
+    parser.add_argument('--compare', default=None, metavar='JSON',
+                        help='results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='slowdown reported by --compare, as a fraction')
+    args = parser.parse_args(argv)
+    names = [name for name in args.only.split(',') if name]
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        parser.error('unknown benchmarks: ' + ', '.join(sorted(unknown)))
+
+    document = harness.report('all', run(names, args.quick),
+                              benchmarks=names, quick=args.quick)
+    for path, error in sorted(errors(document['results']).items()):
+        sys.stderr.write('{0}: not run: {1}\n'.format(path, error))
+    dumped = json.dumps(document, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(dumped + '\n')
+    else:
+        sys.stdout.write(dumped + '\n')
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        slower = compare(old, document, args.threshold)
+        for path, before, after, ratio in slower:
+            sys.stderr.write('{0}: {1:.3g} s -> {2:.3g} s ({3:.2f}x)\n'.format(
+                path, before, after, ratio))
+        sys.stderr.write('{0} measurements slower by more than {1:.0%}\n'
+                         .format(len(slower), args.threshold))
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
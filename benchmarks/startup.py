@@ -0,0 +1,99 @@
+"""
+Startup time of cp.
+
+Measures, in fresh interpreters, how long `import cp` takes and which heavy
+modules it pulls in, and compares it with the cost of the modules that cp
+used to import eagerly (the GUI, the pyoscope readers and the cp readers),
+which `import cp` took before they were imported lazily.
+
+Usage:
+
+    python benchmarks/startup.py [-n REPEAT] [--json]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY = ('wx', 'matplotlib', 'pyoscope', 'readers', 'numpy', 'pandas')
+
+# Statements timed in a fresh interpreter each. Before the GUI, readers and
+# literal parsers were imported lazily, `import cp` paid for all of them.
+CASES = [('cp', 'import cp'),
+         ('cp readers and parsers (NumPy)', 'import cpreaders, literal'),
+         ('pyoscope readers', 'import readers'),
+         ('GUI (wx, matplotlib, pyoscope)', 'import gui.app')]
+
+_SCRIPT = """
+import sys, time, json
+sys.path.insert(0, {root!r})
+t0 = time.time()
+try:
+    {stmt}
+    error = None
+except Exception as e:
+    error = '{{0}}: {{1}}'.format(type(e).__name__, e)
+dt = time.time() - t0
+heavy = [m for m in {heavy!r} if m in sys.modules]
+sys.stdout.write(json.dumps({{'time': dt, 'error': error, 'heavy': heavy}}))
+"""
+
+
+def time_import(stmt, repeat):
+    """Run `stmt` in `repeat` fresh interpreters. Returns a dict of the
+    timings (in seconds) and the heavy modules loaded."""
+    script = _SCRIPT.format(root=ROOT, stmt=stmt, heavy=HEAVY)
+    times = []
+    result = {}
+    for _ in range(repeat):
+        out = subprocess.check_output([sys.executable, '-c', script],
+                                      cwd=ROOT)
+        result = json.loads(out.decode('utf-8'))
+        if result['error']:
+            break
+        times.append(result['time'])
+    times.sort()
+    return {'statement': stmt,
+            'error': result.get('error'),
+            'heavy_modules': result.get('heavy', []),
+            'min': times[0] if times else None,
+            'median': times[len(times)//2] if times else None,
+            'repeat': len(times)}
+
+
+def run(repeat=10):
+    """Time each of the `CASES`. Returns the results by name."""
+    return dict((name, time_import(stmt, repeat)) for name, stmt in CASES)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('-n', '--repeat', type=int, default=10)
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON')
+    args = parser.parse_args(argv)
+
+    results = run(args.repeat)
+    if args.json:
+        json.dump({'benchmark': 'startup', 'python': sys.version.split()[0],
+                   'results': results}, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+        return 0
+    for name, _ in CASES:
+        r = results[name]
+        if r['error']:
+            print('{0:<32} failed: {1}'.format(name, r['error']))
+        else:
+            print('{0:<32} median {1:8.1f} ms  min {2:8.1f} ms  '
+                  'loads: {3}'.format(name, 1e3*r['median'], 1e3*r['min'],
+                                      ', '.join(r['heavy_modules']) or '-'))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
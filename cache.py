@@ -0,0 +1,209 @@
+"""
+cache.py
+jlazear
+
+Caching of the return values of cp commands.
+
+Commands that only read instrument state that rarely changes, e.g. an
+identification string or a calibration table, may cache their return values
+with `@command(cache=True)`. Calls with the same (conditioned) arguments
+then return the cached value immediately, until it expires or the cache is
+invalidated, e.g. by a command that changes that state:
+
+    @Controller
+    class Ctrl(object):
+        @command(cache=True)                     # Kept until invalidated
+        def idn(self):
+            return self.scope.query(b'*IDN?')
+
+        @command(cache={'size': 16, 'ttl': 5.})  # 16 entries, for 5 s each
+        @argument('channel', 'int')
+        def calibration(self, channel=1):
+            ...
+
+        @command(invalidates=['calibration'])
+        def calibrate(self):
+            ...
+
+`invalidate(ctrl, 'calibration')` does the same as `calibrate` does on
+return. Each controller instance has its own caches. Calls whose arguments
+are not hashable are not cached, nor are exceptions.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+
+_now = getattr(time, 'monotonic', time.time)
+
+MISSING = object()
+
+ATTRIBUTE = '_cp_caches'  # Instance attribute holding the caches
+
+
+class Cache(object):
+    """
+    A thread-safe cache of up to `size` values, which are discarded least
+    recently used first, and expire `ttl` seconds after they were stored
+    (never if `ttl` is None).
+
+    `clear` increments the cache's `generation`. `put` drops values computed
+    in an earlier generation, so a call that was in flight while the cache
+    was invalidated never stores a stale value.
+    """
+    def __init__(self, size=128, ttl=None):
+        if size < 1:
+            raise ValueError('size must be at least 1')
+        self.size = size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (value, expiry time or None)
+        self.generation = 0
+        self.hits = 0                 # Statistics
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return '<Cache: {0}/{1} entries, {2} hits, {3} misses>'.format(
+            len(self.entries), self.size, self.hits, self.misses)
+
+    def get(self, key):
+        """The value stored for `key`, or `MISSING`."""
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                if entry[1] is None or entry[1] > _now():
+                    self.entries[key] = entry  # Now the most recently used
+                    self.hits += 1
+                    return entry[0]
+            self.misses += 1
+            return MISSING
+
+    def put(self, key, value, generation=None):
+        """Store `value` for `key`, unless the cache has been cleared since
+        `generation`. Returns True if it was stored."""
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return False
+            expiry = None if self.ttl is None else _now() + self.ttl
+            self.entries.pop(key, None)
+            self.entries[key] = (value, expiry)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+            return True
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+
+
+def cache_policy(cache):
+    """
+    The keyword arguments of `Cache` given by the `cache` option of
+    `command`: True for the defaults or a dict of them. Returns None if
+    `cache` is None or False.
+    """
+    if cache is None or cache is False:
+        return None
+    if cache is True:
+        return {}
+    if isinstance(cache, dict):
+        unknown = set(cache) - set(['size', 'ttl'])
+        if unknown:
+            raise ValueError('Unknown cache options: {0}'.format(
+                ', '.join(sorted(unknown))))
+        return dict(cache)
+    raise ValueError('cache must be True or a dict with size and/or ttl')
+
+
+def caches(controller):
+    """The dict of the caches of `controller`, by command name."""
+    d = vars(controller)
+    try:
+        return d[ATTRIBUTE]
+    except KeyError:
+        return d.setdefault(ATTRIBUTE, {})
+
+
+def invalidate(controller, *names):
+    """Clear the caches of the commands `names` of `controller`, or all of
+    its caches if no name is given."""
+    d = caches(controller)
+    if not names:
+        names = list(d)
+    for name in names:
+        c = d.get(name)
+        if c is not None:
+            c.clear()
+
+
+def make_key(argspec):
+    """
+    Make the function that makes the cache key of a call of a method with
+    the `cp.getargspec` `argspec` from the call's positional and
+    keyword arguments (without `self`). The key is the same however an
+    argument is passed, including by its default.
+    """
+    names = argspec.args[1:]
+    defaults = argspec.defaults or ()
+    nodefault = len(names) - len(defaults)
+    fill = [MISSING]*nodefault + list(defaults)
+
+    def _key(args, kwargs):
+        values = list(args[:len(names)]) + fill[len(args):]
+        extra = ()
+        if kwargs:
+            kwargs = dict(kwargs)
+            for i in range(len(args), len(names)):
+                values[i] = kwargs.pop(names[i], values[i])
+            extra = tuple(sorted(kwargs.items()))
+        return (tuple(values), tuple(args[len(names):]), extra)
+    return _key
+
+
+def cached(f, name, policy):
+    """
+    Wrap the command method `f` so that its return values are cached in
+    the `Cache(**policy)` of the command `name` of each instance.
+    """
+    key = make_key(f.argspec)
+
+    @wraps(f)
+    def _cached(self, *args, **kwargs):
+        try:
+            k = key(args, kwargs)
+            hash(k)
+        except TypeError:  # Unhashable argument
+            return f(self, *args, **kwargs)
+        d = caches(self)
+        c = d.get(name)
+        if c is None:
+            c = d.setdefault(name, Cache(**policy))
+        value = c.get(k)
+        if value is MISSING:
+            generation = c.generation
+            value = f(self, *args, **kwargs)
+            c.put(k, value, generation)
+        return value
+    return _cached
+
+
+def invalidating(f, names):
+    """
+    Wrap the command method `f` so that the caches of the commands `names`
+    are invalidated after each call, whether or not it succeeds.
+    """
+    names = tuple(names)
+
+    @wraps(f)
+    def _invalidating(self, *args, **kwargs):
+        try:
+            return f(self, *args, **kwargs)
+        finally:
+            invalidate(self, *names)
+    return _invalidating
@@ -0,0 +1,313 @@
+"""
+capture.py
+jlazear
+
+Binary columnar capture files for high-rate command output.
+
+Writing and parsing ASCII dominates the cost of high-rate acquisitions.
+A capture file instead stores the raw column values, so that writing a block
+of rows is a few `write` calls and reading it (see
+`cpreaders.CaptureReader`) is a copy out of a memory map, with no parsing.
+
+Layout (all integers little-endian):
+
+    header   MAGIC, uint32 length n, n bytes of JSON {"columns": [...],
+             "dtypes": [...], "meta": {...}}, zero padding to 8 bytes
+    block    BLOCK, uint32 nrows, then each column's nrows values,
+             each column zero-padded to 8 bytes
+    ...
+    index    INDEX, uint32 nblocks, (uint64 offset, uint64 nrows) per block
+    trailer  uint64 index offset, uint64 total rows, END
+
+The index and trailer are only written when the file is closed, and are
+replaced by the next block if it is reopened for appending. A block is
+written with a single `write` call and only read once all of its bytes are
+in the file, so a file may be read while it is being written.
+
+Example:
+
+    @command
+    @reader('CaptureReader')
+    def acquire(self, npoints=100000):
+        with CaptureWriter('acq.cap', ['t', 'v'], ['f8', 'i2']) as w:
+            for t, v in self.daq.blocks(npoints):
+                w.write({'t': t, 'v': v})
+        return 'acq.cap'
+
+    columns, header = load('acq.cap')  # {'t': array, 'v': array}, Header
+"""
+
+import json
+import os
+import struct
+
+import numpy as np
+
+
+MAGIC = b'CPCAP01\n'
+BLOCK = b'BLK1'
+INDEX = b'IDX1'
+END = b'CPCAPEND'
+
+_U32 = struct.Struct('<I')
+_TAG = struct.Struct('<4sI')        # Block and index headers
+_ENTRY = np.dtype([('offset', '<u8'), ('nrows', '<u8')])
+_TRAILER = struct.Struct('<QQ8s')
+BLOCK_HEADER = _TAG.size
+
+
+class CaptureError(ValueError):
+    """Raised for files that are not valid capture files."""
+    pass
+
+
+def _padded(n):
+    return (n + 7) & ~7
+
+
+def _little(dtype):
+    """`dtype` with little-endian byte order."""
+    return np.dtype(dtype).newbyteorder('<')
+
+
+class Header(object):
+    """
+    The header of a capture file: the column names and dtypes, any
+    metadata, and `size`, the offset of the first block.
+    """
+    def __init__(self, columns, dtypes, meta=None):
+        self.columns = list(columns)
+        self.dtypes = [_little(dtype) for dtype in dtypes]
+        if len(self.dtypes) != len(self.columns):
+            raise ValueError('There must be one dtype per column.')
+        self.meta = meta or {}
+        text = json.dumps({'columns': self.columns,
+                           'dtypes': [dtype.str for dtype in self.dtypes],
+                           'meta': self.meta}).encode('utf-8')
+        self.size = _padded(len(MAGIC) + _U32.size + len(text))
+        self._text = text
+
+    def tobytes(self):
+        data = MAGIC + _U32.pack(len(self._text)) + self._text
+        return data + b'\0'*(self.size - len(data))
+
+    def block_size(self, nrows):
+        """Size in bytes of a block of `nrows` rows."""
+        return _TAG.size + sum(_padded(nrows*dtype.itemsize)
+                               for dtype in self.dtypes)
+
+    def columns_at(self, buf, offset, nrows):
+        """Zero-copy arrays of the columns of the block of `nrows` rows whose
+        data starts at `offset` in `buf`."""
+        arrays = []
+        for dtype in self.dtypes:
+            arrays.append(np.frombuffer(buf, dtype, nrows, offset))
+            offset += _padded(nrows*dtype.itemsize)
+        return arrays
+
+    @classmethod
+    def parse(cls, buf):
+        """
+        Parse the header at the start of `buf` (a bytes-like object). Returns
+        None if it is not complete yet; raises `CaptureError` if `buf` is not
+        a capture file.
+        """
+        start = len(MAGIC) + _U32.size
+        if len(buf) < start:
+            return None
+        if bytes(buf[:len(MAGIC)]) != MAGIC:
+            raise CaptureError('Not a capture file')
+        n = _U32.unpack(bytes(buf[len(MAGIC):start]))[0]
+        if len(buf) < _padded(start + n):
+            return None
+        info = json.loads(bytes(buf[start:start + n]).decode('utf-8'))
+        return cls(info['columns'], info['dtypes'], info.get('meta'))
+
+
+def read_tag(buf, offset):
+    """The (tag, count) of the block or index at `offset` in `buf`, or None
+    if it is not complete yet."""
+    if len(buf) < offset + _TAG.size:
+        return None
+    return _TAG.unpack(bytes(buf[offset:offset + _TAG.size]))
+
+
+def read_index(buf):
+    """
+    The index of a closed capture file `buf`, as a structured array of
+    (offset, nrows) per block. Returns None if the file has no index, i.e.
+    if it is still being written (or its writer crashed).
+    """
+    if len(buf) < _TRAILER.size:
+        return None
+    offset, _, end = _TRAILER.unpack(bytes(buf[-_TRAILER.size:]))
+    if end != END or offset > len(buf) - _TRAILER.size:
+        return None
+    tag = read_tag(buf, offset)
+    if tag is None or tag[0] != INDEX:
+        return None
+    return np.frombuffer(buf, _ENTRY, tag[1], offset + _TAG.size)
+
+
+def scan(buf, header, offset=None):
+    """
+    Yield the (offset, nrows) of the complete blocks of `buf` from `offset`
+    (default: the first block) on, without using the index.
+    """
+    offset = header.size if offset is None else offset
+    while True:
+        tag = read_tag(buf, offset)
+        if tag is None or tag[0] != BLOCK:
+            return
+        size = header.block_size(tag[1])
+        if offset + size > len(buf):
+            return
+        yield offset, tag[1]
+        offset += size
+
+
+class CaptureWriter(object):
+    """
+    Writes a capture file of the columns `columns`, of the dtypes `dtypes`
+    (one for all columns, or one per column; default float).
+
+    Rows passed to `write` are buffered and written in blocks of at least
+    `blockrows` rows. `flush` writes the buffered rows immediately, e.g.
+    so that the GUI plots them. `close` (or leaving the `with` block) also
+    writes the index.
+
+    With `append=True`, an existing file with the same columns and dtypes
+    is appended to; otherwise the file is overwritten.
+    """
+    def __init__(self, filename, columns, dtypes=float, blockrows=65536,
+                 append=False, meta=None):
+        if not isinstance(dtypes, (list, tuple)):
+            dtypes = [dtypes]*len(columns)
+        self.filename = filename
+        self.header = Header(columns, dtypes, meta)
+        self.blockrows = blockrows
+        self.index = []       # (offset, nrows) of the blocks written
+        self.pending = []     # Lists of column arrays not written yet
+        self.npending = 0
+        self.nrows = 0
+        if append and os.path.exists(filename):
+            self.f = open(filename, 'r+b')
+            self._reopen()
+        else:
+            self.f = open(filename, 'wb')
+            self.f.write(self.header.tobytes())
+            self.offset = self.header.size
+
+    def _reopen(self):
+        """Truncate the index (or an incomplete last block) of the existing
+        file, so that new blocks follow the last complete one."""
+        data = self.f.read()
+        header = Header.parse(data)
+        if header is None:
+            raise CaptureError('Truncated capture file header')
+        if (header.columns != self.header.columns
+                or header.dtypes != self.header.dtypes):
+            raise CaptureError('Columns or dtypes differ from those of '
+                               '{0}'.format(self.filename))
+        self.header = header
+        index = read_index(data)
+        if index is not None:
+            self.index = [(int(e['offset']), int(e['nrows'])) for e in index]
+        else:
+            self.index = list(scan(data, header))
+        if self.index:
+            offset, nrows = self.index[-1]
+            self.offset = offset + header.block_size(nrows)
+        else:
+            self.offset = header.size
+        self.nrows = sum(nrows for _, nrows in self.index)
+        self.f.seek(self.offset)
+        self.f.truncate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, rows):
+        """
+        Write `rows`: a dict of equal-length column arrays by column name, or
+        an array-like of shape (nrows, ncolumns).
+        """
+        header = self.header
+        if isinstance(rows, dict):
+            arrays = [np.asarray(rows[col]) for col in header.columns]
+        else:
+            rows = np.asarray(rows)
+            if rows.ndim != 2 or rows.shape[1] != len(header.columns):
+                raise ValueError("rows must have shape "
+                                 "(nrows, {0})".format(len(header.columns)))
+            arrays = list(rows.T)
+        nrows = len(arrays[0]) if arrays else 0
+        if any(len(a) != nrows for a in arrays):
+            raise ValueError('All columns must have the same length.')
+        if not nrows:
+            return
+        self.pending.append([np.ascontiguousarray(a, dtype)
+                             for a, dtype in zip(arrays, header.dtypes)])
+        self.npending += nrows
+        if self.npending >= self.blockrows:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows as a block."""
+        if not self.npending:
+            return
+        if len(self.pending) == 1:
+            arrays = self.pending[0]
+        else:
+            arrays = [np.concatenate(column) for column in zip(*self.pending)]
+        nrows = self.npending
+        parts = [_TAG.pack(BLOCK, nrows)]
+        for a in arrays:
+            data = a.tobytes()
+            parts.append(data)
+            parts.append(b'\0'*(_padded(len(data)) - len(data)))
+        self.f.write(b''.join(parts))  # In one piece; see the module docs
+        self.f.flush()
+        self.index.append((self.offset, nrows))
+        self.offset += self.header.block_size(nrows)
+        self.nrows += nrows
+        self.pending = []
+        self.npending = 0
+
+    def close(self):
+        """Write the remaining rows and the index, and close the file."""
+        if self.f.closed:
+            return
+        self.flush()
+        index = np.array(self.index, dtype=_ENTRY)
+        self.f.write(_TAG.pack(INDEX, len(index)) + index.tobytes() +
+                     _TRAILER.pack(self.offset, self.nrows, END))
+        self.f.close()
+
+
+def load(filename):
+    """
+    Read all of the columns of the capture file `filename`, in their own
+    dtypes. Returns a dict of the arrays by column name, and the file's
+    `Header`.
+    """
+    with open(filename, 'rb') as f:
+        data = f.read()
+    header = Header.parse(data)
+    if header is None:
+        raise CaptureError('Truncated capture file header')
+    index = read_index(data)
+    if index is None:
+        blocks = list(scan(data, header))
+    else:
+        blocks = [(int(e['offset']), int(e['nrows'])) for e in index]
+    parts = [header.columns_at(data, offset + BLOCK_HEADER, nrows)
+             for offset, nrows in blocks]
+    columns = {}
+    for i, (name, dtype) in enumerate(zip(header.columns, header.dtypes)):
+        columns[name] = (np.concatenate([p[i] for p in parts]) if parts
+                         else np.empty(0, dtype))
+    return columns, header
@@ -23,6 +23,8 @@ The decorators provided are:
                 data should be read. Must be of a the
                 `pyoscope.readers.ReaderInterface` type (may be duck-typed
                 rather than subclassed).
+`stream`     -- Decorates a method of the interface class. Specifies that the
+                method yields blocks of data that are streamed to the plot.
 
 Refer to the README or the individual decorators' docstrings for details
 about how to use each decorator.
@@ -33,48 +35,195 @@ See `example.py` for an example usage.
 """
 
 import inspect
-import types
+import sys
+from collections import namedtuple
 from functools import wraps
+try:
+    import copy_reg as copyreg
+except ImportError:
+    import copyreg
 
-import readers
+import aio
+from cache import ATTRIBUTE as _CACHES, cache_policy, cached, invalidating
+from dispatch import EXECUTORS
+from registry import registry_for
 
-from gui.app import CPApp
+try:
+    string_types = basestring
+except NameError:  # Python 3
+    string_types = str
 
+ArgSpec = namedtuple('ArgSpec', 'args varargs keywords defaults')
 
-def Controller(cls):
+
+def getargspec(f):
+    """
+    The names and default values of the arguments of the function `f`, as
+    returned by `inspect.getargspec` on Python 2. `inspect.getargspec` is
+    gone from Python 3.11, so `inspect.getfullargspec` is used where it
+    exists.
+    """
+    try:
+        spec = inspect.getfullargspec(f)
+    except AttributeError:  # Python 2
+        return ArgSpec(*inspect.getargspec(f))
+    return ArgSpec(spec.args, spec.varargs, spec.varkw, spec.defaults)
+
+
+def Controller(cls=None, **options):
     """
     Specifies that this class will be a controller and starts the GUI when it is
     created.
 
     :Usage:
-        No arguments. Will construct, initialize, and start the GUI once the
-        decorated class is instantiated.
+        May be used with or without arguments. Will construct, initialize,
+        and start the GUI once the decorated class is instantiated.
+
+        Recognized keyword arguments:
+
+            workers -> (int) Number of worker threads that run commands.
+                       Defaults to 4.
+            processes -> (int) Number of worker processes that run commands
+                         declared with `@command(executor='process')`.
+                         Defaults to the number of CPUs.
+            max_fps -> (float) Maximum plot update rate while the plotted
+                       data is changing. Defaults to 30.
+            headless -> (bool) If True, no GUI is created. Instantiating
+                        the class returns a `headless.Session` instead.
+                        Defaults to the value of the `CP_HEADLESS`
+                        environment variable (False if it is not set).
+            isolated -> (bool) If True, the instance is made and its
+                        commands are run in a worker process, separate from
+                        the GUI's, and streamed data reaches the plot through
+                        shared memory. See `worker`. Defaults to False.
+
+        `cls.registry` is the `registry.Registry` of the class's commands,
+        built once when the class is decorated.
+
+        `cls.headless(*args, **kwargs)` always returns a headless session.
+        See `headless` for its Python API and command line interface.
 
     :Example:
         @Controller
         class MyControllerClass(object):
             ...
 
+        @Controller(workers=8)
+        class MyOtherControllerClass(object):
+            ...
+
         >>> mcc = MyControllerClass()
+
+        >>> session = MyControllerClass.headless()
+        >>> session.call('command', arg1='2.5')
     """
+    if cls is None:
+        return lambda cls: Controller(cls, **options)
+    headless = options.pop('headless', None)
+    isolated = options.pop('isolated', False)
+
+    # Instances must be picklable by reference to `cls` to be sent to a
+    # process pool, but the module attribute `cls.__name__` is about to be
+    # replaced by `_controller`.
+    try:
+        copyreg.pickle(cls, _reduce_controller)
+    except TypeError:  # Old-style classes can't be registered
+        pass
+
+    # Collect the command metadata once, for every front end
+    registry = registry_for(cls)
+
     @wraps(cls)
     def _controller(*args, **kwargs):
-        ctrl = cls(*args, **kwargs)
+        from headless import Session, headless_requested
+        if headless_requested(headless):
+            return Session(cls(*args, **kwargs))
+        if isolated:
+            from worker import WorkerProxy
+            ctrl = WorkerProxy(cls, args, kwargs,
+                               workers=options.get('workers', 4))
+        else:
+            ctrl = cls(*args, **kwargs)
+        from gui.app import CPApp  # Only import wx when a GUI is wanted
         global app
-        app = CPApp(ctrl)
+        app = CPApp(ctrl, **options)
         app.MainLoop()
+
+    def _headless(*args, **kwargs):
+        from headless import Session
+        return Session(cls(*args, **kwargs))
+    _controller.cls = cls
+    _controller.registry = registry
+    _controller.headless = _headless
     return _controller
 
 
-def command(f):
+def _reduce_controller(ctrl):
+    from resources import Pool
+    cls = type(ctrl)
+    # Connection pools and caches are not sent along; the copy makes its
+    # own.
+    state = dict((key, value) for key, value in ctrl.__dict__.items()
+                 if not (isinstance(value, Pool) or key == _CACHES))
+    return (_rebuild_controller, (cls.__module__, cls.__name__, state))
+
+
+def _rebuild_controller(modname, clsname, state):
+    __import__(modname)
+    cls = getattr(sys.modules[modname], clsname)
+    cls = getattr(cls, 'cls', cls)  # Unwrap `Controller`
+    ctrl = cls.__new__(cls)
+    ctrl.__dict__.update(state)
+    return ctrl
+
+
+def command(f=None, **options):
     """
     Specifies that the method is to be used as a command.
 
     Usage:
-        No arguments. Adds some metadata to the method to indicate to the
-        `Controller` decorator that this method should generate a GUI
-        command. The method's docstring is used as the tooltip for the GUI
-        command.
+        May be used with or without arguments. Adds some metadata to the
+        method to indicate to the `Controller` decorator that this method
+        should generate a GUI command. The method's docstring is used as the
+        tooltip for the GUI command.
+
+        Recognized keyword arguments:
+
+            executor -> 'thread' (default) runs the command on the
+                        controller's worker thread pool. 'process' runs it on
+                        a worker process pool, which is useful for CPU-bound
+                        commands. The controller must be picklable, and
+                        changes to its state made by the command are not seen
+                        by the GUI. 'async' runs it on an asyncio event
+                        loop thread (Python 3 only; see `aio`), and is the
+                        default (and only choice) for coroutine functions
+                        (`async def`).
+            ready -> Specifies when the file named by the command's return
+                     value is completely written and may be plotted. None
+                     (default) waits until the file has not been modified
+                     for a few ms. True indicates that the file is complete
+                     as soon as the command returns. A function is called
+                     as `ready(self, filename)` until it returns True, or
+                     until `ready_timeout` seconds have passed. Files that
+                     never become ready are not plotted.
+            ready_timeout -> (float) Seconds to call the `ready` function
+                             for. Default None, i.e. without limit.
+            group -> (str) Name of the section of the GUI's command list that
+                     the command is shown in. Commands without a group are
+                     shown in the 'Other' section, or without sections if
+                     no command has a group.
+            concurrency -> (int) Number of calls of the command kept in flight
+                           at once when it is swept (see `sweep`). Default
+                           1, i.e. one call at a time. Only raise it if the
+                           command, and its instrument, may be called
+                           concurrently.
+            cache -> Cache the return values of the command, by its
+                     (conditioned) arguments. True caches up to 128 values
+                     until they are invalidated; a dict sets the `size` and
+                     `ttl` (in seconds) of the cache. See `cache`. Not for
+                     coroutine or process commands.
+            invalidates -> (list of str) Names of the commands whose caches
+                           are invalidated whenever this command returns.
 
     :Example:
         @Controller
@@ -82,27 +231,134 @@ def command(f):
             @command
             def command(self, arg1=1., arg2='a'):
                 ...
+
+            @command(executor='process')
+            def crunch(self, n=1000000):
+                ...
+
+            @command(ready=lambda self, fname: self.acquisition_done)
+            def acquire(self, npoints=1000):
+                ...
+
+            @command(cache={'ttl': 60.})
+            def idn(self):
+                ...
     """
+    if f is None:
+        return lambda f: command(f, **options)
+    options = dict(options)
+    coroutine = aio.iscoroutinefunction(f)
+    executor = options.setdefault('executor',
+                                  'async' if coroutine else 'thread')
+    if executor not in EXECUTORS:
+        raise ValueError("executor must be one of {0}".format(EXECUTORS))
+    if (executor == 'async') != coroutine:
+        raise ValueError("executor='async' is for, and required by, "
+                         "coroutine functions ('async def')")
+    streams = ('_stream' in getattr(f, 'argdict', {})
+               or inspect.isgeneratorfunction(f))
+    if streams and executor != 'thread':
+        raise ValueError("Streaming commands must be run on threads")
+    policy = cache_policy(options.get('cache'))
+    invalidates = options.get('invalidates') or ()
+    if isinstance(invalidates, string_types):
+        invalidates = options['invalidates'] = [invalidates]
+    if (policy is not None or invalidates) and executor != 'thread':
+        raise ValueError("cache and invalidates are only supported for "
+                         "commands run on threads; use "
+                         "cache.invalidate(self, ...) instead")
     f.command = True
+    f.cmdopts = options
     # Check if the argspec has been cached and cache if not yet done
     try:
         f.argspec
     except AttributeError:
-        f.argspec = inspect.getargspec(f)
+        f.argspec = getargspec(f)
+    body = f
+    if policy is not None:
+        body = cached(body, f.__name__, policy)
+    if invalidates:
+        body = invalidating(body, invalidates)
     @wraps(f)
     def _command(self, *args, **kwargs):
-        return f(self, *args, **kwargs)
+        return body(self, *args, **kwargs)
+    _command.conditioner = _compile_conditioner(_command)
     return _command
 
 
+class ArgumentError(ValueError):
+    """
+    Raised when one or more arguments of a command can't be conditioned.
+    `errors` maps the names of the offending arguments to the exceptions
+    raised by their conditioning functions.
+    """
+    def __init__(self, errors):
+        self.errors = errors
+        msg = '; '.join('{0}: {1}'.format(name, errors[name])
+                        for name in sorted(errors))
+        ValueError.__init__(self, msg)
+
+
+def _compile_conditioner(f):
+    """
+    Make the function that conditions the raw (string) arguments of the
+    command `f` according to its `argument` decorators.
+
+    The returned function takes a dict of raw values by argument name and
+    returns the dict of conditioned keyword arguments. Arguments without a
+    conditioning function are passed through unchanged. If any arguments
+    fail to be conditioned, an `ArgumentError` listing all of them is raised.
+    """
+    converters = dict((name, arg['afunc'])
+                      for name, arg in getattr(f, 'argdict', {}).items()
+                      if 'afunc' in arg)
+
+    def _conditioner(raw):
+        kwargs = {}
+        errors = {}
+        for name, value in raw.items():
+            afunc = converters.get(name)
+            if afunc is None:
+                kwargs[name] = value
+                continue
+            try:
+                kwargs[name] = afunc(value)
+            except Exception as e:
+                errors[name] = e
+        if errors:
+            raise ArgumentError(errors)
+        return kwargs
+    _conditioner.converters = converters
+    return _conditioner
+
+
+def _literal(name):
+    """
+    The function `literal.<name>`, but only import `literal` (and NumPy)
+    when it is first called.
+    """
+    def _parse(s):
+        import literal
+        return getattr(literal, name)(s)
+    _parse.__name__ = name
+    return _parse
+
+
+_parse_literal = _literal('parse_literal')
+
 argfuncdict = {'float': float,
                'string': str,
                'int': int,
                'hex': lambda x: int(x, 16),
                'bool': bool,
-               'list': list,
-               'dict': dict,
-               'eval': eval}
+               'list': lambda x: list(_parse_literal(x)),
+               'dict': lambda x: dict(_parse_literal(x)),
+               'literal': _parse_literal,
+               'eval': _parse_literal,  # Never evaluate GUI input
+               'float_array': _literal('float_array'),
+               'int_array': _literal('int_array'),
+               'hex_array': _literal('hex_array'),
+               'list_of_float': _literal('list_of_float')}
 
 
 def argument(argname, argtype, **kwargs):
@@ -120,9 +376,18 @@ def argument(argname, argtype, **kwargs):
             'int' -> int(arg)
             'hex' -> int(arg, 16)
             'bool' -> bool(arg)
-            'list' -> list(arg)
-            'dict' -> dict(arg)
-            'eval' -> eval(arg)
+            'literal' -> Python literal, e.g. '[1, 2]' or "{'a': 1}"
+            'list' -> list(literal)
+            'dict' -> dict(literal)
+            'eval' -> Same as 'literal'. The input is never evaluated.
+            'float_array' -> '1.5, 2, 3e3' -> float64 numpy array
+            'int_array' -> '1, 2, 3' -> int64 numpy array
+            'hex_array' -> '0x1F, 0x20' or '1F 20' -> int64 numpy array
+            'list_of_float' -> '1.5, 2, 3e3' -> list of floats
+
+        The array types accept numbers separated by commas, semicolons or
+        whitespace, optionally enclosed in brackets, and parse them in a
+        single vectorized step. See `literal`.
 
         or a function object. If it is a function object, this object will be
         used as the conditioning function.
@@ -131,6 +396,12 @@ def argument(argname, argtype, **kwargs):
         decorator simply do not condition the argument values before being
         passed into the function.
 
+        The conditioning of all of a command's arguments is compiled into a
+        single function, `method.conditioner`, when the command is decorated.
+        It takes a dict of raw values and returns the dict of conditioned
+        keyword arguments, raising an `ArgumentError` that lists every
+        argument that failed to be conditioned.
+
         Additional keyword arguments may be included. These will simply be
         added to the method's metadata dictionary. The base cp does not
         utilize them.
@@ -149,8 +420,8 @@ def argument(argname, argtype, **kwargs):
         try:
             f.argspec
         except AttributeError:
-            f.argspec = inspect.getargspec(f)
-        if isinstance(argtype, types.StringTypes):
+            f.argspec = getargspec(f)
+        if isinstance(argtype, string_types):
             afunc = argfuncdict.get(argtype, str)
         elif callable(argtype):
             afunc = argtype
@@ -163,6 +434,8 @@ def argument(argname, argtype, **kwargs):
         @wraps(f)
         def _argument(self, *args, **kwargs):
             return f(self, *args, **kwargs)
+        if getattr(f, 'command', False):  # Applied outside of `command`
+            _argument.conditioner = _compile_conditioner(_argument)
         return _argument
     return _decorator
 
@@ -184,7 +457,19 @@ def reader(readername, *args, **kwargs):
         implement to qualify.
 
         Subsequent positional and keyword arguments are passed into the reader
-        when the reader is instantiated.
+        when the reader is instantiated, except for the `mode` keyword.
+
+        `mode` may be 'full' (default) or 'tail'. In 'tail' mode, a reader
+        that only parses the lines appended to the file since the last plot
+        update is used instead (see `cpreaders.TailReader`). Each command
+        call that returns the file that is already being plotted then simply
+        extends the plot. 'tail' mode is available for the 'DefaultReader'
+        and 'HexReader' readers, and for the readers derived from
+        `cpreaders.IncrementalReader`, which always read incrementally.
+
+        Reader names are looked up when the command's output is first
+        plotted (see `reader_class`), so an unknown name raises ValueError
+        then rather than when the class is defined.
 
     :Example:
         @Controller
@@ -196,19 +481,26 @@ def reader(readername, *args, **kwargs):
             def command1(self, arg1='A', arg2='12FF'):
                 with open('testfile.txt', 'a') as f:
                     f.write(' '.join([arg1, arg2]) + '\n')
+
+            @command
+            @reader('HexReader', mode='tail')
+            def command2(self, arg1='A'):
+                ...
     """
+    mode = kwargs.pop('mode', 'full')
+    if mode not in ('full', 'tail'):
+        raise ValueError("mode must be 'full' or 'tail'")
+
     def _decorator(f):
         # Check if the argspec has been cached and cache if not yet done
         try:
             f.argspec
         except AttributeError:
-            f.argspec = inspect.getargspec(f)
-        if isinstance(readername, types.StringTypes):
-            readerdict = dict(inspect.getmembers(readers, inspect.isclass))
-            readerfunc = readerdict[readername]
-        else:
-            readerfunc = readername
-        arg = {'reader': readerfunc, 'args': args, 'kwargs': kwargs}
+            f.argspec = getargspec(f)
+        # The reader class is looked up when it is first used, so that the
+        # reader modules are only imported by the GUI. See `reader_class`.
+        arg = {'reader': None, 'name': readername, 'mode': mode,
+               'args': args, 'kwargs': kwargs}
         try:
             f.argdict['_reader'] = arg
         except AttributeError:
@@ -218,3 +510,103 @@ def reader(readername, *args, **kwargs):
             return f(self, *args2, **kwargs2)
         return _reader
     return _decorator
+
+
+def stream(columns=None, maxblocks=16, capacity=None):
+    """
+    Specifies that the command streams its data to the plot rather than
+    writing a file. See `stream` (the module) for details.
+
+    :Usage:
+        The decorated method returns an iterable of data blocks, typically
+        by being a generator function. Generator functions stream their
+        data even without this decorator; use it to name the `columns`, or
+        to stream from other iterables.
+
+        `columns` are the names of the columns, which are otherwise taken
+        from the first block. At most `maxblocks` blocks are queued for the
+        plot; once the queue is full, the command waits for the plot to
+        take them.
+
+        If the controller runs in a worker process (see `worker`), the
+        blocks are instead written to a shared memory ring buffer of
+        `capacity` rows (default 2**20), and the command never waits.
+
+    :Example:
+        @Controller
+        class MyController(object):
+            @command
+            @stream(columns=['t', 'v'], maxblocks=8)
+            def acquire(self, nblocks=1000):
+                for i in range(nblocks):
+                    yield self.daq.read_block()
+    """
+    if maxblocks < 1:
+        raise ValueError('maxblocks must be at least 1')
+
+    def _decorator(f):
+        # Check if the argspec has been cached and cache if not yet done
+        try:
+            f.argspec
+        except AttributeError:
+            f.argspec = getargspec(f)
+        arg = {'columns': columns, 'maxblocks': maxblocks,
+               'capacity': capacity}
+        try:
+            f.argdict['_stream'] = arg
+        except AttributeError:
+            f.argdict = {'_stream': arg}
+        @wraps(f)
+        def _stream(self, *args2, **kwargs2):
+            return f(self, *args2, **kwargs2)
+        return _stream
+    return _decorator
+
+
+def reader_class(readerinfo):
+    """
+    The reader class specified by the `reader` decorator metadata
+    `readerinfo` (i.e. `method.argdict['_reader']`). It is looked up the
+    first time this is called and cached in `readerinfo['reader']`.
+
+    Raises ValueError if there is no such reader.
+    """
+    readerclass = readerinfo['reader']
+    if readerclass is None:
+        readerclass = _find_reader(readerinfo['name'], readerinfo['mode'])
+        readerinfo['reader'] = readerclass
+    return readerclass
+
+
+def _find_reader(readername, mode):
+    if mode == 'tail':
+        return _tail_reader(readername)
+    if not isinstance(readername, string_types):
+        return readername
+    import readers
+    import cpreaders
+    readerdict = dict(inspect.getmembers(readers, inspect.isclass))
+    readerdict.update(inspect.getmembers(cpreaders, inspect.isclass))
+    try:
+        return readerdict[readername]
+    except KeyError:
+        raise ValueError("No reader named {0!r}".format(readername))
+
+
+def _tail_reader(readername):
+    """Find the tail mode reader corresponding to `readername`."""
+    import cpreaders
+    if isinstance(readername, string_types):
+        try:
+            return cpreaders.TAIL_READERS[readername]
+        except KeyError:
+            pass
+    elif (inspect.isclass(readername)
+          and issubclass(readername, cpreaders.IncrementalReader)):
+        return readername
+    raise ValueError("No tail mode reader for {0!r}".format(readername))
+
+
+if __name__ == '__main__':
+    from headless import main
+    sys.exit(main())
@@ -0,0 +1,610 @@
+"""
+cpreaders.py
+jlazear
+
+Readers provided by cp, in addition to the built-in `pyoscope` readers. See
+`pyoscope.readers.ReaderInterface` for the interface they implement.
+
+`TailReader` -- Reads only the bytes appended to the file since the last
+                update. Update cost depends on the amount of new data, not on
+                the length of the file.
+`HexTailReader` -- `TailReader` for ASCII-Hex encoded files, producing the
+                   same columns as `HexReader`.
+`MMapHexReader` -- Memory-maps ASCII-Hex encoded files and decodes them in
+                   large blocks with NumPy. Produces the same columns as
+                   `HexReader`.
+`MMapDecReader` -- Memory-maps comma- or whitespace-separated decimal files
+                   and decodes them in large blocks with NumPy. Produces the
+                   same columns as `DefaultReader`.
+`CaptureReader` -- Memory-maps binary capture files (see `capture`) and
+                   copies the blocks appended since the last update out of
+                   the map, without parsing.
+
+The data returned by these readers is a `ColumnBuffer`, or a
+`ringbuffer.RingBuffer` if the reader's window is set with `set_window`.
+Both support the parts of the `pandas.DataFrame` interface used by pyoscope
+and cp (`columns`, `data[column]` and `len(data)`). Use `to_frame` to get a
+real DataFrame.
+"""
+
+import mmap
+import os
+
+import numpy as np
+
+import capture
+from digits import DIGITS, decode_fixed, decode_runs
+from ringbuffer import RingBuffer
+
+
+class ColumnBuffer(object):
+    """
+    Growable in-memory columnar data store.
+
+    Each column is stored contiguously, so `buf[column]` is a zero-copy view
+    of the column's data. Appending is amortized O(number of new rows).
+    """
+    def __init__(self, columns, capacity=1024, dtype=float):
+        self.columns = list(columns)
+        self._index = dict((col, i) for i, col in enumerate(self.columns))
+        self._data = np.empty((len(self.columns), max(capacity, 1)), dtype)
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, column):
+        return self._data[self._index[column], :self.length]
+
+    def append(self, block):
+        """
+        Append `block` (an array-like of shape (nrows, ncolumns)) to the end
+        of the buffer.
+        """
+        block = np.asarray(block, dtype=self._data.dtype)
+        if block.ndim != 2 or block.shape[1] != len(self.columns):
+            raise ValueError("block must have shape "
+                             "(nrows, {0})".format(len(self.columns)))
+        needed = self.length + block.shape[0]
+        if needed > self._data.shape[1]:
+            self.reserve(max(needed, 2*self._data.shape[1]))
+        self._data[:, self.length:needed] = block.T
+        self.length = needed
+
+    def append_columns(self, arrays):
+        """
+        Append the rows given column by column by `arrays`, a sequence of
+        equal-length 1-D arrays, one per column. Avoids the transposition
+        done by `append`.
+        """
+        nrows = len(arrays[0])
+        needed = self.length + nrows
+        if needed > self._data.shape[1]:
+            self.reserve(max(needed, 2*self._data.shape[1]))
+        for i, a in enumerate(arrays):
+            self._data[i, self.length:needed] = a
+        self.length = needed
+
+    def reserve(self, capacity):
+        """Make room for at least `capacity` rows."""
+        if capacity <= self._data.shape[1]:
+            return
+        newdata = np.empty((len(self.columns), capacity), self._data.dtype)
+        newdata[:, :self.length] = self._data[:, :self.length]
+        self._data = newdata
+
+    def clear(self):
+        self.length = 0
+
+    def to_frame(self):
+        """Copy the contents into a `pandas.DataFrame`."""
+        import pandas as pd
+        return pd.DataFrame(dict((col, self[col]) for col in self.columns),
+                            columns=self.columns)
+
+
+class IncrementalReader(object):
+    """
+    Base class for readers that only read the data appended to their file
+    since the last update. If the file shrinks, it is assumed to have been
+    rewritten and is read again from the beginning.
+
+    Subclasses implement `_reset`, which forgets what has been read so far,
+    and `_read_new`, which reads the data appended since the last read into
+    `self.data`, making it with `_make_buffer` first if it is None.
+
+    By default all of the data is kept in memory. `set_window` bounds it to
+    the last rows (see `ringbuffer.RingBuffer`).
+
+    `columns_version` is incremented whenever the data is replaced by a new
+    buffer, i.e. whenever its columns may have changed, so that the GUI can
+    tell in O(1) whether they did.
+    """
+    dtype = float
+    max_rows = 1000000  # Capacity for windows given in seconds
+    window = (None, None)
+    columns_version = 0
+
+    def _open(self, f):
+        filename = f.name if hasattr(f, 'read') else f
+        try:
+            self.f.close()
+        except AttributeError:
+            pass
+        # Binary mode, so that file positions are byte offsets
+        self.f = open(filename, 'rb')
+        self.filename = filename
+        self.data = None
+
+    def follows(self, fname):
+        """True if this reader is reading the file `fname`."""
+        try:
+            return os.path.samefile(fname, self.filename)
+        except OSError:
+            return False
+
+    def close(self):
+        self.f.close()
+
+    def init_data(self, *args, **kwargs):
+        if self.f.closed:
+            raise ValueError('I/O operation on closed file.')
+        self.offset = 0
+        self.data = None
+        self._reset()
+        self._read_new()
+        if self.data is None:
+            self.data = self._make_buffer([])
+        self._trim()
+        return self.data
+
+    def update_data(self):
+        if os.fstat(self.f.fileno()).st_size < self.offset:
+            return self.init_data()
+        self._read_new()
+        self._trim()
+        return self.data
+
+    def switch_file(self, f, *args, **kwargs):
+        self._open(f)
+        return self.init_data(*args, **kwargs)
+
+    def set_window(self, samples=None, seconds=None, column=None):
+        """
+        Only keep the last `samples` rows in memory, or the rows whose value
+        in `column` is within `seconds` of that of the last row (but at most
+        `max_rows` rows). `column` must be non-decreasing, e.g. a timestamp.
+        With neither `samples` nor `seconds`, keep all of the rows.
+        """
+        if seconds and column is None:
+            raise ValueError('A window in seconds requires a column.')
+        self.window = (samples, (seconds, column) if seconds else None)
+        data = self.data
+        if data is not None:
+            self.data = self._make_buffer(data.columns, len(data))
+            if len(data):
+                self.data.append(np.column_stack([data[col]
+                                                  for col in data.columns]))
+            self._trim()
+
+    def _make_buffer(self, columns, capacity=1):
+        self.columns_version += 1
+        samples, seconds = self.window
+        if samples:
+            return RingBuffer(columns, samples, self.dtype)
+        elif seconds:
+            return RingBuffer(columns, self.max_rows, self.dtype)
+        return ColumnBuffer(columns, capacity, self.dtype)
+
+    def _trim(self):
+        """Discard the rows that are older than the window in seconds."""
+        seconds = self.window[1]
+        data = self.data
+        if seconds and len(data) and (seconds[1] in data.columns):
+            seconds, column = seconds
+            data.discard_before(column, data[column][-1] - seconds)
+
+    def _reset(self):
+        pass
+
+    def _read_new(self):
+        raise NotImplementedError
+
+
+class TailReader(IncrementalReader):
+    """
+    Reader for delimited ASCII files that are appended to, e.g. by a command
+    that writes one line each time it is called.
+
+    Remembers how far into the file it has read, so `update_data` only parses
+    the lines that were appended since the previous call. A trailing
+    incomplete line is kept until the rest of it has been written.
+
+    Columns are separated by `delimiter`, or by commas or whitespace if
+    `delimiter` is None (default). Lines starting with '#' are comments. As
+    for `HexReader`, comment lines of the form '# key: value' form the header,
+    and the 'columns' and 'navg' header keys specify the column names and
+    averaging factors if `header` is True.
+
+    Lines that do not have as many fields as the first data line are skipped.
+
+    See ReaderInterface for info on readers.
+    """
+    @staticmethod
+    def convert(field):
+        return float(field)
+
+    @staticmethod
+    def column_name(i):
+        """Name of the i-th column, if not given by the header."""
+        return i
+
+    def __init__(self, f, delimiter=None, header=True, *args, **kwargs):
+        self.delimiter = delimiter
+        self.use_header = header
+        self._open(f)
+
+    def _reset(self):
+        self.partial = b''
+        self.header = {}
+
+    def _read_new(self):
+        """Parse the complete lines appended since the last read."""
+        self.f.seek(self.offset)
+        chunk = self.f.read()
+        self.offset += len(chunk)
+        chunk = self.partial + chunk
+        end = chunk.rfind(b'\n') + 1
+        self.partial = chunk[end:]
+
+        rows = []
+        for line in chunk[:end].splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith(b'#'):
+                self._parse_header(line)
+                continue
+            fields = self._split(line)
+            if self.data is None or not len(self.data.columns):
+                self.data = self._make_buffer(self._make_columns(len(fields)))
+            if len(fields) != len(self.data.columns):
+                continue
+            try:
+                rows.append([self.convert(field) for field in fields])
+            except ValueError:
+                continue
+        if rows:
+            block = np.array(rows, dtype=float)/self._navg()
+            self.data.append(block)
+
+    def _split(self, line):
+        delimiter = self.delimiter
+        if delimiter is None:
+            delimiter = b',' if b',' in line else None
+        elif not isinstance(delimiter, bytes):
+            delimiter = delimiter.encode('ascii')
+        return [field.strip() for field in line.split(delimiter)]
+
+    def _parse_header(self, line):
+        if not (self.use_header and b':' in line):
+            return
+        key, value = line.split(b';')[0].lstrip(b'#').split(b':', 1)
+        self.header[key.strip().decode('ascii')] = value.strip()
+
+    def _make_columns(self, ncols):
+        if 'columns' in self.header:
+            columns = _split_header(self.header['columns'])
+            if len(columns) == ncols:
+                return columns
+        return [self.column_name(i) for i in range(ncols)]
+
+    def _navg(self):
+        if 'navg' not in self.header:
+            return 1.
+        navg = [float(n) for n in _split_header(self.header['navg'])]
+        if len(navg) == 1:
+            return navg[0]
+        return np.array(navg)
+
+
+class HexTailReader(TailReader):
+    """
+    `TailReader` for ASCII-Hex encoded data files. Produces the same columns
+    as `pyoscope.readers.HexReader`.
+    """
+    @staticmethod
+    def convert(field):
+        return float(int(field, 16))
+
+    @staticmethod
+    def column_name(i):
+        return 'col' + str(i)
+
+
+_NEWLINE = ord('\n')
+_COMMENT = ord('#')
+_COMMA = ord(',')
+_SPACE = ord(' ')
+_FLOATCHARS = np.zeros(256, dtype=bool)
+_FLOATCHARS[[ord(c) for c in '+-.eE']] = True
+
+
+class MMapReader(IncrementalReader):
+    """
+    Reader for files of delimited unsigned integer fields, in base `base`.
+
+    The file is memory-mapped and decoded `blocksize` bytes at a time into
+    NumPy arrays, without splitting it into Python strings. Files with
+    fixed-width records, such as those written by `'{0:04X}'.format`, are
+    decoded with a few array operations per column. Other files are decoded
+    by locating the digit runs in each block. Decimal files containing signs,
+    decimal points or exponents are parsed with `numpy.fromstring`.
+    Comment lines, and lines that do not have as many fields as the first
+    data line, are skipped, as by `TailReader`.
+
+    Only the bytes appended to the file since the last read are decoded by
+    `update_data`. The decoded data is stored in a `ColumnBuffer` of `dtype`
+    (default float), which is sized from the file size to avoid reallocation,
+    or in a `RingBuffer` if a window is set.
+
+    Consecutive lines starting with '#' at the beginning of the file form the
+    header. As for `HexReader`, the 'columns' and 'navg' header keys specify
+    the column names and averaging factors if `header` is True.
+
+    See ReaderInterface for info on readers.
+    """
+    base = 10
+    blocksize = 1 << 22
+
+    @staticmethod
+    def column_name(i):
+        """Name of the i-th column, if not given by the header."""
+        return i
+
+    def __init__(self, f, header=True, dtype=float, *args, **kwargs):
+        self.use_header = header
+        self.dtype = dtype
+        self._open(f)
+
+    def _reset(self):
+        self.header = None
+
+    def _read_new(self):
+        size = os.fstat(self.f.fileno()).st_size
+        if size <= self.offset:
+            return
+        # The map is released along with the last array that refers to it
+        mm = mmap.mmap(self.f.fileno(), size, access=mmap.ACCESS_READ)
+        self._read_mapped(np.frombuffer(mm, dtype=np.uint8))
+
+    def _read_mapped(self, buf):
+        if self.header is None:
+            if not self._read_header(buf):
+                return
+        # Only decode complete lines
+        newlines = np.flatnonzero(buf[self.offset:] == _NEWLINE)
+        if not len(newlines):
+            return
+        end = self.offset + newlines[-1] + 1
+        while self.offset < end:
+            stop = min(self.offset + self.blocksize, end)
+            if stop < end:
+                # Cut the block after its last newline
+                stop = self.offset + np.flatnonzero(
+                    buf[self.offset:stop] == _NEWLINE)[-1] + 1
+            block = self._decode(buf[self.offset:stop])
+            if len(block):
+                # Size the buffer for the rest of the file up front
+                remaining = (len(buf) - self.offset)//self.reclen + 1
+                self.data.reserve(self.data.length + max(remaining,
+                                                         len(block)))
+                self.data.append(block/self.navg)
+            self.offset = stop
+
+    def _read_header(self, buf):
+        """
+        Parse the header lines and the first data line. Returns False if the
+        first data line is not complete yet.
+        """
+        header = {}
+        start = 0
+        while True:
+            nl = np.flatnonzero(buf[start:] == _NEWLINE)
+            if not len(nl):
+                return False
+            end = start + nl[0] + 1
+            line = buf[start:end].tobytes()
+            if not line.startswith(b'#'):
+                break
+            if self.use_header and b':' in line:
+                key, value = line.split(b';')[0].lstrip(b'#').split(b':', 1)
+                header[key.strip().decode('ascii')] = value.strip()
+            start = end
+
+        ncols = len(line.replace(b',', b' ').split())
+        self.header = header
+        self.offset = start
+        self.reclen = end - start
+        self.ncols = ncols
+        columns = [self.column_name(i) for i in range(ncols)]
+        self.navg = 1.
+        if 'columns' in header:
+            names = _split_header(header['columns'])
+            if len(names) == ncols:
+                columns = names
+        if 'navg' in header:
+            navg = [float(n) for n in _split_header(header['navg'])]
+            self.navg = navg[0] if len(navg) == 1 else np.array(navg)
+        self.data = self._make_buffer(columns)
+        return True
+
+    def _decode(self, arr):
+        """
+        Decode the complete lines in the uint8 array `arr` into an array of
+        shape (nrows, ncols).
+        """
+        ncols = self.ncols
+        if (arr == _COMMENT).any():
+            return self._decode_lines(arr)
+        if self.base == 10 and _FLOATCHARS[arr].any():
+            text = arr.tobytes().replace(b',', b' ')
+            try:
+                values = np.fromstring(text, sep=' ')
+            except ValueError:  # Unparseable field, with NumPy >= 2
+                return self._decode_lines(arr)
+        else:
+            digits = DIGITS[self.base][arr]
+            values = decode_fixed(arr, digits, self.base, ncols)
+            if values is not None:
+                return values
+            values = decode_runs(digits, self.base)
+        # Ragged or malformed lines are skipped one by one
+        if not _regular(arr, ncols, len(values)):
+            return self._decode_lines(arr)
+        return values.reshape(-1, ncols)
+
+    def _decode_lines(self, arr):
+        """Slow path for blocks with comments or malformed lines, which
+        are skipped."""
+        floats = self.base == 10 and _FLOATCHARS[arr].any()
+        rows = []
+        for line in arr.tobytes().splitlines():
+            if line.startswith(b'#'):
+                continue
+            if floats:
+                try:
+                    values = [float(v) for v in
+                              line.replace(b',', b' ').split()]
+                except ValueError:
+                    continue
+            else:
+                digits = DIGITS[self.base][np.frombuffer(line,
+                                                         dtype=np.uint8)]
+                values = decode_runs(digits, self.base)
+            if len(values) == self.ncols:
+                rows.append(values)
+        return np.array(rows, dtype=float if floats else np.int64).reshape(
+            -1, self.ncols)
+
+
+class MMapHexReader(MMapReader):
+    """
+    `MMapReader` for ASCII-Hex encoded data files. Produces the same columns
+    as `pyoscope.readers.HexReader`.
+    """
+    base = 16
+
+    @staticmethod
+    def column_name(i):
+        return 'col' + str(i)
+
+
+class MMapDecReader(MMapReader):
+    """
+    `MMapReader` for comma- or whitespace-separated decimal data files.
+    Produces the same columns as `pyoscope.readers.DefaultReader`.
+    """
+    base = 10
+
+
+class CaptureReader(IncrementalReader):
+    """
+    Reader for binary capture files, as written by `capture.CaptureWriter`.
+
+    The file is memory-mapped, and the columns of each new block are copied
+    from the map into the reader's buffer (of `dtype`, default float), so
+    updates cost a memory copy of the appended rows. Blocks are only read
+    once they have been completely written, so the file may be plotted
+    while it is being written.
+
+    If the file is complete (i.e. has an index) and a window in samples is
+    set, only the blocks holding the last rows are read.
+
+    The header's metadata is available as `meta`. See ReaderInterface for
+    info on readers.
+    """
+    def __init__(self, f, dtype=float, *args, **kwargs):
+        self.dtype = dtype
+        self._open(f)
+
+    def _reset(self):
+        self.header = None
+        self.meta = {}
+
+    def _read_new(self):
+        size = os.fstat(self.f.fileno()).st_size
+        if size <= self.offset:
+            return
+        mm = mmap.mmap(self.f.fileno(), size, access=mmap.ACCESS_READ)
+        header = self.header
+        if header is None:
+            header = capture.Header.parse(mm)
+            if header is None:
+                return
+            self.header = header
+            self.meta = header.meta
+            self.offset = header.size
+            self.data = self._make_buffer(header.columns)
+            self._skip_to_window(mm)
+        blocks = list(capture.scan(mm, header, self.offset))
+        if not blocks:
+            return
+        offset, nrows = blocks[-1]
+        self.offset = offset + header.block_size(nrows)
+        self.data.reserve(self.data.length + sum(n for _, n in blocks))
+        for offset, nrows in blocks:
+            self.data.append_columns(header.columns_at(
+                mm, offset + capture.BLOCK_HEADER, nrows))
+
+    def _skip_to_window(self, mm):
+        """Skip the blocks before the last `samples` rows, using the index
+        of a complete file."""
+        samples = self.window[0]
+        if not samples:
+            return
+        index = capture.read_index(mm)
+        if index is None or not len(index):
+            return
+        rows = np.cumsum(index['nrows'][::-1])
+        first = len(index) - 1 - min(np.searchsorted(rows, samples),
+                                     len(index) - 1)
+        self.offset = int(index['offset'][first])
+
+
+def _split_header(value):
+    """"[a, b]" or "a, b" or "[a b]" or "a b" all go to -> [a, b]"""
+    value = value.strip(b'[]')
+    splitchar = b',' if b',' in value else None
+    return [v.strip().decode('ascii') for v in value.split(splitchar)]
+
+
+def _regular(arr, ncols, nvalues):
+    """
+    True if each of the complete lines in the uint8 array `arr` has `ncols`
+    fields, and `nvalues` values were decoded from them, i.e. one per field.
+    """
+    newlines = np.flatnonzero(arr == _NEWLINE)
+    if nvalues != len(newlines)*ncols:
+        return False
+    if not len(newlines):
+        return True
+    # Fields are runs of bytes other than commas, whitespace and controls
+    field = (arr > _SPACE) & (arr != _COMMA)
+    starts = np.empty_like(field)
+    starts[0] = field[0]
+    np.greater(field[1:], field[:-1], out=starts[1:])
+    first = np.concatenate(([0], newlines[:-1] + 1))
+    counts = np.add.reduceat(starts.view(np.uint8), first, dtype=np.uint32)
+    return (counts == ncols).all()
+
+
+# Tail-mode equivalents of the pyoscope readers, by name
+TAIL_READERS = {'DefaultReader': TailReader,
+                'HexReader': HexTailReader,
+                'TailReader': TailReader,
+                'HexTailReader': HexTailReader,
+                'MMapReader': MMapReader,
+                'MMapHexReader': MMapHexReader,
+                'MMapDecReader': MMapDecReader,
+                'CaptureReader': CaptureReader}
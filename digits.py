@@ -0,0 +1,103 @@
+"""
+digits.py
+jlazear
+
+Vectorized decoding of unsigned integers from text, in base 10 or 16.
+
+Text is handled as a uint8 NumPy array of its bytes. `DIGITS[base]` maps
+each byte to its digit value (-1 for non-digits), and the runs of digits are
+decoded into an int64 array a few array operations at a time, without
+splitting the text into Python strings. Used by `cpreaders.MMapReader` and
+by the array parsers of `literal`.
+
+Numbers that do not fit in an int64 raise ValueError rather than wrapping
+around.
+
+    arr = np.frombuffer(b'1F 20 ff', dtype=np.uint8)
+    decode_runs(DIGITS[16][arr], 16)  # -> array([ 31,  32, 255])
+"""
+
+import numpy as np
+
+
+INT64_MAX = np.iinfo(np.int64).max
+
+
+def digit_table(digits):
+    """Lookup table from byte value to digit value, -1 for non-digits."""
+    table = np.full(256, -1, dtype=np.int8)
+    for i, c in enumerate(digits):
+        table[ord(c)] = i
+        table[ord(c.upper())] = i
+    return table
+
+DIGITS = {10: digit_table('0123456789'),
+          16: digit_table('0123456789abcdef')}
+
+# Longest runs of digits that always fit in an int64, by base
+SAFE_WIDTH = {10: 18, 16: 15}
+
+
+def runs(mask):
+    """Start and stop indices of the runs of True in the boolean `mask`."""
+    edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def decode_fixed(arr, digits, base, ncols):
+    """
+    Decode the fixed-width records (lines) of `ncols` numbers of the text
+    `arr`, whose digit values are `digits`. Returns an int64 array of shape
+    (nrecords, ncols), or None if the records are not all laid out like the
+    first one, or if they have numbers too wide for this fast path.
+    """
+    reclen = np.flatnonzero(arr == ord('\n'))[0] + 1
+    if len(arr) % reclen:
+        return None
+    digits = digits.reshape(-1, reclen)
+    isdigit = digits[0] >= 0
+    starts, stops = runs(isdigit)
+    if len(starts) != ncols or (stops - starts > SAFE_WIDTH[base]).any():
+        return None
+    # Every record must have its digits and separators in the same places
+    if (digits[:, isdigit] < 0).any() or (digits[:, ~isdigit] >= 0).any():
+        return None
+    if (arr.reshape(-1, reclen)[:, -1] != ord('\n')).any():
+        return None
+    values = np.empty((len(digits), ncols), dtype=np.int64)
+    for i, (start, stop) in enumerate(zip(starts, stops)):
+        weights = base**np.arange(stop - start - 1, -1, -1, dtype=np.int64)
+        values[:, i] = np.dot(digits[:, start:stop].astype(np.int64), weights)
+    return values
+
+
+def decode_runs(digits, base):
+    """
+    Decode every run of digits in `digits` (digit values, -1 otherwise) into
+    an int64 array. Raises ValueError if a number does not fit in an int64.
+    """
+    starts, stops = runs(digits >= 0)
+    widths = stops - starts
+    values = np.empty(len(starts), dtype=np.int64)
+    # Decode all of the runs of the same width at once
+    for width in np.unique(widths):
+        which = np.flatnonzero(widths == width)
+        if width > SAFE_WIDTH[base]:
+            for i in which:
+                values[i] = _decode_wide(digits[starts[i]:stops[i]], base)
+            continue
+        index = starts[which, np.newaxis] + np.arange(width)
+        weights = base**np.arange(width - 1, -1, -1, dtype=np.int64)
+        values[which] = np.dot(digits[index].astype(np.int64), weights)
+    return values
+
+
+def _decode_wide(digits, base):
+    """Decode one run of digits with Python integers, checking its range."""
+    value = 0
+    for d in digits.tolist():
+        value = value*base + d
+    if value > INT64_MAX:
+        raise ValueError('{0} does not fit in an int64'.format(
+            value if base == 10 else hex(value)))
+    return value
@@ -0,0 +1,264 @@
+"""
+dispatch.py
+jlazear
+
+Worker-pool dispatcher for cp commands.
+
+Command methods are executed on a pool of worker threads (or, for CPU-bound
+commands, worker processes, and for coroutine commands, an asyncio event loop
+thread; see `aio`) so that a slow instrument call never blocks the GUI's
+event loop. Every submission returns a `concurrent.futures.Future`.
+Completion callbacks and state-change notifications are marshalled through a
+user-supplied `callafter` function, e.g. `wx.CallAfter`, so that they run on
+the GUI thread.
+
+Example:
+
+    d = Dispatcher(ctrl, max_workers=4, callafter=wx.CallAfter)
+    future = d.submit('cmd1', {'arg1': 1}, callback=on_done)
+"""
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+EXECUTORS = ('thread', 'process', 'async')
+
+
+def _invoke(controller, name, kwargs):
+    """
+    Call the command `name` of `controller` with `kwargs`.
+
+    Module-level so that it may be pickled and sent to a process pool.
+    """
+    return getattr(controller, name)(**kwargs)
+
+
+def _copy_future(source, target):
+    """Set the result or exception of the `Future` `target` from the done
+    `Future` `source`."""
+    e = source.exception()
+    if e is not None:
+        target.set_exception(e)
+    else:
+        target.set_result(source.result())
+
+
+def _call_now(func, *args, **kwargs):
+    """Default `callafter`: call `func` immediately, in the calling thread."""
+    return func(*args, **kwargs)
+
+
+class CommandState(object):
+    """
+    Number of queued and running invocations of a single command.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.queued = 0
+        self.running = 0
+
+    @property
+    def busy(self):
+        return bool(self.queued or self.running)
+
+    def __str__(self):
+        if self.running and self.queued:
+            return 'running, {0} queued'.format(self.queued)
+        elif self.running:
+            return 'running'
+        elif self.queued:
+            return '{0} queued'.format(self.queued)
+        return 'idle'
+
+
+class Dispatcher(object):
+    """
+    Executes controller commands on a thread or process pool.
+
+    :Arguments:
+        controller - The controller instance whose commands are executed.
+        max_workers - (int) Size of the thread pool.
+        max_processes - (int) Size of the process pool. The process pool is
+            only created when a command with `executor='process'` is first
+            submitted. None (default) uses the number of CPUs.
+        callafter - (callable) Used to run completion callbacks and state
+            listeners, as `callafter(func, *args)`. Use `wx.CallAfter` to
+            have them run on the GUI thread. Defaults to calling immediately
+            in the worker thread.
+
+    Listeners added with `add_listener` are called as `listener(state)` with
+    the command's `CommandState` whenever it is queued, started, or finished.
+    """
+    def __init__(self, controller, max_workers=4, max_processes=None,
+                 callafter=None):
+        self.controller = controller
+        self.max_workers = max_workers
+        self.max_processes = max_processes
+        self.callafter = callafter if callafter is not None else _call_now
+
+        self._threads = ThreadPoolExecutor(max_workers)
+        self._processes = None
+
+        self.lock = threading.Lock()
+        self.states = {}
+        self.listeners = []
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def state(self, name):
+        """Return the `CommandState` of the command `name`."""
+        with self.lock:
+            try:
+                return self.states[name]
+            except KeyError:
+                state = self.states[name] = CommandState(name)
+                return state
+
+    def in_flight(self):
+        """Total number of queued or running invocations."""
+        with self.lock:
+            return sum(s.queued + s.running for s in self.states.values())
+
+    def submit(self, name, kwargs, callback=None, executor='thread',
+               finish=None):
+        """
+        Queue the command `name` to be called with the keyword arguments
+        `kwargs`. Returns a `Future` for the command's return value.
+
+        `callback`, if specified, is called (through `callafter`) as
+        `callback(name, future)` once the command has finished.
+
+        `executor` is 'thread' (default), 'process' or 'async'. Commands sent
+        to the process pool require the controller to be picklable, and any
+        changes they make to the controller's state are not seen by the GUI
+        process. 'async' commands must be coroutine functions. They are run
+        on the shared event loop of `aio.event_loop`, all at once rather
+        than queued.
+
+        `finish`, if specified, is called as `finish(retval)` in the worker
+        thread after the command returns and its result replaces the command's
+        return value. Use it for blocking post-processing that must not run
+        on the GUI thread, e.g. waiting for an output file.
+        """
+        if executor not in EXECUTORS:
+            raise ValueError("executor must be one of "
+                             "{0}".format(EXECUTORS))
+        state = self.state(name)
+        with self.lock:
+            state.queued += 1
+        self._notify(state)
+
+        if executor == 'process':
+            # Can't observe the start of a process pool job, so treat it as
+            # running as soon as it is submitted.
+            self._start(state)
+            future = self._process_pool().submit(_invoke, self.controller,
+                                                 name, kwargs)
+            if finish is not None:
+                future = self._chain(future, finish)
+        elif executor == 'async':
+            import aio
+            self._start(state)
+            try:
+                future = aio.event_loop().submit(
+                    _invoke(self.controller, name, kwargs))
+            except Exception as e:  # E.g. not a coroutine function
+                future = Future()
+                future.set_exception(e)
+            if finish is not None:
+                future = self._chain(future, finish)
+        else:
+            future = self._threads.submit(self._run, state, kwargs, finish)
+
+        def _done(f):
+            # A thread pool job that was cancelled never started
+            self._finish(state, executor != 'thread' or not f.cancelled())
+            if callback is not None:
+                self.callafter(callback, name, f)
+        future.add_done_callback(_done)
+        return future
+
+    def run(self, name, func, callback=None):
+        """
+        Run `func()` on the thread pool, as an invocation of the command
+        `name` as far as its `CommandState` is concerned, e.g. a sweep of
+        the command. Returns a `Future` for its return value. `callback` is
+        as for `submit`.
+        """
+        state = self.state(name)
+        with self.lock:
+            state.queued += 1
+        self._notify(state)
+
+        def _job():
+            self._start(state)
+            return func()
+        future = self._threads.submit(_job)
+
+        def _done(f):
+            self._finish(state, not f.cancelled())
+            if callback is not None:
+                self.callafter(callback, name, f)
+        future.add_done_callback(_done)
+        return future
+
+    def shutdown(self, wait=False):
+        self._threads.shutdown(wait=wait)
+        if self._processes is not None:
+            self._processes.shutdown(wait=wait)
+
+    def _run(self, state, kwargs, finish):
+        self._start(state)
+        retval = _invoke(self.controller, state.name, kwargs)
+        if finish is not None:
+            retval = finish(retval)
+        return retval
+
+    def _chain(self, future, finish):
+        """
+        Run `finish` on the result of a process pool or event loop `future`
+        in a worker thread, once it is done. Returns a `Future` for the
+        result of `finish`. No thread waits while `future` is running.
+        """
+        chained = Future()
+
+        def _done(f):
+            try:
+                retval = f.result()
+                self._threads.submit(finish, retval).add_done_callback(
+                    lambda g: _copy_future(g, chained))
+            except Exception as e:
+                chained.set_exception(e)
+        future.add_done_callback(_done)
+        return chained
+
+    def _process_pool(self):
+        with self.lock:
+            if self._processes is None:
+                # Imported here since multiprocessing is slow to import
+                from concurrent.futures import ProcessPoolExecutor
+                self._processes = ProcessPoolExecutor(self.max_processes)
+            return self._processes
+
+    def _start(self, state):
+        with self.lock:
+            state.queued -= 1
+            state.running += 1
+        self._notify(state)
+
+    def _finish(self, state, started=True):
+        """Count an invocation of `state`'s command as done. It is still
+        queued, rather than running, if it was cancelled before it
+        `started`."""
+        with self.lock:
+            if started:
+                state.running -= 1
+            else:
+                state.queued -= 1
+        self._notify(state)
+
+    def _notify(self, state):
+        for listener in self.listeners:
+            self.callafter(listener, state)
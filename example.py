@@ -3,13 +3,16 @@ An example file demonstrating the basic functionality of cp.
 """
 import os
 
+import numpy as np
+
+from capture import CaptureWriter
 from cp import Controller, command, argument, reader
 
 
 @Controller
 class Ctrl(object):
     def __init__(self):
-        fnames = ['cmd1.txt', 'cmd2.txt', 'cmd3.txt']
+        fnames = ['cmd1.txt', 'cmd2.txt', 'cmd3.txt', 'cmd4.cap']
         for fname in fnames:
             try:
                 os.remove(fname)
@@ -20,7 +23,7 @@ class Ctrl(object):
     @reader('HexReader')
     def cmd1(self, arg1=1, arg2='5'):
         """cmd1's docstring!"""
-        print "cmd1: {0} {1}".format(repr(arg1), repr(arg2))
+        print("cmd1: {0} {1}".format(repr(arg1), repr(arg2)))
         fname = 'cmd1.txt'
         self.dec_write(fname, [arg1, arg2], append=True)
         return fname
@@ -28,7 +31,8 @@ class Ctrl(object):
     @command
     @argument('arg1', 'int')
     def cmd2(self, arg1=10, arg2=512, third=314):
-        print "cmd2: {0} {1} {2}".format(repr(arg1), repr(arg2), repr(third))
+        print("cmd2: {0} {1} {2}".format(repr(arg1), repr(arg2),
+                                          repr(third)))
         fname = 'cmd2.txt'
         self.dec_write(fname, [arg1, arg2, third], append=True)
         return fname
@@ -41,11 +45,24 @@ class Ctrl(object):
 
         blah
         """
-        print "cmd3: {0} {1} {2}".format(repr(firstreq), repr(secondreq),
-                                         repr(third))
+        print("cmd3: {0} {1} {2}".format(repr(firstreq), repr(secondreq),
+                                          repr(third)))
         fname = 'cmd3.txt'
         return fname
 
+    @command
+    @reader('CaptureReader')
+    @argument('npoints', 'int')
+    def cmd4(self, npoints=100000):
+        """Append `npoints` samples of a sine wave to a binary capture
+        file."""
+        fname = 'cmd4.cap'
+        with CaptureWriter(fname, ['t', 'sin'], ['f8', 'f4'],
+                           append=True) as w:
+            t = (w.nrows + np.arange(npoints))/1000.
+            w.write({'t': t, 'sin': np.sin(2*np.pi*t)})
+        return fname
+
     def hex_write(self, fname, values, append=False):
         fmtstr = "{0:04X}"
         hexstrvals = [fmtstr.format(int(val)) for val in values]
@@ -0,0 +1,96 @@
+"""
+An example of cp coroutine commands (Python 3 only).
+
+A few simulated instruments are served on local TCP ports. Each answers every
+line it receives with its name, the line and a reading, after a short delay.
+The controller's coroutine commands talk to them over `asyncio` streams, so
+polling all of them takes about as long as polling one.
+
+Run it with the GUI,
+
+    python example_async.py
+
+or headless,
+
+    python -m cp example_async:Ctrl poll --count 5
+"""
+import asyncio
+import random
+import socketserver
+import threading
+import time
+
+from cp import Controller, command, argument
+
+
+class Device(socketserver.StreamRequestHandler):
+    """Simulated instrument. Answers each line after `delay` seconds."""
+    delay = 0.05
+
+    def handle(self):
+        for line in self.rfile:
+            time.sleep(self.delay)
+            reply = '{0} {1} {2:.4f}\n'.format(self.server.name,
+                                               line.decode().strip(),
+                                               random.random())
+            self.wfile.write(reply.encode())
+
+
+class DeviceServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    request_queue_size = 128  # Many connections may be opened at once
+
+
+def start_devices(n=4):
+    """Serve `n` simulated instruments on free local ports. Returns the
+    list of their ports."""
+    ports = []
+    for i in range(n):
+        server = DeviceServer(('127.0.0.1', 0), Device)
+        server.name = 'dev{0}'.format(i)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        ports.append(server.server_address[1])
+    return ports
+
+
+@Controller
+class Ctrl(object):
+    def __init__(self):
+        self.ports = start_devices()
+
+    @command
+    @argument('device', 'int')
+    async def query(self, device=0, msg='*IDN?'):
+        """Send `msg` to one device and return its answer."""
+        reader, writer = await asyncio.open_connection('127.0.0.1',
+                                                       self.ports[device])
+        try:
+            writer.write(msg.encode() + b'\n')
+            return (await reader.readline()).decode().strip()
+        finally:
+            writer.close()
+
+    @command
+    @argument('count', 'int')
+    async def poll(self, count=10):
+        """Read every device `count` times, all devices at once, and write
+        the readings to poll.txt."""
+        start = time.time()
+        rows = []
+        for i in range(count):
+            replies = await asyncio.gather(
+                *[self.query(device, 'READ?') for device in
+                  range(len(self.ports))])
+            rows.append([time.time() - start] +
+                        [float(reply.split()[-1]) for reply in replies])
+        fname = 'poll.txt'
+        with open(fname, 'w') as f:
+            for row in rows:
+                f.write(' '.join('{0:.4f}'.format(v) for v in row) + '\n')
+        return fname
+
+
+if __name__ == "__main__":
+    ctrl = Ctrl()
@@ -5,23 +5,35 @@ matplotlib.use('WXAgg')
 import wx
 
 from pyoscope import PyOscope
+from dispatch import Dispatcher
 from gui.mainframe import MainFrame
 from gui.graphframe import GraphFrame
 from gui.bindings import Binder
+from gui.scheduler import UpdateScheduler
 
 from wx.lib.mixins.inspection import InspectionMixin  #DELME
 
 
 class CPApp(wx.App, InspectionMixin):
-    def __init__(self, controller):
+    def __init__(self, controller, workers=4, processes=None, max_fps=30.):
         self.controller = controller
+        self.workers = workers
+        self.processes = processes
+        self.max_fps = max_fps
         wx.App.__init__(self)
 
     def OnInit(self):
         self.Init()  #DELME For InspectionMixin
 
+        # Make the command dispatcher. Results are marshalled back to the GUI
+        # thread with wx.CallAfter.
+        self.dispatcher = Dispatcher(self.controller,
+                                     max_workers=self.workers,
+                                     max_processes=self.processes,
+                                     callafter=wx.CallAfter)
+
         # Make the MainFrame
-        fMainFrame = MainFrame(self.controller)
+        fMainFrame = MainFrame(self.controller, self.dispatcher)
         fMainFrame.Show()
         self.SetTopWindow(fMainFrame)
         self.fMainFrame = fMainFrame
@@ -34,8 +46,12 @@ class CPApp(wx.App, InspectionMixin):
         # Make the PyOscope instance
         self.pyo = PyOscope(interactive=False)
 
+        # Make the plot update scheduler
+        self.scheduler = UpdateScheduler(max_fps=self.max_fps)
+
         # Make the Binder
-        self.binder = Binder(self.fMainFrame, self.fGraphFrame, self.pyo)
+        self.binder = Binder(self.fMainFrame, self.fGraphFrame, self.pyo,
+                             self.scheduler)
 
         # Make references to the app for all the objects
         self.fMainFrame.app = self
@@ -1,17 +1,24 @@
 """
 The data control panel for PSquid.
 """
+import os
+import time
+
 import wx
 
+from gui.redraw import BlitRedrawer
+from resources import close_resources
+
 
 class Binder(object):
     """
     Responsible for binding a PSquid object to its GUI.
     """
-    def __init__(self, fmf, fgf, pyo):
+    def __init__(self, fmf, fgf, pyo, scheduler):
         self.pyo = pyo
         self.fmf = fmf
         self.fgf = fgf
+        self.scheduler = scheduler
 
         self.make_binders()
 
@@ -76,6 +83,18 @@ class MainBindings(object):
         for timer in timers:
             timer.Stop()
 
+        # Stop the streaming command, if any, and don't wait on commands
+        # that are still in flight
+        self.fmf.stopStream()
+        self.fmf.dispatcher.shutdown(wait=False)
+
+        # Close the controller's instrument connections, or stop its worker
+        # process, which closes them
+        if self.fmf.isolated:
+            self.fmf.controller.close()
+        else:
+            close_resources(self.fmf.controller)
+
         # Let the event queue flush out
         wx.Yield()
 
@@ -95,10 +114,18 @@ class GraphBindings(object):
         self.fgf = fgf
         self.fmf = binder.fmf
         self.pyo = binder.pyo
+        self.scheduler = binder.scheduler
 
         self.timer = self.fmf.timer
 
-        self.cols = []
+        self.cols = None
+        self.colreader = None  # Reader and version of the columns shown
+        self.colversion = None
+        self.selection = None  # (xs, ys) plotted
+        self.channels_changed = False
+        self.signature = None
+        self.window = (None, None)  # (samples, seconds)
+        self.windowed = None        # Reader that the window was applied to
 
     def bind(self):
         self.fgf.bindings = self
@@ -107,52 +134,190 @@ class GraphBindings(object):
         self.fgf.replace_figure(self.pyo.fig)  # Swap out placeholder figure
         self.pyo.canvas = self.pyo.fig.canvas  # Canvas created in prev line
         self.canvas = self.pyo.canvas
+        self.redrawer = BlitRedrawer(self.pyo, self.canvas)
         self.pyo.fig.canvas.SendSizeEventToParent()  # Force resize/redraw
 
         # Timer
         self.fmf.Bind(wx.EVT_TIMER, self.on_timer, self.timer)
 
+        # Channel selection
+        self.fgf.pChannels.Bind(wx.EVT_CHECKBOX, self.on_channel)
+
+        # Data window
+        self.fgf.Bind(wx.EVT_TEXT_ENTER, self.on_window, self.fgf.txtWindow)
+        self.fgf.Bind(wx.EVT_CHOICE, self.on_window, self.fgf.chWindow)
+
     def on_timer(self, event):
         """
-        Plot update loop. The way PyOscope is written, this should simply call
-        the pyoscope update() method and then redraw the canvas. Also redraws
-        the channel selection checkboxes, if necessary.
+        Plot update loop. Updates the plotted data and redraws the canvas,
+        blitting only the lines unless the axes or channels changed. Also
+        updates the channel selection checkboxes, if necessary.
+
+        Updates are skipped while the data source is unchanged. The scheduler
+        decides when the next update happens, and the one-shot timer is only
+        restarted once this update is done.
         """
         try:
-            self.update_channels()
-            self.pyo._update()
-            self.canvas.draw()
+            self.apply_window()
+            replotted = self.update_channels()
+            if replotted or self.source_changed():
+                start = time.time()
+                self.redrawer.update()
+                interval = self.scheduler.drew(time.time() - start)
+            else:
+                interval = self.scheduler.idle()
         except Exception as e:
             self.timer.Stop()
             raise e
+        self.show_stats()
+        self.timer.Start(max(int(1000*interval), 1), wx.TIMER_ONE_SHOT)
+
+    def on_channel(self, event):
+        """
+        A channel checkbox was clicked. Update the selection, and replot
+        right away, rather than when the timer would next fire.
+        """
+        self.fgf.pChannels.checked(event.GetEventObject())
+        self.channels_changed = True
+        self.timer.Stop()
+        self.timer.Start(1, wx.TIMER_ONE_SHOT)
+
+    def on_window(self, event):
+        """
+        Set the data window from the window controls. A window in samples
+        bounds both the plot and the reader's memory. A window in seconds
+        applies to the first selected X channel.
+        """
+        text = self.fgf.txtWindow.GetValue().strip()
+        try:
+            size = float(text) if text else None
+        except ValueError:
+            self.fgf.sbMain.SetStatusText('Invalid window: ' + text)
+            return
+        if size is not None and size <= 0:
+            size = None
+        if self.fgf.chWindow.GetStringSelection() == 'samples':
+            self.window = (int(size) if size else None, None)
+        else:
+            self.window = (None, size)
+        self.windowed = None
+        self.apply_window()
+        self.signature = None  # Force a redraw
+
+    def apply_window(self):
+        """
+        Apply the data window to the current reader, if it has not been
+        already. Readers without `set_window` are only windowed in samples,
+        and only in the plot.
+        """
+        reader = getattr(self.pyo, 'reader', None)
+        if reader is None or reader is self.windowed:
+            return
+        self.windowed = reader
+        samples, seconds = self.window
+        self.pyo.windowsize(str(samples or ''))
+        if not hasattr(reader, 'set_window'):
+            if seconds:
+                self.fgf.sbMain.SetStatusText(
+                    'Reader does not support windows in seconds')
+            return
+        column = None
+        if seconds:
+            column = self.time_column()
+            if column is None:
+                self.fgf.sbMain.SetStatusText(
+                    'A window in seconds requires an X channel')
+                return
+        with self.pyo.lock:
+            reader.set_window(samples, seconds, column)
+            self.pyo.data = reader.data
+
+    def time_column(self):
+        """The first selected X channel, or None if it is the index."""
+        if self.selection is None:
+            return self.fgf.pChannels.selection()[0][0]
+        return self.selection[0][0]
+
+    def source_changed(self):
+        """
+        True if the data source may have changed since the last call, i.e.
+        if the reader or the size or modification time of its file changed.
+        Readers with a `signature` method (e.g. `stream.StreamReader`) say
+        themselves when they changed. Readers without a file are always
+        assumed to have changed.
+        """
+        reader = getattr(self.pyo, 'reader', None)
+        if reader is None:
+            return False
+        if hasattr(reader, 'signature'):
+            signature = (id(reader), reader.signature())
+        else:
+            try:
+                st = os.stat(reader.filename)
+                signature = (id(reader), st.st_size, st.st_mtime)
+            except (AttributeError, TypeError, OSError):
+                return True
+        changed = (signature != self.signature)
+        self.signature = signature
+        return changed
+
+    def show_stats(self):
+        scheduler = self.scheduler
+        self.fgf.sbMain.SetStatusText(
+            '{0:.1f} fps, {1:.1f} ms/draw'.format(scheduler.fps,
+                                                  1000*scheduler.draw_time))
 
     def update_channels(self):
         """
-        Update the channel selection checkboxes, if necessary.
+        Update the channel selection checkboxes if the columns changed, and
+        remake the plot if the selection changed since the last time. Returns
+        True if the plot was remade.
+
+        The selection is only looked at after a checkbox was clicked (see
+        `on_channel`) or the columns changed, so this is O(1) otherwise.
         """
         pChannels = self.fgf.pChannels
         try:
-            cols = self.pyo.data.columns
-            if list(cols) != list(self.cols):
-                pChannels.make_channel_checkboxes()
-            self.cols = cols
-
-            activex, activey = pChannels.active_channels()
-            if (activex != pChannels.activex) or (activey != pChannels.activey):
-                xlabels = [chk.GetLabel() for chk in pChannels.chkboxesX]
-                xs = [pChannels.coldict[xlabel]
-                      for xlabel in xlabels if activex[xlabel]]
-                ylabels = [chk.GetLabel() for chk in pChannels.chkboxesY]
-                ys = [pChannels.coldict[ylabel]
-                      for ylabel in ylabels if activey[ylabel]]
-
-                if not xs:
-                    xs = [None]
-                if not ys:
-                    ys = [None]
-
-                self.pyo.plot(xs, ys)
+            if self.columns_changed():
+                # The new data may have been plotted with other channels
+                pChannels.set_columns(self.cols)
+                self.channels_changed = True
+                self.selection = None
+            if not self.channels_changed:
+                return False
+            selection = pChannels.selection()
+            replotted = (selection != self.selection)
+            if replotted:
+                self.pyo.plot(*selection)
+            self.channels_changed = False
+            self.selection = selection
+            return replotted
         except (AttributeError, TypeError):
             pass
+        return False
+
+    def columns_changed(self):
+        """
+        True if the reader or the columns of the data may have changed since
+        the last call, in which case `self.cols` is set to the new columns.
+
+        Readers with a `columns_version` (see `cpreaders.IncrementalReader`)
+        are checked in O(1). For other readers, the columns are only compared
+        when the columns object itself changed.
+        """
+        reader = self.pyo.reader
+        cols = self.pyo.data.columns
+        version = getattr(reader, 'columns_version', None)
+        if reader is self.colreader:
+            if version is not None:
+                if version == self.colversion:
+                    return False
+            elif (cols is self.cols) or (list(cols) == list(self.cols)):
+                self.cols = cols
+                return False
+        self.colreader = reader  # Kept alive, so `is` can't be fooled
+        self.colversion = version
+        self.cols = cols
+        return True
 
 
@@ -2,113 +2,143 @@
 The channel selection panel to be attached to the GraphFrame in the CP GUI.
 """
 import wx
+import wx.lib.scrolledpanel as scrolled
 
 
-class ChannelPanel(wx.Panel):
+class ChannelPanel(scrolled.ScrolledPanel):
     """
     The channel panel for the CP GraphFrame.
+
+    Holds a checkbox per column of the data, plus 'Index', for each of the X
+    and Y channels. `set_columns` updates the checkboxes when the columns
+    change, touching only those whose labels change, and keeps the user's
+    selections of the columns that remain.
+
+    The panel keeps the selection as the sets of the positions of the checked
+    X and Y checkboxes. The GraphFrame's bindings listen to the checkboxes'
+    EVT_CHECKBOX events, which propagate to the panel, and pass the clicked
+    checkbox to `checked`, which updates the sets in O(1). `selection` is
+    only recomputed after a change.
     """
     def __init__(self, parent):
-        wx.Panel.__init__(self, parent=parent, id=wx.ID_ANY)
+        scrolled.ScrolledPanel.__init__(self, parent=parent, id=wx.ID_ANY)
 
         self.fgf = self.GetTopLevelParent()
 
         self.bsMain = wx.BoxSizer(wx.VERTICAL)
 
-        self.coldict = None
-        self.activex = {}
-        self.activey = {}
-        self.make_channel_checkboxes()
-
-        self.SetSizer(self.bsMain)
-
-    def make_channel_checkboxes(self):
-        """
-        Make all the controls for the channel selector checkboxes.
-        """
+        self.coldict = {}
+        self.labels = []
+        self.selected = {'X': set(), 'Y': set()}  # Positions of the checked
+        self.positions = {}      # Checkbox id -> ('X' or 'Y', position)
+        self._selection = None   # Cached `selection`
         self.bsX, self.chkboxesX = self.make_buttons('X Channels')
-        for i, button in enumerate(self.chkboxesX):
-            if i == 0:
-                button.SetValue(True)
-            else:
-                button.SetValue(False)
-
         self.bsY, self.chkboxesY = self.make_buttons('Y Channels')
-        for i, button in enumerate(self.chkboxesY):
-            if i == 0:
-                button.SetValue(False)
-            else:
-                button.SetValue(True)
-
-        self.bsMain.Prepend(self.bsY, 1, wx.EXPAND)
-        self.bsMain.Prepend((20, 20), 0, wx.EXPAND)
-        self.bsMain.Prepend(self.bsX, 1, wx.EXPAND)
-
-        while len(self.bsMain.Children) > 3:
-            nChildren = len(self.bsMain.Children)
-            self.bsMain.Hide(nChildren-1)
-            self.bsMain.Remove(nChildren-1)
-
-        self.activex, self.activey = self.active_channels()
-        self.bsMain.Layout()
-        self.Fit()
-
-    def active_channels(self):
-        activex = dict([(chk.GetLabel(), chk.GetValue()) for chk in
-                        self.chkboxesX])
-        activey = dict( [(chk.GetLabel(), chk.GetValue()) for chk in
-                         self.chkboxesY])
-        return activex, activey
-
-    # This version is hideously slow for some reason...
-    # def make_channel_checkboxes(self):
-    #     """
-    #     Make all the controls for the channel selector checkboxes.
-    #     """
-    #     self.bsX, self.chkboxesX = self.make_buttons('X Channels')
-    #     self.bsY, self.chkboxesY = self.make_buttons('Y Channels')
-    #
-    #     bs = wx.BoxSizer(wx.VERTICAL)
-    #     bs.Add(self.bsX, 1, wx.EXPAND)
-    #     bs.Add((20, 20), 0, wx.EXPAND)
-    #     bs.Add(self.bsY, 1, wx.EXPAND)
-    #
-    #     bsMain_old = self.bsMain
-    #     self.bsMain = bs
-    #     self.SetSizer(self.bsMain)
-    #     bsMain_old.Destroy()
-    #
-    #     self.bsMain.Layout()
-    #     self.Fit()
+
+        self.bsMain.Add(self.bsX, 0, wx.EXPAND)
+        self.bsMain.Add((20, 20), 0, wx.EXPAND)
+        self.bsMain.Add(self.bsY, 0, wx.EXPAND)
+
+        self.SetSizer(self.bsMain)
+        self.SetupScrolling(scroll_x=False)
 
     def make_buttons(self, label):
         """
-        Make the sizer containing the controls for a channel selector.
+        Make the sizer that will contain the checkboxes of a channel
+        selector.
         """
         bs = wx.BoxSizer(wx.VERTICAL)
 
         lbl = wx.StaticText(self, wx.ID_ANY, label)
         bs.Add(lbl, 0, wx.EXPAND)
 
-        chkboxes = []
-        coldict = {}
-        try:
-            pyo = self.fgf.app.pyo
-            columns = pyo.data.columns
-
-            chk = wx.CheckBox(self, wx.ID_ANY, 'Index')
-            chkboxes.append(chk)
-            bs.Add(chk, 0, wx.EXPAND)
-            coldict['Index'] = None
-
-            for col in columns:
-                strcol = str(col)
-                coldict[strcol] = col
-                chk = wx.CheckBox(self, wx.ID_ANY, strcol)
-                bs.Add(chk, 0, wx.EXPAND)
-                chkboxes.append(chk)
-        except AttributeError:
-            pass
+        return bs, []
 
+    def set_columns(self, columns):
+        """
+        Show a checkbox for each of `columns`, plus 'Index'. Returns True if
+        any checkbox changed.
+
+        Checkboxes are relabelled in place, and only the surplus ones are
+        added or destroyed. A column that was already shown keeps its
+        selection. New X channels are unselected, except 'Index' if no other
+        X channel is selected, and new Y channels other than 'Index' are
+        selected.
+        """
+        coldict = {'Index': None}
+        labels = ['Index']
+        for col in columns:
+            strcol = str(col)
+            coldict[strcol] = col
+            labels.append(strcol)
+
+        oldx = self.update_buttons('X', self.bsX, self.chkboxesX, labels,
+                                   lambda label: False)
+        oldy = self.update_buttons('Y', self.bsY, self.chkboxesY, labels,
+                                   lambda label: label != 'Index')
         self.coldict = coldict
-        return bs, chkboxes
+        self.labels = labels
+        self._selection = None
+
+        changed = (oldx != labels) or (oldy != labels)
+        if changed:
+            if not self.selected['X']:
+                self.chkboxesX[0].SetValue(True)
+                self.selected['X'].add(0)
+            self.bsMain.Layout()
+            self.SetupScrolling(scroll_x=False, scrollToTop=False)
+        return changed
+
+    def update_buttons(self, axis, bs, chkboxes, labels, default):
+        """
+        Make the checkboxes `chkboxes` of the `axis` ('X' or 'Y') in the
+        sizer `bs` show `labels`. `default(label)` is the selection of the
+        labels not shown before. Returns the old labels.
+        """
+        oldlabels = [chk.GetLabel() for chk in chkboxes]
+        if oldlabels == labels:
+            return oldlabels
+        selected = dict((chk.GetLabel(), chk.GetValue()) for chk in chkboxes)
+
+        # Remove the surplus checkboxes, or add the missing ones
+        while len(chkboxes) > len(labels):
+            chk = chkboxes.pop()
+            del self.positions[chk.GetId()]
+            bs.Detach(chk)
+            chk.Destroy()
+        for label in labels[len(chkboxes):]:
+            chk = wx.CheckBox(self, wx.ID_ANY, label)
+            bs.Add(chk, 0, wx.EXPAND)
+            self.positions[chk.GetId()] = (axis, len(chkboxes))
+            chkboxes.append(chk)
+            chk.SetValue(selected.get(label, default(label)))
+
+        # Relabel the others, keeping the selection of each label
+        for chk, oldlabel, label in zip(chkboxes, oldlabels, labels):
+            if label != oldlabel:
+                chk.SetLabel(label)
+                chk.SetValue(selected.get(label, default(label)))
+        self.selected[axis] = set(i for i, chk in enumerate(chkboxes)
+                                  if chk.GetValue())
+        return oldlabels
+
+    def checked(self, chk):
+        """Record the state of the checkbox `chk` after it was clicked."""
+        axis, i = self.positions[chk.GetId()]
+        if chk.GetValue():
+            self.selected[axis].add(i)
+        else:
+            self.selected[axis].discard(i)
+        self._selection = None
+
+    def selection(self):
+        """
+        The selected X and Y columns, in order, as a tuple of two lists.
+        'Index' is None, and so is an empty selection.
+        """
+        if self._selection is None:
+            xs, ys = [[self.coldict[self.labels[i]]
+                       for i in sorted(self.selected[axis])]
+                      for axis in ('X', 'Y')]
+            self._selection = (xs or [None]), (ys or [None])
+        return self._selection
@@ -0,0 +1,300 @@
+"""
+The command panel for the CP MainFrame.
+"""
+import sys
+
+import wx
+
+
+class CommandList(wx.ListCtrl):
+    """
+    Virtual list of the rows of a `CommandPanel`. Only the visible rows are
+    ever drawn, and their text is asked for on demand, so the cost of the
+    list does not depend on the number of commands.
+    """
+    def __init__(self, parent, panel):
+        wx.ListCtrl.__init__(self, parent, wx.ID_ANY,
+                             style=(wx.LC_REPORT | wx.LC_VIRTUAL |
+                                    wx.LC_SINGLE_SEL))
+        self.panel = panel
+        self.InsertColumn(0, 'Command', width=200)
+        self.InsertColumn(1, 'Arguments', width=300)
+        self.InsertColumn(2, 'State', width=120)
+
+    def OnGetItemText(self, item, col):
+        return self.panel.row_text(item, col)
+
+
+class CommandPanel(wx.Panel):
+    """
+    The commands of a controller: a search box, a virtual list of the
+    commands (in collapsible sections if they have groups, see
+    `cp.command`), and the argument controls of the selected command.
+
+    Only the selected command's controls exist at any time. The values
+    entered for a command are kept when another one is selected.
+    `on_run(name, raw)` is called with the command's name and its raw
+    (string) argument values when it is run, by its Run button or by
+    double-clicking it in the list. `on_sweep(name, raw)`, if given, is
+    called the same way by the command's Sweep button, with argument values
+    that may be sweep ranges or lists (see `sweep`).
+    """
+    def __init__(self, parent, registry, on_run, on_sweep=None):
+        wx.Panel.__init__(self, parent=parent, id=wx.ID_ANY)
+
+        self.registry = registry
+        self.on_run = on_run
+        self.on_sweep = on_sweep
+
+        self.values = {}      # Command name -> {argument name: raw value}
+        self.states = {}      # Command name -> state shown in the list
+        self.sweeping = set()  # Names of the commands being swept
+        self.collapsed = set()
+        self.filter = ''
+        self.rows = []        # ('group', name, ncommands) or ('command', spec)
+        self.rowindex = {}    # Command name -> row
+        self.selected = None  # Spec of the command shown in the detail panel
+        self.argctrls = {}
+        self.bRun = None
+        self.bSweep = None
+
+        self.groups = {}
+        for spec in registry:
+            self.groups.setdefault(spec.options.get('group', ''),
+                                   []).append(spec)
+        self.grouped = (len(self.groups) > 1) or ('' not in self.groups)
+
+        self.font = wx.Font(14, wx.DEFAULT, wx.NORMAL, wx.BOLD)
+
+        self.search = wx.SearchCtrl(self, wx.ID_ANY,
+                                    style=wx.TE_PROCESS_ENTER)
+        self.search.ShowCancelButton(True)
+        self.lcCommands = CommandList(self, self)
+        self.pDetail = wx.Panel(self)
+        self.bsDetail = wx.BoxSizer(wx.VERTICAL)
+        self.pDetail.SetSizer(self.bsDetail)
+
+        self.bsMain = wx.BoxSizer(wx.VERTICAL)
+        self.bsMain.Add(self.search, 0, wx.EXPAND | wx.ALL, 5)
+        self.bsMain.Add(self.lcCommands, 1, wx.EXPAND | wx.LEFT | wx.RIGHT, 5)
+        self.bsMain.Add(self.pDetail, 0, wx.EXPAND | wx.ALL, 5)
+        self.SetSizer(self.bsMain)
+
+        self.search.Bind(wx.EVT_TEXT, self.on_search)
+        self.search.Bind(wx.EVT_SEARCHCTRL_CANCEL_BTN, self.on_cancel_search)
+        self.lcCommands.Bind(wx.EVT_LIST_ITEM_SELECTED, self.on_select)
+        self.lcCommands.Bind(wx.EVT_LIST_ITEM_ACTIVATED, self.on_activate)
+
+        self.make_rows()
+        if self.rowindex:  # Show the first command
+            self.lcCommands.Select(min(self.rowindex.values()))
+
+    def make_rows(self):
+        """
+        Make the list of rows from the groups, the collapsed sections and the
+        search filter, and refresh the list.
+        """
+        text = self.filter.lower()
+        rows = []
+        for group in sorted(self.groups):
+            specs = self.groups[group]
+            if text and text not in group.lower():
+                specs = [spec for spec in specs if text in spec.name.lower()]
+                if not specs:
+                    continue
+            if self.grouped:
+                rows.append(('group', group, len(specs)))
+                if group in self.collapsed and not text:
+                    continue
+            rows.extend(('command', spec) for spec in specs)
+        self.rows = rows
+        self.rowindex = dict((row[1].name, i) for i, row in enumerate(rows)
+                             if row[0] == 'command')
+        self.lcCommands.SetItemCount(len(rows))
+        self.lcCommands.Refresh()
+
+    def row_text(self, item, col):
+        """Text of column `col` of row `item` of the list."""
+        try:
+            row = self.rows[item]
+        except IndexError:
+            return ''
+        if row[0] == 'group':
+            if col != 0:
+                return ''
+            sign = '+' if row[1] in self.collapsed else '-'
+            return '[{0}] {1} ({2})'.format(sign, row[1] or 'Other', row[2])
+        spec = row[1]
+        if col == 0:
+            return ('    ' if self.grouped else '') + spec.name
+        elif col == 1:
+            return ', '.join(arg.name for arg in spec.args)
+        return self.states.get(spec.name, '')
+
+    def on_search(self, event):
+        self.filter = self.search.GetValue().strip()
+        self.make_rows()
+
+    def on_cancel_search(self, event):
+        self.search.SetValue('')
+
+    def on_select(self, event):
+        index = event.GetIndex()
+        row = self.rows[index]
+        if row[0] == 'group':
+            # Deselect the header, so that clicking it again toggles it again
+            self.lcCommands.Select(index, False)
+            self.toggle(row[1])
+        else:
+            self.show_detail(row[1])
+
+    def on_activate(self, event):
+        row = self.rows[event.GetIndex()]
+        if row[0] == 'command':
+            self.run(row[1])
+
+    def toggle(self, group):
+        """Collapse or expand the section of `group`."""
+        if group in self.collapsed:
+            self.collapsed.discard(group)
+        else:
+            self.collapsed.add(group)
+        self.make_rows()
+        if self.selected is not None:
+            index = self.rowindex.get(self.selected.name)
+            if index is not None:
+                self.lcCommands.Select(index)
+
+    def show_detail(self, spec):
+        """Replace the detail controls by those of the command `spec`."""
+        if spec is self.selected:
+            return
+        self.save_values()
+        self.bsDetail.Clear(True)  # Destroys the previous command's controls
+        self.selected = spec
+        values = self.raw_values(spec)
+
+        self.bRun = wx.Button(self.pDetail, wx.ID_ANY, spec.name,
+                              size=(150, 50), name=spec.name)
+        self.bRun.SetToolTip(wx.ToolTip(trim(spec.doc)))
+        self.bRun.Bind(wx.EVT_BUTTON, lambda event: self.run(spec))
+        self.update_button(spec.name)
+
+        bsButtons = wx.BoxSizer(wx.VERTICAL)
+        bsButtons.Add(self.bRun, 1, wx.EXPAND)
+        self.bSweep = None
+        if self.on_sweep is not None and spec.args:
+            self.bSweep = wx.Button(self.pDetail, wx.ID_ANY, 'Sweep')
+            self.bSweep.SetToolTip(wx.ToolTip(
+                "Run the command for every combination of the arguments' "
+                "values,\ne.g. 0:10:0.5 or 1, 2, 5. Click again to stop."))
+            self.bSweep.Bind(wx.EVT_BUTTON, lambda event: self.sweep(spec))
+            bsButtons.Add(self.bSweep, 0, wx.EXPAND)
+            self.update_sweep_button()
+
+        bsCmd = wx.BoxSizer(wx.HORIZONTAL)
+        bsCmd.Add(bsButtons, 0, wx.EXPAND)
+        self.argctrls = {}
+        for arg in spec.args:
+            lbl = wx.StaticText(self.pDetail, wx.ID_ANY, arg.name,
+                                style=wx.ALIGN_CENTER)
+            lbl.SetFont(self.font)
+            txt = wx.TextCtrl(self.pDetail, wx.ID_ANY, values[arg.name])
+            bsArg = wx.BoxSizer(wx.VERTICAL)
+            bsArg.Add(lbl, 0, 15)
+            bsArg.Add(txt, 0, 15)
+            bsCmd.Add(bsArg, 1, wx.ALIGN_CENTER, 6)
+            self.argctrls[arg.name] = txt
+        self.bsDetail.Add(bsCmd, 0, wx.EXPAND)
+
+        doc = trim(spec.doc)
+        if doc:
+            lblDoc = wx.StaticText(self.pDetail, wx.ID_ANY, doc)
+            self.bsDetail.Add(lblDoc, 0, wx.EXPAND | wx.TOP, 5)
+        self.Layout()
+
+    def save_values(self):
+        """Remember the values entered for the selected command."""
+        if self.selected is not None:
+            self.values[self.selected.name] = dict(
+                (name, ctrl.GetValue())
+                for name, ctrl in self.argctrls.items())
+
+    def raw_values(self, spec):
+        """The raw argument values of the command `spec`: those entered by
+        the user, or the string defaults."""
+        values = dict((arg.name, str(arg.default)) for arg in spec.args)
+        values.update(self.values.get(spec.name, {}))
+        return values
+
+    def run(self, spec):
+        if spec is self.selected:
+            self.save_values()
+        self.on_run(spec.name, self.raw_values(spec))
+
+    def sweep(self, spec):
+        if spec is self.selected:
+            self.save_values()
+        self.on_sweep(spec.name, self.raw_values(spec))
+
+    def set_state(self, name, text):
+        """Show `text` as the state of the command `name`."""
+        if text:
+            self.states[name] = text
+        else:
+            self.states.pop(name, None)
+        index = self.rowindex.get(name)
+        if index is not None:
+            self.lcCommands.RefreshItem(index)
+        self.update_button(name)
+
+    def update_button(self, name):
+        if self.selected is None or self.selected.name != name:
+            return
+        text = self.states.get(name)
+        if text:
+            self.bRun.SetLabel('{0}\n({1})'.format(name, text))
+        else:
+            self.bRun.SetLabel(name)
+
+    def set_sweeping(self, name, sweeping):
+        """Label the Sweep button of the command `name` as a stop button
+        while it is `sweeping`."""
+        if sweeping:
+            self.sweeping.add(name)
+        else:
+            self.sweeping.discard(name)
+        self.update_sweep_button()
+
+    def update_sweep_button(self):
+        if self.bSweep is None or self.selected is None:
+            return
+        self.bSweep.SetLabel('Stop sweep' if self.selected.name in
+                             self.sweeping else 'Sweep')
+
+
+def trim(docstring):
+    """Trim a docstring according to PEP 257."""
+    if not docstring:
+        return ''
+    # Convert tabs to spaces (following the normal Python rules)
+    # and split into a list of lines:
+    lines = docstring.expandtabs().splitlines()
+    # Determine minimum indentation (first line doesn't count):
+    indent = sys.maxsize
+    for line in lines[1:]:
+        stripped = line.lstrip()
+        if stripped:
+            indent = min(indent, len(line) - len(stripped))
+    # Remove indentation (first line is special):
+    trimmed = [lines[0].strip()]
+    if indent < sys.maxsize:
+        for line in lines[1:]:
+            trimmed.append(line[indent:].rstrip())
+    # Strip off trailing and leading blank lines:
+    while trimmed and not trimmed[-1]:
+        trimmed.pop()
+    while trimmed and not trimmed[0]:
+        trimmed.pop(0)
+    # Return a single string:
+    return '\n'.join(trimmed)
\ No newline at end of file
@@ -0,0 +1,58 @@
+"""
+Min/max decimation of plot data.
+
+Reduces a line to the minimum and maximum of the data in each pixel column of
+the axes, so that the cost of drawing it depends on the width of the plot and
+not on the number of data points. The decimated line looks the same as the
+full one at the current zoom level, and keeps the extremes of the data.
+"""
+import numpy as np
+
+
+def is_sorted(x):
+    """True if `x` is non-decreasing."""
+    return len(x) < 2 or bool(np.all(x[1:] >= x[:-1]))
+
+
+def minmax(x, y, lo, hi, nbins, nbins_outside=4):
+    """
+    Decimate the line (`x`, `y`) to a min/max envelope.
+
+    `x` must be non-decreasing. The view range [`lo`, `hi`] is split into
+    `nbins` bins (typically the width of the axes in pixels), and the data
+    outside of it into `nbins_outside` bins on each side. Each bin is reduced
+    to two points at the x value of its first point: its minimum and its
+    maximum. The first and last points are always kept, so the extents of the
+    decimated line are the same as those of the full line.
+
+    Returns the decimated `x` and `y` arrays, or the inputs unchanged if they
+    have no more points than the decimated line would.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    n = len(y)
+    if n <= 2*(nbins + 2*nbins_outside) + 2:
+        return x, y
+
+    lo, hi = sorted((lo, hi))
+    start, stop = np.searchsorted(x, [lo, hi], side='left')
+    edges = [np.linspace(0, start, nbins_outside + 1).astype(int),
+             np.searchsorted(x[start:stop], np.linspace(lo, hi, nbins + 1)),
+             np.linspace(stop, n, nbins_outside + 1).astype(int)]
+    edges[1] += start
+    edges = np.unique(np.concatenate(edges))
+    starts = edges[:-1]
+    starts = starts[starts < n]
+    if not len(starts):
+        return x, y
+
+    ymin = np.minimum.reduceat(y, starts)
+    ymax = np.maximum.reduceat(y, starts)
+    xd = np.empty(2*len(starts) + 2, dtype=np.result_type(x, float))
+    yd = np.empty(2*len(starts) + 2, dtype=np.result_type(y, float))
+    xd[1:-1:2] = xd[2:-1:2] = x[starts]
+    yd[1:-1:2] = ymin
+    yd[2:-1:2] = ymax
+    xd[0], yd[0] = x[0], y[0]
+    xd[-1], yd[-1] = x[-1], y[-1]
+    return xd, yd
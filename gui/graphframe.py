@@ -43,6 +43,10 @@ class GraphFrame(wx.Frame):
         self.pChannels = ChannelPanel(self.wRight)
 
         self.bsRight.Add(self.pChannels, 1, wx.EXPAND | wx.TOP)
+
+        # Data window selection, i.e. plot only the last N samples/seconds
+        self.bsWindow = self.make_window_controls(self.wRight)
+        self.bsRight.Add(self.bsWindow, 0, wx.EXPAND | wx.ALL, 5)
         self.wRight.SetSizer(self.bsRight)
 
         # Add subwindows to splitter
@@ -52,8 +56,30 @@ class GraphFrame(wx.Frame):
         self.bsMain.Add(self.splMain, 1, wx.ALL | wx.EXPAND)
 
         self.panel.SetSizer(self.bsMain)
+
+        # Plot update statistics
+        self.sbMain = self.CreateStatusBar()
+
         self.Layout()
 
+    def make_window_controls(self, parent):
+        """
+        Make the controls that select how much of the data is kept and
+        plotted: the last N samples or the last N seconds (of the X channel).
+        An empty window keeps everything.
+        """
+        bs = wx.BoxSizer(wx.HORIZONTAL)
+        lbl = wx.StaticText(parent, wx.ID_ANY, 'Last')
+        self.txtWindow = wx.TextCtrl(parent, wx.ID_ANY, '', size=(70, -1),
+                                     style=wx.TE_PROCESS_ENTER)
+        self.chWindow = wx.Choice(parent, wx.ID_ANY,
+                                  choices=['samples', 'seconds'])
+        self.chWindow.SetSelection(0)
+        bs.Add(lbl, 0, wx.ALIGN_CENTER_VERTICAL | wx.RIGHT, 5)
+        bs.Add(self.txtWindow, 1, wx.EXPAND)
+        bs.Add(self.chWindow, 0, wx.EXPAND)
+        return bs
+
     def make_canvas(self, parent, fig=None, tb=True):
         if fig is None:
             fig, _, _ = self.init_plot()
@@ -1,15 +1,16 @@
-import sys
-import inspect
-import time
 import os
+import threading
+import time
 
 import wx
-import wx.lib.scrolledpanel as scrolled
 
-
-class NoDefault(object):
-    def __str__(self):
-        return 'NoDefault'
+import sweep
+from cp import string_types
+from gui.commandpanel import CommandPanel
+from readiness import NotReady, wait_ready
+from stream import Stream, isstream, pump
+from registry import registry_for
+from worker import RemoteStream, WorkerProxy
 
 
 class MainFrame(wx.Frame):
@@ -17,101 +18,45 @@ class MainFrame(wx.Frame):
     The main frame that holds all of the others. Really just an
     expandable container for the notebook.
     """
-    def __init__(self, controller):
+    def __init__(self, controller, dispatcher):
         wx.Frame.__init__(self, None, wx.ID_ANY, "Controller",
                           size=(700, 500))
 
         self.controller = controller
 
-        # Stores information relevant to executing the command methods with
-        # the specified aguments.
-        self.cmddict = {}
+        # Runs the command methods off of the GUI thread
+        self.dispatcher = dispatcher
+        self.dispatcher.add_listener(self.onCommandState)
 
-        self.make_menubar()
+        # The metadata of the commands, collected once per controller class
+        # A `WorkerProxy` stands in for a controller in a worker process
+        self.isolated = isinstance(controller, WorkerProxy)
+        self.registry = registry_for(controller.controller_class
+                                     if self.isolated else type(controller))
 
-        self.panel = scrolled.ScrolledPanel(self)
+        # Command name -> threading.Event that stops its running sweep
+        self.sweeps = {}
 
-        self.timer = wx.Timer(self)  # Timer for plot updating
-        self.timer.Start(200)  # 200 ms = 5 Hz = 5 fps
+        # The `stream.Stream` being plotted, if any
+        self.stream = None
 
-        self.bsMain = wx.BoxSizer(wx.VERTICAL)
-        self.populate_commands()
+        self.make_menubar()
+        self.sbMain = self.CreateStatusBar()
 
-        self.panel.SetSizer(self.bsMain)
-        self.panel.SetupScrolling()
+        # Timer for plot updating. One-shot; each update schedules the next.
+        self.timer = wx.Timer(self)
+        self.timer.Start(200, wx.TIMER_ONE_SHOT)
 
-        self.Layout()
+        # Only the selected command's controls are created, so the frame
+        # opens as fast with hundreds of commands as with a few.
+        self.pCommands = CommandPanel(self, self.registry, self.onCommand,
+                                      self.onSweep)
 
-    def populate_commands(self):
-        """
-        Populate the main sizer with the commands specified in the
-        controller.
-        """
-        methodslist = inspect.getmembers(self.controller, inspect.ismethod)
-        for name, method in methodslist:
-            try:
-                if method.command:
-                    # Create the command button
-                    bCmd = wx.Button(self.panel, wx.ID_ANY, name, size=(150,
-                                                                        50))
-                    # Set its tooltip to be the docstring
-                    docstring = trim(method.__doc__)
-                    bCmd.SetToolTip(wx.ToolTip(str(docstring)))
-
-                    # Create the arguments controls
-                    bsCmd, args = self.create_command(method)
-
-                    # Add button to sizer
-                    bsCmd.Prepend(bCmd, 0, wx.EXPAND)
-
-                    # Bind everything
-                    bCmd.Bind(wx.EVT_BUTTON, self.onCommand)
-                    self.cmddict[name] = args
-                    self.bsMain.Add(bsCmd, 0, wx.EXPAND, 5)
-                    sl = wx.StaticLine(self.panel, size=(2, 2),
-                                       style=wx.LI_HORIZONTAL)
-                    self.bsMain.Add(sl, 0, wx.EXPAND, 5)
-            except AttributeError:
-                pass
-
-    def create_command(self, method):
-        bsCmd = wx.BoxSizer(wx.HORIZONTAL)
-        arglist = self.make_arglist(method)
-
-        args = {}
-
-        for d in arglist[1:]:
-            argname = d['name']
-            default = d['default']
-            lbl = wx.StaticText(self.panel, wx.ID_ANY, argname,
-                                style=wx.ALIGN_CENTER)
-            font = wx.Font(14, wx.DEFAULT, wx.NORMAL, wx.BOLD)
-            lbl.SetFont(font)
-
-            txt = wx.TextCtrl(self.panel, wx.ID_ANY, str(default))
-            bsArg = wx.BoxSizer(wx.VERTICAL)
-            bsArg.Add(lbl, 0, 15)
-            bsArg.Add(txt, 0, 15)
-            bsCmd.Add(bsArg, 1, wx.ALIGN_CENTER, 6)
-            args[argname] = txt
-        retdict = {'method': method, 'args': args}
-        return bsCmd, retdict
-
-    def make_arglist(self, method):
-        """Makes a list of (arg, default) pairs for the method."""
-        argspec = method.argspec
-        arglist = []
-        for i in range(len(argspec.args)):
-            arg = argspec.args[-(i+1)]
-            try:
-                default = argspec.defaults[-(i+1)]
-            except IndexError:
-                default = NoDefault()
-            argdict = {'name': arg, 'default': default}
-            arglist.append(argdict)
-        arglist.reverse()
+        self.bsMain = wx.BoxSizer(wx.VERTICAL)
+        self.bsMain.Add(self.pCommands, 1, wx.EXPAND)
+        self.SetSizer(self.bsMain)
 
-        return arglist
+        self.Layout()
 
     def make_menubar(self):
         self.menuBar = wx.MenuBar()
@@ -125,58 +70,237 @@ class MainFrame(wx.Frame):
 
         self.SetMenuBar(self.menuBar)
 
-    # This event handler can't be moved to bindings.py since controls bind to
-    # it dynamically as MainFrame is intitialized.
-    def onCommand(self, event):
-        bCmd = event.GetEventObject()
-        name = bCmd.GetLabel()
-        cmd = self.cmddict[name]
-        method = cmd['method']
-        args = cmd['args']
-        argdict = {}
-        for argname, argctrl in args.items():
-            try:
-                afunc = method.argdict[argname]['afunc']
-            except (AttributeError, KeyError):
-                afunc = lambda x: x
-            argdict[argname] = afunc(argctrl.GetValue())
-        retval = method(**argdict)
-        time.sleep(1.)
+    def onCommand(self, name, raw):
+        """
+        Condition the raw (string) argument values `raw` of the command
+        `name` and submit it to the dispatcher. Called by the command panel.
+        """
+        spec = self.registry[name]
+        try:
+            argdict = spec.conditioner(raw)
+        except ValueError as e:  # cp.ArgumentError
+            self.sbMain.SetStatusText('{0}: {1}'.format(name, e))
+            return
+        finish = self.make_finish(spec.ready, spec, spec.ready_timeout)
+        self.dispatcher.submit(name, argdict, callback=self.onCommandDone,
+                               executor=self.executor(spec), finish=finish)
+
+    def executor(self, spec):
+        """The executor of the command `spec` in this process. Commands of
+        isolated controllers are all called from threads, and run in the
+        worker process as they would otherwise."""
+        return 'thread' if self.isolated else spec.executor
+
+    def make_finish(self, ready=None, spec=None, timeout=None):
+        """
+        Make the function that waits for a command's output file to be
+        completely written. It runs in the worker thread.
+
+        `ready` and `timeout` are the command's `ready` and `ready_timeout`
+        options (see `cp.command`). If `ready` never returns True, the
+        function raises `readiness.NotReady` rather than plotting the file
+        unfinished. If the
+        command's `CommandSpec` `spec` is given, a generator (or, for
+        `cp.stream` commands, iterable) return value is instead streamed to
+        the plot until it is exhausted, and the `Stream` is returned. The
+        `RemoteStream`s of isolated controllers are plotted the same way.
+        """
+        controller = self.controller
+
+        def _finish(retval):
+            if isinstance(retval, RemoteStream):
+                wx.CallAfter(self.onStreamStart, spec.name, retval)
+                return retval.wait()
+            if spec is not None and isstream(retval, spec.stream is not None):
+                info = spec.stream or {}
+                s = Stream(info.get('columns'), info.get('maxblocks', 16),
+                           name=spec.name)
+                wx.CallAfter(self.onStreamStart, spec.name, s)
+                pump(retval, s)
+                return s
+            if (ready is True) or not isinstance(retval, string_types):
+                return retval
+            if ready is None:
+                wait_ready(retval)
+            elif not wait_ready(retval, timeout=timeout,
+                                ready=lambda: ready(controller, retval)):
+                raise NotReady('{0} was not ready after {1} s'.format(
+                    retval, timeout))
+            return retval
+        return _finish
+
+    def onCommandDone(self, name, future):
+        """
+        Handle the return value of a finished command. Called on the GUI
+        thread by the dispatcher.
+        """
+        try:
+            retval = future.result()
+        except NotReady as e:
+            if self:
+                self.sbMain.SetStatusText('{0}: {1}'.format(name, e))
+            return
+        except Exception as e:
+            print("{0} failed: {1!r}".format(name, e))
+            return
+        if isinstance(retval, (Stream, RemoteStream)):  # Already plotted
+            if self:
+                self.sbMain.SetStatusText('{0}: streamed {1} rows'.format(
+                    name, retval.nrows))
+            return
+        self.showResult(name, retval)
+
+    def showResult(self, name, retval):
+        """
+        Plot the file named by the return value `retval` of the command
+        `name`, with the command's reader, or print `retval` if it is not a
+        file name.
+        """
         try:
             try:
                 if not os.path.isfile(retval):
                     raise IOError
             except TypeError:
                 raise IOError
-            self.app.pyo.switch_file(retval)
-            self.app.pyo.plot()
+            pyo = self.app.pyo
+            self.stopStream()
+            spec = self.registry[name]
+            readerinfo = spec.reader
+            if readerinfo is None:
+                pyo.switch_file(retval)
+            else:
+                readerclass = spec.reader_class()
+                if (isinstance(pyo.reader, readerclass)
+                        and getattr(pyo.reader, 'follows', None)
+                        and pyo.reader.follows(retval)):
+                    # Tail mode reader is already reading this file, so the
+                    # plot timer picks up the appended data.
+                    return
+                pyo.switch_file(retval, readerclass, *readerinfo['args'],
+                                **readerinfo['kwargs'])
+            pyo.plot()
         except AttributeError:
-            print "PyOscope not yet initialized..."
+            print("PyOscope not yet initialized...")
+        except ValueError as e:  # Unknown reader
+            self.sbMain.SetStatusText('{0}: {1}'.format(name, e))
         except IOError:  # Print retval if standard return
-            print retval
-
-def trim(docstring):
-    """Trim a docstring according to PEP 257."""
-    if not docstring:
-        return ''
-    # Convert tabs to spaces (following the normal Python rules)
-    # and split into a list of lines:
-    lines = docstring.expandtabs().splitlines()
-    # Determine minimum indentation (first line doesn't count):
-    indent = sys.maxint
-    for line in lines[1:]:
-        stripped = line.lstrip()
-        if stripped:
-            indent = min(indent, len(line) - len(stripped))
-    # Remove indentation (first line is special):
-    trimmed = [lines[0].strip()]
-    if indent < sys.maxint:
-        for line in lines[1:]:
-            trimmed.append(line[indent:].rstrip())
-    # Strip off trailing and leading blank lines:
-    while trimmed and not trimmed[-1]:
-        trimmed.pop()
-    while trimmed and not trimmed[0]:
-        trimmed.pop(0)
-    # Return a single string:
-    return '\n'.join(trimmed)
\ No newline at end of file
+            print(retval)
+
+    def onStreamStart(self, name, stream):
+        """
+        Plot the `stream.Stream` (or `worker.RemoteStream`) of the command
+        `name`, which is being filled by the command in its worker thread
+        (or process). The stream plotted until now, if any, is closed,
+        which stops its command.
+        """
+        if not self:  # Frame already destroyed
+            stream.close()
+            return
+        self.stopStream()
+        self.stream = stream
+        try:
+            pyo = self.app.pyo
+            pyo.switch_file(stream, stream.reader_class)
+            pyo.plot()
+        except AttributeError:
+            print("PyOscope not yet initialized...")
+            self.stopStream()
+
+    def stopStream(self):
+        """Close the stream being plotted, if any."""
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+    def onSweep(self, name, raw):
+        """
+        Sweep the command `name` over the raw (string) argument values
+        `raw`, which may be ranges or lists (see `sweep`), or stop its
+        sweep if one is running. Called by the command panel.
+
+        The sweep runs in a worker thread, which pipelines the calls (see
+        the `concurrency` option of `cp.command`). Its progress is shown at
+        most a few times a second, with the latest result plotted. The
+        result is waited for (see `make_finish`) in a thread of its own,
+        which only takes the latest result when it is done with the last,
+        so the sweep never waits for it.
+        """
+        stop = self.sweeps.get(name)
+        if stop is not None:
+            stop.set()
+            self.sbMain.SetStatusText('{0}: stopping sweep...'.format(name))
+            return
+        spec = self.registry[name]
+        try:
+            points = sweep.make_points(spec, raw)
+        except ValueError as e:  # cp.ArgumentError
+            self.sbMain.SetStatusText('{0}: {1}'.format(name, e))
+            return
+
+        stop = self.sweeps[name] = threading.Event()
+        finish = self.make_finish(spec.ready, spec, spec.ready_timeout)
+        controller = self.controller
+
+        def _show(ndone, ntotal, retval):
+            try:
+                retval = finish(retval)
+            except Exception as e:  # E.g. readiness.NotReady
+                retval = e
+            wx.CallAfter(self.onSweepProgress, name, ndone, ntotal, retval)
+        latest = sweep.Latest(_show)
+
+        def _sweep():
+            start = time.time()
+            results = sweep.run(controller, spec, points,
+                                progress=latest.submit, stop=stop,
+                                executor=self.executor(spec))
+            return results, time.time() - start
+
+        self.pCommands.set_sweeping(name, True)
+        self.dispatcher.run(name, _sweep, callback=self.onSweepDone)
+
+    def onSweepProgress(self, name, ndone, ntotal, retval):
+        if not self:  # Frame already destroyed
+            return
+        if isinstance(retval, Exception):  # Not plotted
+            self.sbMain.SetStatusText('{0}: {1}/{2}: {3}'.format(
+                name, ndone, ntotal, retval))
+            return
+        if name in self.sweeps:  # Not yet reported done
+            self.sbMain.SetStatusText('{0}: {1}/{2}'.format(name, ndone,
+                                                            ntotal))
+        if isinstance(retval, (Stream, RemoteStream)):  # Already plotted
+            return
+        self.showResult(name, retval)
+
+    def onSweepDone(self, name, future):
+        """Report the end of the sweep of the command `name`. Called on the
+        GUI thread by the dispatcher."""
+        self.sweeps.pop(name, None)
+        if not self:
+            return
+        self.pCommands.set_sweeping(name, False)
+        try:
+            results, elapsed = future.result()
+        except sweep.SweepStopped as e:
+            self.sbMain.SetStatusText('{0}: {1}'.format(name, e))
+            return
+        except Exception as e:
+            self.sbMain.SetStatusText('{0}: sweep failed: {1!r}'.format(name,
+                                                                       e))
+            return
+        self.sbMain.SetStatusText(
+            '{0}: swept {1} points in {2:.2f} s'.format(name, len(results),
+                                                       elapsed))
+
+    def onCommandState(self, state):
+        """
+        Show the queued/running state of a command on its button and the
+        number of commands in flight in the status bar.
+        """
+        if not self:  # Frame already destroyed
+            return
+        self.pCommands.set_state(state.name, str(state) if state.busy else '')
+        nflight = self.dispatcher.in_flight()
+        self.sbMain.SetStatusText('{0} command(s) in flight'.format(nflight)
+                                  if nflight else '')
@@ -0,0 +1,168 @@
+"""
+Plot updating and redrawing for the CP GraphFrame.
+"""
+import numpy as np
+
+from gui.decimate import is_sorted, minmax
+
+
+class BlitRedrawer(object):
+    """
+    Updates the lines of a PyOscope plot with new data and redraws them.
+
+    The static parts of the figure (axes, ticks, labels, legends) are drawn
+    once and cached. On subsequent updates only the lines are drawn on top of
+    the cached background and blitted to the screen. The whole figure is
+    redrawn only when the axes limits, the plotted lines or the size of the
+    canvas change.
+
+    If `decimate` is True (default), each line with sorted x data is reduced
+    to a min/max envelope of about two points per pixel column of the current
+    view (see `gui.decimate.minmax`), so drawing time does not grow with the
+    number of points. The envelope is recomputed whenever the x limits
+    change, e.g. when zooming or panning with the navigation toolbar, so the
+    data is shown at full resolution when zoomed in far enough.
+    """
+    def __init__(self, pyo, canvas, decimate=True):
+        self.pyo = pyo
+        self.canvas = canvas
+        self.decimate = decimate
+        self.backgrounds = None
+        self.state = None
+        self.cid = canvas.mpl_connect('draw_event', self.on_draw)
+
+        self.full = {}     # line -> (x, y) of the undecimated data
+        self.watched = {}  # axes -> xlim_changed callback id
+
+    def update(self):
+        """
+        Read new data and redraw. Replaces `pyo._update()`, which would
+        schedule a full redraw of the canvas.
+        """
+        pyo = self.pyo
+        with pyo.lock:
+            if not pyo._initialized:
+                return
+            pyo.data = pyo.reader.update_data()
+            pyo.callback()
+            if pyo.mode == 'plot':
+                self.update_lines()
+                pyo.autoscale_axes()
+            self.draw()
+
+    def update_lines(self):
+        """Set the lines' data from `pyo.data`. See
+        `PyOscopeRealtime._update_plot_slow`."""
+        pyo = self.pyo
+        pdict = pyo._plotdict
+        ys = [self.column(yname) for yname in pdict['ynames']]
+        if pdict['oneD']:
+            for j, y in enumerate(ys):
+                pyo._update_line_slow(pyo.lines[0, j], y=y,
+                                      ytrans=pdict['ytrans'][j])
+        else:
+            xs = [self.column(xname) for xname in pdict['xnames']]
+            for i, x in enumerate(xs):
+                for j, y in enumerate(ys):
+                    pyo._update_line_slow(pyo.lines[i, j], x, y,
+                                          pdict['xtrans'][i],
+                                          pdict['ytrans'][j])
+        if self.decimate:
+            self.decimate_lines()
+
+    def decimate_lines(self):
+        """
+        Replace the data of every line by its min/max envelope for the
+        current view, keeping the full data to recompute it later.
+        """
+        full = {}
+        for line in self.lines():
+            x = np.asarray(line.get_xdata())
+            y = np.asarray(line.get_ydata())
+            if is_sorted(x):
+                full[line] = (x, y)
+        self.full = full
+        watched = {}
+        for ax in self.axes():
+            cid = self.watched.get(ax)
+            if cid is None:
+                cid = ax.callbacks.connect('xlim_changed',
+                                           self.on_xlim_changed)
+            watched[ax] = cid
+            self.on_xlim_changed(ax)
+        self.watched = watched  # Forget the axes of old plots
+
+    def on_xlim_changed(self, ax):
+        """Recompute the envelopes of the lines in `ax` for its new view."""
+        lo, hi = ax.get_xlim()
+        nbins = max(int(ax.bbox.width), 1)
+        for line in ax.lines:
+            try:
+                x, y = self.full[line]
+            except KeyError:
+                continue
+            line.set_data(*minmax(x, y, lo, hi, nbins))
+
+    def column(self, name):
+        """The data of column `name`, or the indices if `name` is None."""
+        data = self.pyo.data
+        if name is None:
+            return np.arange(len(data[data.columns[0]]))
+        return data[name]
+
+    def draw(self, full=False):
+        """
+        Redraw the canvas, by blitting the lines if possible. `full` forces
+        the whole figure to be redrawn.
+        """
+        if full or (self.backgrounds is None) or \
+                (self.get_state() != self.state):
+            for line in self.lines():
+                line.set_animated(True)
+            self.canvas.draw()  # Background is cached by on_draw
+        else:
+            self.blit()
+
+    def blit(self):
+        canvas = self.canvas
+        for ax, background in self.backgrounds:
+            canvas.restore_region(background)
+            self.draw_lines(ax)
+            canvas.blit(ax.bbox)
+
+    def on_draw(self, event):
+        """
+        Cache the background after every full draw, including those
+        triggered by resizing or the navigation toolbar, and draw the lines
+        on top of it.
+        """
+        axes = self.axes()
+        self.backgrounds = [(ax, self.canvas.copy_from_bbox(ax.bbox))
+                            for ax in axes]
+        self.state = self.get_state()
+        for ax in axes:
+            self.draw_lines(ax)
+
+    @staticmethod
+    def draw_lines(ax):
+        for line in ax.lines:
+            if line.get_animated():
+                ax.draw_artist(line)
+
+    def axes(self):
+        if self.pyo.axes is None:
+            return []
+        return list(np.ravel(self.pyo.axes))
+
+    def lines(self):
+        return [line for line in np.ravel(getattr(self.pyo, 'lines', []))
+                if line is not None]
+
+    def get_state(self):
+        """
+        Everything that requires a full redraw when it changes: the canvas
+        size, the plotted lines and the axes limits.
+        """
+        return (self.canvas.get_width_height(),
+                tuple(id(line) for line in self.lines()),
+                tuple(tuple(ax.viewLim.bounds) for ax in self.axes()))
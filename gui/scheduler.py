@@ -0,0 +1,58 @@
+"""
+Adaptive plot update scheduling for the CP GUI.
+"""
+import time
+
+
+class UpdateScheduler(object):
+    """
+    Decides how long to wait before the next plot update.
+
+    While the data is changing, updates run as often as `max_fps` allows, but
+    the GUI is always left at least as much idle time between updates as the
+    last draw took. While the data is not changing, the interval grows by a
+    factor of `backoff` per update, up to `1/min_fps`.
+
+    The timer is restarted only after an update has finished, so an update is
+    never queued while the previous draw is still running.
+
+    `fps` and `draw_time` are exponential moving averages of the effective
+    frame rate and of the time taken per draw (in seconds).
+    """
+    def __init__(self, max_fps=30., min_fps=2., backoff=1.5, smoothing=0.2):
+        self.max_fps = float(max_fps)
+        self.min_fps = float(min_fps)
+        self.backoff = backoff
+        self.smoothing = smoothing
+
+        self.interval = 1./self.max_fps
+        self.fps = 0.
+        self.draw_time = 0.
+        self.last_draw = None
+
+    def idle(self):
+        """
+        Record an update that was skipped because nothing changed. Returns
+        the interval (in seconds) until the next update.
+        """
+        self.interval = min(self.interval*self.backoff, 1./self.min_fps)
+        return self.interval
+
+    def drew(self, draw_time):
+        """
+        Record an update that took `draw_time` seconds to draw. Returns the
+        interval (in seconds) until the next update.
+        """
+        now = time.time()
+        if self.last_draw is not None:
+            period = now - self.last_draw
+            self.fps = self._average(self.fps, 1./max(period, 1e-6))
+        self.last_draw = now
+        self.draw_time = self._average(self.draw_time, draw_time)
+        self.interval = max(1./self.max_fps, draw_time)
+        return self.interval
+
+    def _average(self, average, value):
+        if not average:
+            return value
+        return average + self.smoothing*(value - average)
@@ -0,0 +1,223 @@
+"""
+headless.py
+jlazear
+
+Running cp controllers without the GUI.
+
+A `Session` exposes the commands of a controller instance, and their
+`argument` conditioning, to Python scripts without importing wx, matplotlib
+or pyoscope. `main` is a command line interface generated from the same
+metadata:
+
+    python -m cp mymodule:Ctrl                      # List the commands
+    python -m cp mymodule:Ctrl cmd2 --arg1 10       # Run cmd2
+    python -m cp mymodule:Ctrl cmd2 --arg1 0:10:0.5 --sweep  # Sweep arg1
+    python -m cp mymodule:Ctrl --serve 5555         # Serve (see `remote`)
+
+Sessions are made by instantiating a `Controller`-decorated class with the
+`CP_HEADLESS` environment variable set (e.g. `CP_HEADLESS=1`), by decorating
+it with `@Controller(headless=True)`, or explicitly:
+
+    s = Ctrl.headless()
+    s.call('cmd2', arg1='10')  # Raw (string) values, conditioned as in the GUI
+    s.cmd2(arg1=10)            # Direct call of the method
+    s.sweep('cmd2', arg1='0:10:0.5')  # Call for each value (see `sweep`)
+    s.close()                  # Close the controller's connections
+
+Sessions may also be used as context managers, which close them on exit.
+"""
+
+import argparse
+import os
+import sys
+import types
+
+import aio
+from cache import invalidate
+from registry import registry_for
+from resources import close_resources
+
+
+def headless_requested(headless=None):
+    """
+    True if controllers should run without the GUI: `headless` if it is not
+    None, otherwise whether the `CP_HEADLESS` environment variable is set to
+    anything but '', '0', 'false' or 'no'.
+    """
+    if headless is not None:
+        return bool(headless)
+    value = os.environ.get('CP_HEADLESS', '')
+    return value.strip().lower() not in ('', '0', 'false', 'no')
+
+
+class Session(object):
+    """
+    Headless front end for the controller instance `controller`.
+
+    `commands` is the `registry.Registry` of the controller's commands.
+    Attributes that are not defined by the session are looked up on the
+    controller, so commands may be called directly.
+    """
+    def __init__(self, controller):
+        self.controller = controller
+        self.commands = registry_for(type(controller))
+
+    def __getattr__(self, name):
+        if name == 'controller':  # Not yet set, e.g. while unpickling
+            raise AttributeError(name)
+        return getattr(self.controller, name)
+
+    def __dir__(self):
+        return sorted(set(dir(type(self)) + list(self.__dict__) +
+                          dir(self.controller)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the controller's connection pools (see `resources`)."""
+        close_resources(self.controller)
+
+    def args(self, name):
+        """List the (name, default) pairs of the arguments of command
+        `name`."""
+        return [(arg.name, arg.default) for arg in self.commands[name].args]
+
+    def invalidate(self, *names):
+        """Clear the caches of the commands `names`, or of all commands
+        (see `cache`)."""
+        invalidate(self.controller, *names)
+
+    def call(self, name, **raw):
+        """
+        Condition the raw (string) argument values `raw` of command `name`
+        as the GUI would, call the command and return its return value.
+        Raises `cp.ArgumentError` if an argument can't be conditioned.
+
+        Coroutine commands are run to completion on the shared event loop
+        (see `aio`).
+        """
+        conditioner = self.commands[name].conditioner
+        kwargs = conditioner(raw) if conditioner else raw
+        retval = getattr(self.controller, name)(**kwargs)
+        if aio.iscoroutine(retval):
+            retval = aio.run(retval)
+        return retval
+
+    def sweep(self, name, concurrency=None, progress=None, **sweeps):
+        """
+        Call command `name` for every combination of the raw values
+        `sweeps` of its arguments, which may be ranges or lists, e.g.
+        `session.sweep('measure', bias='0:1:0.01', gain='1, 2')`. Returns
+        the list of return values. See `sweep.run`.
+        """
+        import sweep
+        spec = self.commands[name]
+        points = sweep.make_points(spec, sweeps)
+        return sweep.run(self.controller, spec, points,
+                         concurrency=concurrency, progress=progress)
+
+
+def load_controller(spec):
+    """
+    Import the controller class named by `spec`, e.g. 'mymodule:Ctrl' or
+    'package.module:Ctrl', and return the undecorated class.
+    """
+    modname, sep, clsname = spec.partition(':')
+    if not (sep and modname and clsname):
+        raise ValueError("Expected 'module:Class', got {0!r}".format(spec))
+    if '' not in sys.path and os.getcwd() not in sys.path:
+        sys.path.insert(0, '')
+    __import__(modname)
+    obj = sys.modules[modname]
+    for attr in clsname.split('.'):
+        obj = getattr(obj, attr)
+    return getattr(obj, 'cls', obj)  # Unwrap `Controller`
+
+
+def make_parser(cls, prog=None):
+    """
+    Make an `argparse.ArgumentParser` with a subcommand for each command of
+    the controller class `cls`. Each argument of a command is an option,
+    which is required if the argument has no default. With `--sweep`, the
+    values may be ranges or lists (see `sweep`).
+
+    The values of the arguments are stored as `arg_<name>` in the parsed
+    namespace. Arguments named like an option of cp (e.g. `sweep`) take
+    precedence over it.
+    """
+    parser = argparse.ArgumentParser(
+        prog=prog, description=_first_line(cls.__doc__))
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+    for spec in registry_for(cls):
+        sub = subparsers.add_parser(spec.name, help=_first_line(spec.doc),
+                                    description=spec.doc,
+                                    conflict_handler='resolve')
+        if spec.args:
+            sub.add_argument('--sweep', action='store_true',
+                             help='call the command for every combination '
+                             'of the values, e.g. 0:10:0.5 or 1,2,5')
+            sub.add_argument('--concurrency', type=int, default=None,
+                             help='calls in flight at once when sweeping')
+        for arg in spec.args:
+            sub.add_argument('--' + arg.name, dest='arg_' + arg.name,
+                             required=arg.required, default=argparse.SUPPRESS,
+                             help=None if arg.required
+                             else 'default: {0!r}'.format(arg.default))
+    return parser
+
+
+def main(argv=None):
+    """
+    Run a command of a controller from the command line. See the module
+    docstring. Returns the exit status.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    prog = 'python -m cp'
+    if not argv or argv[0] in ('-h', '--help'):
+        sys.stdout.write('usage: {0} module:Class [command] [--arg value '
+                         '...]\n       {0} module:Class --serve '
+                         '[host:]port|path\n'.format(prog))
+        return 0 if argv else 2
+    cls = load_controller(argv[0])
+    if len(argv) == 3 and argv[1] == '--serve':
+        from remote import serve
+        with Session(cls()) as session:
+            serve(session.controller, argv[2])
+        return 0
+    parser = make_parser(cls, prog='{0} {1}'.format(prog, argv[0]))
+    if len(argv) == 1:
+        parser.print_help()
+        return 0
+    options = vars(parser.parse_args(argv[1:]))
+    name = options['command']
+    swept = options.get('sweep', False)
+    concurrency = options.get('concurrency')
+    options = dict((key[4:], value) for key, value in options.items()
+                   if key.startswith('arg_'))
+    from cp import ArgumentError
+    with Session(cls()) as session:
+        try:
+            if swept:
+                retvals = session.sweep(name, concurrency=concurrency,
+                                        **options)
+            else:
+                retval = session.call(name, **options)
+                # Streaming commands: print each block as it comes
+                retvals = retval if isinstance(retval, types.GeneratorType) \
+                    else [retval]
+        except ArgumentError as e:
+            parser.exit(2, '{0}: {1}\n'.format(name, e))
+        for retval in retvals:
+            if retval is not None:
+                sys.stdout.write('{0}\n'.format(retval))
+    return 0
+
+
+def _first_line(docstring):
+    lines = (docstring or '').strip().splitlines()
+    return lines[0] if lines else None
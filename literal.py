@@ -0,0 +1,167 @@
+"""
+literal.py
+jlazear
+
+Safe, fast parsers for argument values entered in the GUI.
+
+None of these parsers execute their input. Numeric arrays are parsed in a
+single vectorized step, so large pasted tables (e.g. waveforms with 100k
+entries) are converted quickly.
+
+`parse_literal` -- A Python literal (number, string, tuple, list, dict, set,
+                   bool or None), as by `ast.literal_eval`.
+`float_array`   -- Separated decimal numbers -> float64 NumPy array.
+`int_array`     -- Separated decimal integers -> int64 NumPy array.
+`hex_array`     -- Separated hex integers (optionally 0x-prefixed) -> int64
+                   NumPy array.
+`list_of_float` -- Separated decimal numbers -> list of floats.
+
+Integers that do not fit in an int64 raise ValueError in `int_array` and
+`hex_array`.
+
+Numbers in arrays may be separated by commas, semicolons or whitespace, and
+may be enclosed in brackets or parentheses, e.g. '[1, 2, 3]' or '1 2 3'.
+"""
+
+import ast
+import warnings
+
+import numpy as np
+
+from digits import DIGITS, decode_runs
+
+
+# Characters that may separate or enclose the numbers of an array
+_SEPARATORS = b' \t\r\n,;[]()'
+_ISSEP = np.zeros(256, dtype=bool)
+_ISSEP[np.frombuffer(_SEPARATORS, dtype=np.uint8)] = True
+_SEPTABLE = bytes(bytearray(ord(' ') if c in bytearray(_SEPARATORS) else c
+                            for c in range(256)))
+
+# Longer literals are first tried as flat lists of numbers
+_FASTPATH = 1000
+_NESTED = ('[', '(', ']', ')')
+
+
+def parse_literal(s):
+    """
+    Parse the Python literal `s`. Raises ValueError if `s` is not a literal.
+
+    Long flat lists or tuples of numbers are parsed with `float_array` or
+    `int_array` rather than `ast.literal_eval`. If they contain any floats,
+    all of their elements are returned as floats. Nested sequences are
+    always parsed by `ast.literal_eval`.
+    """
+    s = s.strip()
+    if (len(s) > _FASTPATH and s[:1] in '[(' and s[-1:] in '])'
+            and not any(c in s[1:-1] for c in _NESTED)):
+        try:
+            values = _parse_numbers(s)
+        except ValueError:
+            pass
+        else:
+            if _commas_ok(s[1:-1], len(values)):
+                values = values.tolist()
+                return values if s[0] == '[' else tuple(values)
+    try:
+        return ast.literal_eval(s)
+    except (SyntaxError, ValueError) as e:
+        raise ValueError('Not a literal: {0!r} ({1})'.format(_short(s), e))
+
+
+def float_array(s):
+    """Parse separated decimal numbers into a float64 array."""
+    return _fromstring(s, float)
+
+
+def int_array(s):
+    """Parse separated decimal integers into an int64 array."""
+    return _fromstring(s, np.int64)
+
+
+def hex_array(s):
+    """Parse separated hex integers, e.g. '0x1F, 0x20' or '1F 20', into an
+    int64 array."""
+    arr = np.frombuffer(_encode(s), dtype=np.uint8).copy()
+    digits = DIGITS[16][arr]
+    # Blank the 0x prefixes, which only start numbers
+    if len(arr) > 2:
+        start = np.concatenate(([True], _ISSEP[arr[:-3]]))
+        prefix = np.flatnonzero(start & (arr[:-2] == ord('0'))
+                                & ((arr[1:-1] | 0x20) == ord('x'))
+                                & (digits[2:] >= 0))
+        arr[prefix] = arr[prefix + 1] = ord(' ')
+        digits[prefix] = digits[prefix + 1] = -1
+    if ((digits < 0) & ~_ISSEP[arr]).any():
+        raise ValueError('Not an array of hex integers: '
+                         '{0!r}'.format(_short(s)))
+    return decode_runs(digits, 16)
+
+
+def list_of_float(s):
+    """Parse separated decimal numbers into a list of floats."""
+    return float_array(s).tolist()
+
+
+def _parse_numbers(s):
+    """Parse a flat sequence of numbers into an int64 array if they are all
+    integers, otherwise into a float64 array."""
+    text = _encode(s)
+    if any(c in text for c in (b'.', b'e', b'E', b'n', b'N')):
+        return _fromstring(text, float)
+    return _fromstring(text, np.int64)
+
+
+def _commas_ok(inner, n):
+    """Whether the `n` numbers of the flat sequence `inner` are separated by
+    commas, as in a Python literal, with an optional trailing comma."""
+    if ';' in inner:
+        return False
+    commas = inner.count(',')
+    if inner.rstrip().endswith(','):
+        return commas == n
+    return commas == n - 1 and n > 1
+
+
+def _fromstring(s, dtype):
+    text = _encode(s).translate(_SEPTABLE)
+    with warnings.catch_warnings():
+        # Raised for invalid numbers by recent NumPys; checked below
+        warnings.simplefilter('ignore', DeprecationWarning)
+        values = np.fromstring(text, dtype=dtype, sep=' ')
+    # fromstring stops at the first invalid number, so check that every
+    # token was parsed
+    isdata = ~_ISSEP[np.frombuffer(text, dtype=np.uint8)]
+    ntokens = np.count_nonzero(isdata[1:] & ~isdata[:-1]) + isdata[:1].sum()
+    if len(values) != ntokens:
+        raise ValueError('Not an array of numbers: {0!r}'.format(_short(s)))
+    if dtype is np.int64:
+        _check_range(values, text)
+    return values
+
+
+def _check_range(values, text):
+    """
+    Raise ValueError if any of the integers `values` parsed from `text` did
+    not fit in an int64. fromstring clamps those to the int64 limits, so
+    only values at the limits are parsed again, with Python integers.
+    """
+    limits = np.iinfo(np.int64)
+    clamped = np.flatnonzero((values == limits.max) | (values == limits.min))
+    if not len(clamped):
+        return
+    tokens = text.split()
+    for i in clamped:
+        value = int(tokens[i])
+        if not limits.min <= value <= limits.max:
+            raise ValueError('{0} does not fit in an int64'.format(value))
+
+
+def _encode(s):
+    if isinstance(s, bytes):
+        return s
+    return s.encode('ascii')
+
+
+def _short(s, n=40):
+    return s if len(s) <= n else s[:n] + '...'
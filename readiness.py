@@ -0,0 +1,192 @@
+"""
+readiness.py
+jlazear
+
+Detects when a command's output file has been completely written.
+
+A file is considered ready once it exists and has not been modified for a
+short settling period. On Linux the file's directory is watched with inotify,
+so modifications are seen as they happen. Elsewhere, or if inotify is not
+available, the file's size and modification time are polled.
+
+Example:
+
+    if wait_ready('cmd1.txt'):
+        pyo.switch_file('cmd1.txt')
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+
+SETTLE = 0.02   # s without modification before a file is considered ready
+TIMEOUT = 1.    # s to wait for a file to appear or to settle
+POLL = 0.005    # s between checks when polling
+
+# inotify constants, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct('iIII')  # wd, mask, cookie, len
+_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+_libc = None
+
+
+def _inotify():
+    """Return libc if it provides inotify, otherwise None."""
+    global _libc
+    if _libc is None:
+        _libc = False
+        if sys.platform.startswith('linux'):
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library('c'),
+                                   use_errno=True)
+                libc.inotify_init1.argtypes = [ctypes.c_int]
+                libc.inotify_add_watch.argtypes = [ctypes.c_int,
+                                                   ctypes.c_char_p,
+                                                   ctypes.c_uint32]
+                _libc = libc
+            except (OSError, AttributeError):
+                pass
+    return _libc or None
+
+
+class InotifyWatcher(object):
+    """
+    Watches a directory for modifications of the files in it.
+
+    Use as a context manager. Raises OSError if the watch can't be created.
+    """
+    def __init__(self, dirname):
+        libc = _inotify()
+        if libc is None:
+            raise OSError('inotify is not available')
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        wd = libc.inotify_add_watch(self.fd, _encode(dirname), _MASK)
+        if wd < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), 'inotify_add_watch failed')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        os.close(self.fd)
+
+    def events(self, timeout):
+        """
+        Wait up to `timeout` seconds for events. Returns a list of the names
+        (as bytes) of the files that were modified.
+        """
+        rlist, _, _ = select.select([self.fd], [], [], max(timeout, 0.))
+        if not rlist:
+            return []
+        buf = os.read(self.fd, 65536)
+        names = []
+        i = 0
+        while i < len(buf):
+            _, _, _, length = _EVENT.unpack_from(buf, i)
+            i += _EVENT.size
+            names.append(buf[i:i + length].rstrip(b'\0'))
+            i += length
+        return names
+
+
+class NotReady(Exception):
+    """Raised for an output file that never became ready."""
+    pass
+
+
+def wait_ready(fname, settle=SETTLE, timeout=None, ready=None):
+    """
+    Block until the file `fname` is ready to be read.
+
+    The file is ready once it exists and has not been modified for `settle`
+    seconds. If `ready` is specified, it is instead polled (called with no
+    arguments) until it returns True.
+
+    Waits at most `timeout` seconds: by default `TIMEOUT` for the file, and
+    without limit for `ready`. Returns True if the file is ready (or exists
+    but is still being modified when `timeout` runs out), otherwise False.
+    """
+    if ready is not None:
+        deadline = None if timeout is None else time.time() + timeout
+        while not ready():
+            if deadline is not None and time.time() >= deadline:
+                return False
+            time.sleep(POLL)
+        return True
+
+    deadline = time.time() + (TIMEOUT if timeout is None else timeout)
+    try:
+        watcher = InotifyWatcher(os.path.dirname(os.path.abspath(fname)))
+    except OSError:
+        return _wait_polling(fname, settle, deadline)
+    with watcher:
+        return _wait_inotify(fname, settle, deadline, watcher)
+
+
+def _wait_inotify(fname, settle, deadline, watcher):
+    base = _encode(os.path.basename(fname))
+    # The watch is in place before this check, so no modification is missed
+    exists = os.path.exists(fname)
+    last = time.time()
+    while True:
+        now = time.time()
+        if now >= deadline:
+            return exists
+        if exists and (now - last) >= settle:
+            return True
+        if exists:
+            wait = min(settle - (now - last), deadline - now)
+        else:
+            wait = deadline - now
+        if base in watcher.events(wait):
+            last = time.time()
+            exists = os.path.exists(fname)
+
+
+def _wait_polling(fname, settle, deadline):
+    sig = _signature(fname)
+    last = time.time()
+    while True:
+        now = time.time()
+        if now >= deadline:
+            return sig is not None
+        if (sig is not None) and (now - last) >= settle:
+            return True
+        time.sleep(POLL)
+        newsig = _signature(fname)
+        if newsig != sig:
+            sig = newsig
+            last = time.time()
+
+
+def _signature(fname):
+    """(size, mtime) of `fname`, or None if it does not exist."""
+    try:
+        st = os.stat(fname)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime
+
+
+def _encode(path):
+    if isinstance(path, bytes):
+        return path
+    return path.encode(sys.getfilesystemencoding())
@@ -0,0 +1,211 @@
+"""
+registry.py
+jlazear
+
+Command metadata of cp controllers.
+
+The `command`, `argument` and `reader` decorators attach their metadata to
+the decorated methods. `Registry` collects it once per controller class into
+immutable `CommandSpec` and `ArgSpec` objects, which the GUI, the headless
+API and any other front end use instead of introspecting the controller.
+The registry is built from the class dictionaries only, so no attribute of
+the controller (e.g. a property that talks to hardware) is ever evaluated.
+
+Example:
+
+    reg = registry_for(Ctrl)
+    for spec in reg:
+        print(spec.name, [(arg.name, arg.default) for arg in spec.args])
+    kwargs = reg['cmd2'].conditioner({'arg1': '10'})
+"""
+
+import inspect
+
+
+class NoDefault(object):
+    """Default value of the arguments that have none."""
+    def __str__(self):
+        return 'NoDefault'
+
+    __repr__ = __str__
+
+
+class _Frozen(object):
+    """Base of the immutable metadata classes."""
+    __slots__ = ()
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            object.__setattr__(self, name, values[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError("{0} is immutable".format(type(self).__name__))
+
+    def __delattr__(self, name):
+        raise AttributeError("{0} is immutable".format(type(self).__name__))
+
+    def __repr__(self):
+        return '{0}({1})'.format(type(self).__name__, ', '.join(
+            '{0}={1!r}'.format(name, getattr(self, name))
+            for name in self.__slots__[:2]))
+
+
+class ArgSpec(_Frozen):
+    """
+    An argument of a command.
+
+    `name`      -- Name of the argument.
+    `default`   -- Default value, or a `NoDefault` instance.
+    `converter` -- Conditioning function given by `argument`, or None.
+    `options`   -- Dict of the additional keyword arguments of `argument`.
+    """
+    __slots__ = ('name', 'default', 'converter', 'options')
+
+    @property
+    def required(self):
+        return isinstance(self.default, NoDefault)
+
+
+class CommandSpec(_Frozen):
+    """
+    A command of a controller.
+
+    `name`        -- Name of the command method.
+    `args`        -- Tuple of the `ArgSpec`s of its arguments (except
+                     `self`), in order.
+    `doc`         -- Its docstring, or ''.
+    `options`     -- Dict of the keyword arguments of `command`.
+    `conditioner` -- Function conditioning a dict of raw argument values.
+                     See `cp.argument`.
+    `reader`      -- The metadata of its `reader` decorator, or None. Use
+                     `reader_class` to get the reader class.
+    `stream`      -- The metadata of its `stream` decorator (a dict of its
+                     `columns`, `maxblocks` and `capacity`), or None.
+    `function`    -- The (undecorated by `Controller`) command function.
+    """
+    __slots__ = ('name', 'args', 'doc', 'options', 'conditioner', 'reader',
+                 'stream', 'function')
+
+    @property
+    def executor(self):
+        return self.options.get('executor', 'thread')
+
+    @property
+    def ready(self):
+        return self.options.get('ready')
+
+    @property
+    def ready_timeout(self):
+        return self.options.get('ready_timeout')
+
+    def reader_class(self):
+        """The reader class of the command, or None to use the default."""
+        if self.reader is None:
+            return None
+        from cp import reader_class
+        return reader_class(self.reader)
+
+
+class Registry(object):
+    """
+    The commands of the controller class `cls`, sorted by name. Iterating
+    over a registry yields `CommandSpec`s, and `registry[name]` is the
+    `CommandSpec` of the command `name`.
+
+    Raises ValueError if a command invalidates (see `cp.command`) a command
+    that `cls` does not have.
+    """
+    __slots__ = ('cls', 'commands', '_byname')
+
+    def __init__(self, cls):
+        self.cls = cls
+        functions = find_commands(cls)
+        self.commands = tuple(make_spec(name, functions[name])
+                              for name in sorted(functions))
+        self._byname = dict((spec.name, spec) for spec in self.commands)
+        for spec in self.commands:
+            unknown = [name for name in spec.options.get('invalidates', ())
+                       if name not in self._byname]
+            if unknown:
+                raise ValueError('{0}.{1} invalidates unknown commands: '
+                                 '{2}'.format(cls.__name__, spec.name,
+                                              ', '.join(unknown)))
+
+    def __iter__(self):
+        return iter(self.commands)
+
+    def __len__(self):
+        return len(self.commands)
+
+    def __contains__(self, name):
+        return name in self._byname
+
+    def __getitem__(self, name):
+        try:
+            return self._byname[name]
+        except KeyError:
+            raise KeyError('{0!r} is not a command of {1}'.format(
+                name, self.cls.__name__))
+
+    def names(self):
+        return [spec.name for spec in self.commands]
+
+
+def registry_for(cls):
+    """
+    The `Registry` of the controller class `cls`. It is built the first time
+    this is called for `cls` (or when `cls` is decorated with `Controller`)
+    and stored on the class.
+    """
+    cls = getattr(cls, 'cls', cls)  # Unwrap `Controller`
+    reg = vars(cls).get('_cp_registry')
+    if reg is None:
+        reg = Registry(cls)
+        cls._cp_registry = reg
+    return reg
+
+
+def find_commands(cls):
+    """
+    Find the `command` functions of the class `cls`, including inherited
+    ones, in its class dictionaries. Returns a dict of them by name.
+    """
+    commands = {}
+    for klass in reversed(inspect.getmro(cls)):
+        for name, value in vars(klass).items():
+            if getattr(value, 'command', False) is True:
+                commands[name] = value
+            else:
+                commands.pop(name, None)  # Overridden by a non-command
+    return commands
+
+
+def make_spec(name, f):
+    """
+    Make the `CommandSpec` of the command function `f`. Raises ValueError
+    if an `argument` decorator names an argument that `f` does not have.
+    """
+    argdict = getattr(f, 'argdict', {})
+    argspec = f.argspec
+    names = argspec.args[1:]
+    unknown = sorted(key for key in argdict
+                     if not key.startswith('_') and key not in names)
+    if unknown and argspec.keywords is None:
+        raise ValueError('{0} has no arguments named {1}'.format(
+            name, ', '.join(unknown)))
+    defaults = argspec.defaults or ()
+    nodefault = len(names) - len(defaults)
+    args = []
+    for i, argname in enumerate(names):
+        default = defaults[i - nodefault] if i >= nodefault else NoDefault()
+        options = dict(argdict.get(argname, {}))
+        converter = options.pop('afunc', None)
+        args.append(ArgSpec(name=argname, default=default,
+                            converter=converter, options=options))
+    return CommandSpec(name=name, args=tuple(args),
+                       doc=f.__doc__ or '',
+                       options=dict(getattr(f, 'cmdopts', {})),
+                       conditioner=getattr(f, 'conditioner', None),
+                       reader=argdict.get('_reader'),
+                       stream=argdict.get('_stream'),
+                       function=f)
@@ -0,0 +1,658 @@
+"""
+remote.py
+jlazear
+
+Remote control of cp controllers over TCP or Unix sockets.
+
+`Server` exposes the commands of a controller instance, their argument
+metadata (see `registry`) and the data of their streams (see `stream`) to
+any number of clients at once. `Client` is a thin, thread-safe client that
+pipelines requests: any number may be in flight on one connection, and the
+replies are matched to them as they arrive.
+
+    python -m cp mymodule:Ctrl --serve 5555          # Serve on localhost
+    python -m cp mymodule:Ctrl --serve /tmp/ctrl.sock
+
+    c = Client(('127.0.0.1', 5555))
+    c.commands()                        # [{'name': 'cmd1', 'args': ...}, ...]
+    c.call('cmd2', arg1='10')           # Conditioned like the GUI's input
+    futures = [c.submit('cmd2', arg1=i) for i in range(100)]  # Pipelined
+    for block in c.stream('acquire'):   # Streaming commands
+        print(block['t'][-1])
+
+Messages are framed by a 4-byte big-endian length and a codec byte, followed
+by the message, a dict, encoded with msgpack ('M') if it is installed and
+JSON ('J') otherwise. The server answers in the codec of each request.
+NumPy arrays are sent as raw bytes, which JSON carries base64-encoded.
+
+Requests are {'id': n, 'op': op, ...}, with op one of
+
+    'commands'  -> {'id', 'ok', 'value': [command metadata, ...]}
+    'call'      -> {'id', 'ok', 'value'} with 'name' and 'kwargs'. String
+                   values are conditioned by the command's `argument`s.
+                   Streaming commands reply {'id', 'ok', 'stream': True,
+                   'columns'}, then {'id', 'block': {column: array}} per
+                   block, then {'id', 'done': True, 'nrows'}.
+    'cancel'    -> Stops the stream of the call 'id'.
+    'ping'      -> {'id', 'ok', 'value': 'pong'}
+
+and failed requests are answered {'id', 'ok': False, 'error', 'type'}.
+
+The server runs on the shared asyncio event loop (see `aio`), so it requires
+Python 3; blocking commands run on a thread pool, coroutine commands on the
+loop. The client works with Python 2 and 3.
+"""
+
+import base64
+import json
+import socket
+import struct
+import sys
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import aio
+from registry import registry_for
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+_LENGTH = struct.Struct('>I')
+MAX_FRAME = 1 << 30
+
+
+class RemoteError(Exception):
+    """
+    An exception raised by a command on the server, or a failed request.
+    `type` is the name of the exception's class.
+    """
+    def __init__(self, message, type=None):
+        Exception.__init__(self, message)
+        self.type = type
+
+
+# Framing and encoding --------------------------------------------------------
+
+def _default_codec():
+    return b'M' if msgpack is not None else b'J'
+
+
+def encode(message, codec=None):
+    """The frame of the dict `message`, in `codec` (b'M' or b'J')."""
+    codec = codec or _default_codec()
+    message = _to_wire(message, codec)
+    if codec == b'M':
+        body = msgpack.packb(message, use_bin_type=True)
+    else:
+        body = json.dumps(message, separators=(',', ':')).encode('utf-8')
+    return _LENGTH.pack(len(body) + 1) + codec + body
+
+
+def decode(codec, body):
+    """The message of a frame's `codec` and `body`."""
+    if codec == b'M':
+        if msgpack is None:
+            raise RemoteError('msgpack frame received, but msgpack is not '
+                              'installed')
+        message = msgpack.unpackb(body, raw=False)
+    elif codec == b'J':
+        message = json.loads(body.decode('utf-8'))
+    else:
+        raise RemoteError('Unknown codec {0!r}'.format(codec))
+    return _from_wire(message)
+
+
+class FrameBuffer(object):
+    """Splits a byte stream into frames. `feed` returns the (codec, body)
+    of each complete frame."""
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        buf = self.buffer
+        buf.extend(data)
+        frames = []
+        start = 0
+        while len(buf) - start >= _LENGTH.size:
+            length = _LENGTH.unpack_from(buf, start)[0]
+            if not 0 < length <= MAX_FRAME:
+                raise RemoteError('Invalid frame length {0}'.format(length))
+            end = start + _LENGTH.size + length
+            if len(buf) < end:
+                break
+            body = bytes(buf[start + _LENGTH.size:end])
+            frames.append((body[:1], body[1:]))
+            start = end
+        if start:
+            del buf[:start]
+        return frames
+
+
+def _to_wire(value, codec):
+    """Convert `value` to types that `codec` can encode. NumPy arrays and
+    scalars are converted, and anything unknown is sent as its repr. Arrays
+    of objects or records are sent as (nested) lists."""
+    if value is None or isinstance(value, (bool, float, type(u''))):
+        return value
+    if isinstance(value, int) or type(value).__name__ == 'long':
+        return value
+    if isinstance(value, bytes):
+        if codec == b'M':
+            return value
+        try:
+            return value.decode('utf-8')
+        except UnicodeDecodeError:
+            return {'__bytes__': base64.b64encode(value).decode('ascii')}
+    if isinstance(value, dict):
+        return dict((_key(k), _to_wire(v, codec)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return [_to_wire(v, codec) for v in value]
+    if type(value).__module__ == 'numpy':
+        if hasattr(value, 'tobytes') and getattr(value, 'ndim', 0):
+            if value.dtype.hasobject or value.dtype.names:
+                return _to_wire(value.tolist(), codec)
+            data = value.tobytes()
+            if codec != b'M':
+                data = base64.b64encode(data).decode('ascii')
+            return {'__ndarray__': value.dtype.str,
+                    'shape': list(value.shape), 'data': data}
+        return _to_wire(value.item(), codec)
+    return repr(value)
+
+
+def _key(key):
+    return key if isinstance(key, (type(u''), str)) else str(key)
+
+
+def _from_wire(value):
+    if isinstance(value, dict):
+        if '__ndarray__' in value:
+            import numpy as np
+            data = value['data']
+            if not isinstance(data, bytes):
+                data = base64.b64decode(data)
+            return np.frombuffer(data, value['__ndarray__']).reshape(
+                value['shape'])
+        if '__bytes__' in value:
+            return base64.b64decode(value['__bytes__'])
+        return dict((k, _from_wire(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return [_from_wire(v) for v in value]
+    return value
+
+
+def parse_address(text):
+    """'host:port' or 'port' (on localhost) -> (host, port); anything else
+    is the path of a Unix socket."""
+    host, sep, port = text.rpartition(':')
+    if port.isdigit():
+        return (host or '127.0.0.1', int(port))
+    return text
+
+
+# Server ----------------------------------------------------------------------
+
+def describe(spec):
+    """The metadata of the command `spec` sent to clients."""
+    return {'name': spec.name,
+            'doc': spec.doc,
+            'args': [{'name': arg.name,
+                      'required': arg.required,
+                      'default': None if arg.required else arg.default}
+                     for arg in spec.args],
+            'group': spec.options.get('group', ''),
+            'executor': spec.executor,
+            'stream': spec.stream is not None}
+
+
+class Server(object):
+    """
+    Serves the commands of `controller` on `address`: a (host, port) tuple
+    for TCP (port 0 picks a free port), or the path of a Unix socket.
+
+    Blocking commands run on a pool of `workers` threads, shared by all of
+    the clients, so at most that many run at once. A streaming command
+    keeps at most `maxblocks` blocks queued for a slow client before it
+    waits for the client.
+    """
+    def __init__(self, controller, address=('127.0.0.1', 0), workers=8,
+                 maxblocks=16):
+        self.controller = controller
+        self.registry = registry_for(type(controller))
+        self.commands = [describe(spec) for spec in self.registry]
+        self.maxblocks = maxblocks
+        self.pool = ThreadPoolExecutor(workers)
+        self.loop = aio.event_loop()
+        self.connections = set()
+        if isinstance(address, tuple):
+            coro = self.loop.loop.create_server(self._connect, *address)
+        else:
+            coro = self.loop.loop.create_unix_server(self._connect, address)
+        self.server = self.loop.run(coro)
+        self.address = self.server.sockets[0].getsockname()
+
+    def __repr__(self):
+        return '<Server on {0}: {1} connections>'.format(
+            self.address, len(self.connections))
+
+    def _connect(self):
+        return _Connection(self)
+
+    def close(self):
+        """Stop accepting connections, and close those open."""
+        def _close():
+            self.server.close()
+            for conn in list(self.connections):
+                conn.transport.close()
+        self.loop.loop.call_soon_threadsafe(_close)
+        self.pool.shutdown(wait=False)
+
+    def serve_forever(self):
+        """Block until interrupted (e.g. by Ctrl-C), then close."""
+        try:
+            while self.loop.thread.is_alive():
+                self.loop.thread.join(1.)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+
+class _Connection(object):
+    """A client connection. An `asyncio.Protocol`; all of its methods run on
+    the event loop, except `_pump`."""
+    def __init__(self, server):
+        self.server = server
+        self.frames = FrameBuffer()
+        self.streams = {}          # Request id -> threading.Event (stop)
+        self.paused = False
+        self.waiting = deque()     # Frames held while paused, in order
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        sock = transport.get_extra_info('socket')
+        if sock is not None and sock.family in (socket.AF_INET,
+                                                socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.connections.add(self)
+
+    def connection_lost(self, exc):
+        self.server.connections.discard(self)
+        for stop in self.streams.values():
+            stop.set()
+        while self.waiting:
+            sent = self.waiting.popleft()[1]
+            if sent is not None:
+                sent.release()
+
+    def eof_received(self):
+        return False
+
+    def pause_writing(self):
+        self.paused = True
+
+    def resume_writing(self):
+        self.paused = False
+        while self.waiting and not self.paused:
+            frame, sent = self.waiting.popleft()
+            self.transport.write(frame)
+            if sent is not None:
+                sent.release()
+
+    def data_received(self, data):
+        try:
+            frames = self.frames.feed(data)
+        except RemoteError:
+            self.transport.close()
+            return
+        for codec, body in frames:
+            msgid = None
+            try:
+                request = decode(codec, body)
+                msgid = request.get('id')
+                self.handle(codec, msgid, request)
+            except Exception as e:
+                self.reply(codec, msgid, error=e)
+
+    def reply(self, codec, msgid, value=None, error=None, **extra):
+        if self.transport.is_closing():
+            return
+        if error is not None:
+            message = {'id': msgid, 'ok': False, 'error': str(error),
+                       'type': type(error).__name__}
+        else:
+            message = {'id': msgid, 'ok': True, 'value': value}
+            message.update(extra)
+        try:
+            frame = encode(message, codec)
+        except Exception as e:
+            frame = encode({'id': msgid, 'ok': False, 'type': 'TypeError',
+                            'error': 'Reply could not be encoded: '
+                                     '{0!r}'.format(e)}, codec)
+        self._write(frame)
+
+    def handle(self, codec, msgid, request):
+        op = request.get('op')
+        if op == 'call':
+            self.call(codec, msgid, request['name'],
+                      request.get('kwargs') or {})
+        elif op == 'commands':
+            self.reply(codec, msgid, self.server.commands)
+        elif op == 'cancel':
+            stop = self.streams.get(msgid)
+            if stop is not None:
+                stop.set()
+        elif op == 'ping':
+            self.reply(codec, msgid, 'pong')
+        else:
+            raise RemoteError('Unknown op {0!r}'.format(op))
+
+    def call(self, codec, msgid, name, kwargs):
+        spec = self.server.registry[name]  # KeyError if not a command
+        raw = dict((k, v) for k, v in kwargs.items()
+                   if isinstance(v, type(u'')))
+        if raw and spec.conditioner is not None:
+            kwargs.update(spec.conditioner(raw))
+        method = getattr(self.server.controller, name)
+        loop = self.server.loop.loop
+        if spec.executor == 'async':
+            future = loop.create_task(method(**kwargs))
+        else:
+            future = loop.run_in_executor(self.server.pool,
+                                          lambda: method(**kwargs))
+        future.add_done_callback(
+            lambda f: self.returned(codec, msgid, spec, f))
+
+    def returned(self, codec, msgid, spec, future):
+        try:
+            retval = future.result()
+        except Exception as e:
+            self.reply(codec, msgid, error=e)
+            return
+        from stream import isstream
+        if not isstream(retval, spec.stream is not None):
+            self.reply(codec, msgid, retval)
+            return
+        stop = self.streams[msgid] = threading.Event()
+        loop = self.server.loop.loop
+        done = loop.run_in_executor(
+            self.server.pool,
+            lambda: self._pump(codec, msgid, spec, retval, stop))
+
+        def _done(f):
+            self.streams.pop(msgid, None)
+            try:
+                nrows = f.result()
+            except Exception as e:
+                self.reply(codec, msgid, error=e)
+                return
+            self.send({'id': msgid, 'done': True, 'nrows': nrows}, codec)
+        done.add_done_callback(_done)
+
+    def send(self, message, codec):
+        if not self.transport.is_closing():
+            self._write(encode(message, codec))
+
+    def _pump(self, codec, msgid, spec, iterable, stop):
+        """
+        Send the blocks of a stream, in a worker thread. At most
+        `maxblocks` blocks are waiting to be sent at any time.
+        """
+        from stream import Stream
+        info = spec.stream or {}
+        converter = Stream(info.get('columns'))  # Only converts the blocks
+        slots = threading.Semaphore(self.server.maxblocks)
+        loop = self.server.loop.loop
+        nrows = 0
+        try:
+            for block in iterable:
+                columns = converter.columns_of(block)
+                if nrows == 0:
+                    loop.call_soon_threadsafe(
+                        lambda: self.reply(codec, msgid, None, stream=True,
+                                           columns=converter.columns))
+                message = {'id': msgid,
+                           'block': dict(zip(converter.columns, columns))}
+                frame = encode(message, codec)  # Off of the loop
+                slots.acquire()
+                if stop.is_set():
+                    slots.release()
+                    break
+                loop.call_soon_threadsafe(self._write, frame, slots)
+                nrows += len(columns[0])
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
+        if nrows == 0:
+            loop.call_soon_threadsafe(
+                lambda: self.reply(codec, msgid, None, stream=True,
+                                   columns=converter.columns or []))
+        return nrows
+
+    def _write(self, frame, sent=None):
+        """
+        Write `frame` after the frames held while paused, so that e.g. the
+        end of a stream never overtakes its last blocks. The semaphore
+        `sent`, if any, is released once the frame is handed to the
+        transport (or dropped).
+        """
+        if self.transport.is_closing():
+            pass
+        elif self.paused or self.waiting:
+            self.waiting.append((frame, sent))
+            return
+        else:
+            self.transport.write(frame)
+        if sent is not None:
+            sent.release()
+
+
+def serve(controller, address, workers=8):
+    """Serve `controller` on `address` (see `parse_address`) until
+    interrupted."""
+    if not isinstance(address, tuple):
+        address = parse_address(str(address))
+    server = Server(controller, address, workers=workers)
+    sys.stderr.write('Serving {0} on {1}\n'.format(
+        type(controller).__name__, server.address))
+    server.serve_forever()
+
+
+# Client ----------------------------------------------------------------------
+
+class Client(object):
+    """
+    A connection to a `Server` at `address`: a (host, port) tuple, the path
+    of a Unix socket, or a string for `parse_address`.
+
+    All methods may be called from any thread. `submit` and `stream` send
+    their request and return immediately, so any number of requests may be
+    in flight. Requests raise `RemoteError` if the server reports an error
+    or the connection is lost, and time out after `timeout` seconds (None:
+    never).
+    """
+    def __init__(self, address, timeout=None, codec=None):
+        if not isinstance(address, tuple):
+            address = parse_address(address)
+        if isinstance(address, tuple):
+            self.sock = socket.create_connection(address)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        else:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(address)
+        self.address = address
+        self.timeout = timeout
+        self.codec = codec or _default_codec()
+        self.lock = threading.Lock()   # Guards sending and `pending`
+        self.pending = {}              # Request id -> Future or RemoteStream
+        self.lastid = 0
+        self.closed = False
+        self.receiver = threading.Thread(target=self._receive,
+                                         name='cp-remote-client')
+        self.receiver.daemon = True
+        self.receiver.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _request(self, message, waiter):
+        with self.lock:
+            if self.closed:
+                raise RemoteError('Connection closed')
+            self.lastid += 1
+            msgid = message['id'] = self.lastid
+            self.pending[msgid] = waiter
+            self.sock.sendall(encode(message, self.codec))
+        return msgid
+
+    def submit(self, name, **kwargs):
+        """Call the command `name` with `kwargs`. Returns a
+        `concurrent.futures.Future` for its return value."""
+        future = Future()
+        self._request({'op': 'call', 'name': name, 'kwargs': kwargs},
+                      future)
+        return future
+
+    def call(self, name, **kwargs):
+        """
+        Call the command `name` and return its return value. String values
+        in `kwargs` are conditioned like the GUI's input (see `cp.argument`);
+        others are passed as they are.
+        """
+        return self.submit(name, **kwargs).result(self.timeout)
+
+    def commands(self):
+        """The metadata of the server's commands, as a list of dicts."""
+        future = Future()
+        self._request({'op': 'commands'}, future)
+        return future.result(self.timeout)
+
+    def ping(self):
+        future = Future()
+        self._request({'op': 'ping'}, future)
+        return future.result(self.timeout)
+
+    def stream(self, name, **kwargs):
+        """Call the streaming command `name`. Returns a `RemoteStream`,
+        an iterator of its blocks."""
+        stream = RemoteStream(self)
+        stream.id = self._request({'op': 'call', 'name': name,
+                                   'kwargs': kwargs}, stream)
+        return stream
+
+    def cancel(self, msgid):
+        with self.lock:
+            if not self.closed:
+                self.sock.sendall(encode({'op': 'cancel', 'id': msgid},
+                                         self.codec))
+
+    def _receive(self):
+        frames = FrameBuffer()
+        try:
+            while True:
+                data = self.sock.recv(1 << 16)
+                if not data:
+                    break
+                for codec, body in frames.feed(data):
+                    self._dispatch(decode(codec, body))
+        except (socket.error, RemoteError, ValueError):
+            pass
+        with self.lock:
+            self.closed = True
+            pending, self.pending = self.pending, {}
+        error = RemoteError('Connection closed')
+        for waiter in pending.values():
+            if isinstance(waiter, RemoteStream):
+                waiter._put(error)
+            elif not waiter.done():
+                waiter.set_exception(error)
+
+    def _dispatch(self, message):
+        msgid = message.get('id')
+        with self.lock:
+            waiter = self.pending.get(msgid)
+            streaming = isinstance(waiter, RemoteStream)
+            # A stream's request is done once it ends, or if it fails or
+            # the command does not stream after all
+            if not (streaming and message.get('ok', True) and
+                    ('block' in message or message.get('stream'))):
+                self.pending.pop(msgid, None)
+        if waiter is None:
+            return
+        if message.get('stream') and not streaming:
+            self.cancel(msgid)
+            waiter.set_exception(RemoteError(
+                'Streaming command; use Client.stream', 'TypeError'))
+        elif not message.get('ok', True):
+            error = RemoteError(message.get('error'), message.get('type'))
+            if isinstance(waiter, RemoteStream):
+                waiter._put(error)
+            else:
+                waiter.set_exception(error)
+        elif isinstance(waiter, RemoteStream):
+            waiter._put(message)
+        else:
+            waiter.set_result(message.get('value'))
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.sock.close()
+
+
+class RemoteStream(object):
+    """
+    The blocks streamed by a command called with `Client.stream`. Iterating
+    yields each block as a dict of arrays by column name; `columns` is set
+    once the first message arrived. `cancel` stops the command.
+    """
+    def __init__(self, client):
+        self.client = client
+        self.id = None
+        self.columns = None
+        self.nrows = None
+        self.queue = queue.Queue()
+
+    def _put(self, item):
+        self.queue.put(item)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while True:
+            item = self.queue.get(timeout=self.client.timeout)
+            if isinstance(item, Exception):
+                raise item
+            if item.get('stream'):
+                self.columns = item.get('columns')
+            elif 'block' in item:
+                return item['block']
+            elif item.get('done'):
+                self.nrows = item.get('nrows')
+                raise StopIteration
+            elif 'value' in item:  # Not a streaming command after all
+                raise RemoteError('{0} did not stream'.format(self.id))
+
+    next = __next__
+
+    def cancel(self):
+        self.client.cancel(self.id)
@@ -0,0 +1,374 @@
+"""
+resources.py
+jlazear
+
+Managed hardware connections for cp controllers.
+
+Instead of opening a connection to an instrument in every command, declare
+it once with the `resource` decorator. The decorated method opens a new
+connection; the controller gets a `Pool` in its place that opens connections
+only when needed and reuses them across commands. Connections that failed
+are discarded and transparently reopened, idle connections are checked
+before they are reused, and all of them are closed when the GUI is closed
+(or a headless session is closed, see `close_resources`).
+
+`TCPTransport` is a simple line-oriented TCP connection. `SerialTransport`
+is its serial port equivalent (requires pyserial). Any object with a
+`close` method may be pooled.
+
+Example:
+
+    @Controller
+    class Ctrl(object):
+        @resource
+        def scope(self):
+            return TCPTransport('192.168.1.10', 5025)
+
+        @resource(size=4, retries=1)
+        def daq(self):
+            return TCPTransport('192.168.1.11', 5025)
+
+        @command
+        def idn(self):
+            return self.scope.query(b'*IDN?')
+
+        @command
+        def configure(self, rate=1000):
+            with self.daq.connection() as conn:  # One connection throughout
+                conn.write('RATE {0}'.format(rate).encode())
+                return conn.query(b'RATE?')
+"""
+
+import select
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+
+class TransportError(IOError):
+    """Raised when a connection fails or is closed by the other end."""
+    pass
+
+
+class TCPTransport(object):
+    """
+    A line-oriented TCP connection. `terminator` ends every message written
+    and read. Nagle's algorithm is disabled, so short queries are sent
+    immediately.
+    """
+    def __init__(self, host, port, timeout=5., terminator=b'\n'):
+        self.address = (host, port)
+        self.terminator = terminator
+        self.sock = socket.create_connection(self.address, timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._buffer = b''
+
+    def write(self, data):
+        """Send `data`, followed by the terminator."""
+        try:
+            self.sock.sendall(data + self.terminator)
+        except socket.error as e:
+            raise TransportError(e)
+
+    def read(self):
+        """Read a message, up to the terminator, which is stripped."""
+        terminator = self.terminator
+        while terminator not in self._buffer:
+            try:
+                chunk = self.sock.recv(65536)
+            except socket.error as e:
+                raise TransportError(e)
+            if not chunk:
+                raise TransportError('Connection to {0}:{1} closed by the '
+                                     'peer'.format(*self.address))
+            self._buffer += chunk
+        message, _, self._buffer = self._buffer.partition(terminator)
+        return message
+
+    def query(self, data):
+        """Send `data` and return the reply."""
+        self.write(data)
+        return self.read()
+
+    def healthy(self):
+        """
+        False if the connection has been closed, by either end. The peer
+        closing it shows as the socket being readable with no data.
+        """
+        if self.sock is None:
+            return False
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+            if readable:
+                return bool(self.sock.recv(1, socket.MSG_PEEK))
+        except (socket.error, ValueError):
+            return False
+        return True
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+class SerialTransport(object):
+    """
+    A line-oriented serial port connection, with the same methods as
+    `TCPTransport`. Keyword arguments are passed to `serial.Serial`.
+    Requires pyserial.
+    """
+    def __init__(self, port, baudrate=9600, timeout=5., terminator=b'\n',
+                 **kwargs):
+        import serial
+        self.terminator = terminator
+        self.port = serial.Serial(port, baudrate, timeout=timeout, **kwargs)
+
+    def write(self, data):
+        try:
+            self.port.write(data + self.terminator)
+        except Exception as e:  # serial.SerialException, OSError
+            raise TransportError(e)
+
+    def read(self):
+        try:
+            message = self.port.read_until(self.terminator)
+        except Exception as e:
+            raise TransportError(e)
+        if not message.endswith(self.terminator):
+            raise TransportError('Timed out reading from '
+                                 '{0}'.format(self.port.port))
+        return message[:-len(self.terminator)]
+
+    def query(self, data):
+        self.write(data)
+        return self.read()
+
+    def healthy(self):
+        return self.port.is_open
+
+    def close(self):
+        self.port.close()
+
+
+class PoolClosed(TransportError):
+    pass
+
+
+class Pool(object):
+    """
+    A pool of up to `size` connections made by `factory()`.
+
+    `acquire` hands out an idle connection, or opens a new one if there is
+    none and fewer than `size` are open, or else waits for one to be
+    released. A connection that has been idle for `check_after` seconds or
+    more is checked with `check(conn)` (by default `conn.healthy()`, if it
+    has that method) before it is handed out, and replaced if the check
+    fails. A connection released as broken is closed, so the next `acquire`
+    reconnects.
+
+    `query`, `write` and `read` run the corresponding method of a pooled
+    connection, and retry up to `retries` times with a new connection if it
+    fails with a `TransportError` (or `socket.error`). Only use retries for
+    requests that may safely be sent twice.
+    """
+    def __init__(self, factory, size=1, check=None, check_after=10.,
+                 retries=0, name=None):
+        if size < 1:
+            raise ValueError('size must be at least 1')
+        self.factory = factory
+        self.size = size
+        self.check = check if check is not None else _default_check
+        self.check_after = check_after
+        self.retries = retries
+        self.name = name or getattr(factory, '__name__', 'pool')
+
+        self.cond = threading.Condition()
+        self.idle = []      # (connection, time released)
+        self.nopen = 0
+        self.closed = False
+        self.opened = 0     # Statistics: connections opened, acquisitions
+        self.acquired = 0
+
+    def __repr__(self):
+        return '<Pool {0}: {1} open, {2} idle>'.format(
+            self.name, self.nopen, len(self.idle))
+
+    def acquire(self, timeout=None):
+        """Get a connection. Raises `TransportError` if none is released
+        within `timeout` seconds."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self.cond:
+            while True:
+                if self.closed:
+                    raise PoolClosed('Pool {0} is closed'.format(self.name))
+                if self.idle:
+                    conn, released = self.idle.pop()
+                    break
+                if self.nopen < self.size:
+                    self.nopen += 1
+                    conn = released = None
+                    break
+                remaining = None if deadline is None else \
+                    deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise TransportError('Timed out waiting for a connection '
+                                         'of {0}'.format(self.name))
+                self.cond.wait(remaining)
+            self.acquired += 1
+
+        # Connect or check outside of the lock, as either may take a while
+        try:
+            if conn is not None and \
+                    (time.time() - released >= self.check_after) and \
+                    not self.check(conn):
+                _close(conn)
+                conn = None
+            if conn is None:
+                conn = self.factory()
+                with self.cond:
+                    self.opened += 1
+        except Exception:
+            self._discard()
+            raise
+        return conn
+
+    def release(self, conn, broken=False):
+        """Return `conn` to the pool, or close it if it is `broken` or the
+        pool has been closed."""
+        with self.cond:
+            if not (broken or self.closed):
+                self.idle.append((conn, time.time()))
+                self.cond.notify()
+                return
+        _close(conn)
+        self._discard()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """
+        Context manager for a pooled connection. The connection is released
+        on exit, as broken if a `TransportError` or `socket.error` was
+        raised. It is also closed if the exchange was interrupted (e.g. by
+        a KeyboardInterrupt or the cancellation of a coroutine), as a reply
+        may still be on its way.
+        """
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        except (TransportError, socket.error):
+            self.release(conn, broken=True)
+            raise
+        except Exception:
+            self.release(conn)
+            raise
+        except BaseException:
+            self.release(conn, broken=True)
+            raise
+        self.release(conn)
+
+    def call(self, method, *args, **kwargs):
+        """Call `conn.method(*args, **kwargs)` on a pooled connection,
+        retrying as described in the class docstring."""
+        for attempt in range(self.retries + 1):
+            try:
+                with self.connection() as conn:
+                    return getattr(conn, method)(*args, **kwargs)
+            except PoolClosed:
+                raise
+            except (TransportError, socket.error):
+                if attempt == self.retries:
+                    raise
+
+    def query(self, data):
+        return self.call('query', data)
+
+    def write(self, data):
+        return self.call('write', data)
+
+    def read(self):
+        return self.call('read')
+
+    def close(self):
+        """Close the idle connections, and the others once released.
+        Further `acquire`s raise `TransportError`."""
+        with self.cond:
+            self.closed = True
+            idle, self.idle = self.idle, []
+            self.nopen -= len(idle)
+            self.cond.notify_all()
+        for conn, _ in idle:
+            _close(conn)
+
+    def _discard(self):
+        with self.cond:
+            self.nopen -= 1
+            self.cond.notify()
+
+
+def _default_check(conn):
+    healthy = getattr(conn, 'healthy', None)
+    return healthy() if healthy is not None else True
+
+
+def _close(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+class resource(object):
+    """
+    Decorates a method of a controller class that opens a connection to an
+    instrument. On an instance, the method's name then gives the instance's
+    `Pool` of such connections, made the first time it is used.
+
+    :Usage:
+        May be used with or without arguments, which are passed to `Pool`:
+        `size`, `check`, `check_after` and `retries`.
+
+    :Example:
+        @resource(size=2)
+        def scope(self):
+            return TCPTransport('192.168.1.10', 5025)
+    """
+    def __init__(self, f=None, **options):
+        self.options = options
+        self.f = None
+        if f is not None:
+            self(f)
+
+    def __call__(self, f):
+        self.f = f
+        self.name = f.__name__
+        self.__doc__ = f.__doc__
+        return self
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        # Cached in the instance dict, which shadows this (non-data)
+        # descriptor, so later lookups are plain attribute lookups.
+        pool = obj.__dict__.get(self.name)
+        if pool is None:
+            pool = Pool(_bind(self.f, obj), name=self.name, **self.options)
+            # Keep the first pool if another thread made one meanwhile
+            pool = obj.__dict__.setdefault(self.name, pool)
+        return pool
+
+
+def _bind(f, obj):
+    @wraps(f)
+    def _factory():
+        return f(obj)
+    return _factory
+
+
+def close_resources(controller):
+    """Close the connection pools of the `resource`s of `controller` that
+    have been used."""
+    for value in list(vars(controller).values()):
+        if isinstance(value, Pool):
+            value.close()
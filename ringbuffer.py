@@ -0,0 +1,113 @@
+"""
+ringbuffer.py
+jlazear
+
+Fixed-capacity columnar ring buffer for live data.
+
+`RingBuffer` holds the last `capacity` rows of a set of columns in
+preallocated NumPy arrays, so memory use is bounded no matter how long data
+is appended. Each row is written twice, `capacity` elements apart, so that the
+rows currently held are always a contiguous slice of the storage and
+`buf[column]` is a zero-copy view.
+
+It supports the same interface as `cpreaders.ColumnBuffer` and may be used
+in its place as the data of a reader.
+
+Example:
+
+    buf = RingBuffer(['t', 'v'], capacity=100000)
+    buf.append(np.column_stack([t, v]))
+    pyo.plot('t', 'v')  # with pyo.data = buf
+"""
+
+import numpy as np
+
+
+class RingBuffer(object):
+    """
+    Fixed-capacity columnar ring buffer. Appending is O(1) per row, and
+    appending more than `capacity` rows discards the oldest ones.
+    """
+    def __init__(self, columns, capacity, dtype=float):
+        if capacity < 1:
+            raise ValueError('capacity must be at least 1')
+        self.columns = list(columns)
+        self.capacity = int(capacity)
+        self._index = dict((col, i) for i, col in enumerate(self.columns))
+        self._data = np.empty((len(self.columns), 2*self.capacity), dtype)
+        self.start = 0   # Total number of rows discarded
+        self.end = 0     # Total number of rows appended
+
+    @property
+    def length(self):
+        return self.end - self.start
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, column):
+        first = self.start % self.capacity
+        return self._data[self._index[column], first:first + self.length]
+
+    def append(self, block):
+        """
+        Append `block` (an array-like of shape (nrows, ncolumns)) to the end
+        of the buffer, discarding the oldest rows if it is full.
+        """
+        block = np.asarray(block, dtype=self._data.dtype)
+        if block.ndim != 2 or block.shape[1] != len(self.columns):
+            raise ValueError("block must have shape "
+                             "(nrows, {0})".format(len(self.columns)))
+        nrows = block.shape[0]
+        if nrows > self.capacity:
+            self.end += nrows - self.capacity
+            block = block[-self.capacity:]
+            nrows = self.capacity
+        positions = (self.end + np.arange(nrows)) % self.capacity
+        self._data[:, positions] = block.T
+        self._data[:, positions + self.capacity] = block.T
+        self.end += nrows
+        self.start = max(self.start, self.end - self.capacity)
+
+    def append_columns(self, arrays):
+        """
+        Append the rows given column by column by `arrays`, a sequence of
+        equal-length 1-D arrays, one per column.
+        """
+        nrows = len(arrays[0])
+        if nrows > self.capacity:
+            self.end += nrows - self.capacity
+            arrays = [a[-self.capacity:] for a in arrays]
+            nrows = self.capacity
+        first = self.end % self.capacity
+        # At most two contiguous runs of the storage, each written twice
+        split = min(nrows, self.capacity - first)
+        for i, a in enumerate(arrays):
+            row = self._data[i]
+            row[first:first + split] = a[:split]
+            row[first + self.capacity:first + self.capacity + split] = \
+                a[:split]
+            row[:nrows - split] = a[split:]
+            row[self.capacity:self.capacity + nrows - split] = a[split:]
+        self.end += nrows
+        self.start = max(self.start, self.end - self.capacity)
+
+    def reserve(self, capacity):
+        """Does nothing; the capacity of a ring buffer is fixed."""
+        pass
+
+    def clear(self):
+        self.start = self.end
+
+    def discard_before(self, column, value):
+        """
+        Discard the rows before the first one whose `column` is at least
+        `value`. `column` must be non-decreasing, e.g. a timestamp.
+        """
+        self.start += int(np.searchsorted(self[column], value, side='left'))
+
+    def to_frame(self):
+        """Copy the contents into a `pandas.DataFrame`."""
+        import pandas as pd
+        return pd.DataFrame(dict((col, self[col]) for col in self.columns),
+                            columns=self.columns)
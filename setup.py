@@ -8,7 +8,12 @@ setup(name='CP',
       author='Justin Lazear',
       author_email='jlazear@gmail.com',
       url='https://github.com/jlazear/cp',
-      py_modules=['cp',],
+      py_modules=['cp', 'dispatch', 'readiness',
+                  'cpreaders', 'ringbuffer', 'literal', 'headless',
+                  'registry', 'aio', 'resources', 'sweep',
+                  'cache', 'capture', 'stream',
+                  'worker', 'remote', 'digits'],
       packages=['gui'],
-      install_requires=['PyOscope', 'wxpython'],
+      install_requires=['PyOscope', 'wxpython',
+                        'futures; python_version < "3"'],
       )
\ No newline at end of file
@@ -0,0 +1,237 @@
+"""
+stream.py
+jlazear
+
+Streaming of data from cp commands to the plot, without files.
+
+A command that is a generator function (or is decorated with `cp.stream`
+and returns an iterable) streams its data: each block it yields is put into
+a `Stream`, a bounded queue, by the worker thread running the command, and
+the plot reads it with a `StreamReader` as it arrives. The queue bounds the
+memory used: once it is full, the command waits (at its `yield`) until the
+GUI has taken the blocks, so a fast acquisition is throttled to the rate at
+which the GUI plots rather than piling up data.
+
+A block may be
+
+    a dict of equal-length arrays by column name,
+    an array-like of shape (nrows, ncolumns),
+    a 1-D sequence, i.e. a single row.
+
+The columns are those of `cp.stream`'s `columns` argument, or else the keys
+of the first dict block or 0, 1, ... Example:
+
+    @command
+    @stream(columns=['t', 'v'])
+    def acquire(self, nblocks=1000):
+        for i in range(nblocks):
+            yield self.daq.read_block()  # (nrows, 2) array
+
+The command stops when the stream is closed, e.g. when another command's
+output is plotted: its generator is closed (raising `GeneratorExit` at its
+`yield`), so a `try`/`finally` around the loop may clean up.
+"""
+
+import sys
+import threading
+import time
+import types
+from collections import OrderedDict, deque
+
+import numpy as np
+
+from cpreaders import IncrementalReader
+
+
+_ORDERED_DICTS = sys.version_info >= (3, 7)
+
+
+class StreamClosed(Exception):
+    """Raised by `Stream.put` once the stream has been closed."""
+    pass
+
+
+class StreamFull(Exception):
+    """Raised by `Stream.put` if the queue stayed full until the timeout."""
+    pass
+
+
+class Stream(object):
+    """
+    A bounded queue of data blocks, from a producer (the command) to a
+    consumer (the `StreamReader`). `put` blocks while `maxblocks` blocks are
+    queued. Blocks are converted to lists of column arrays by `put`, i.e. in
+    the producer's thread.
+    """
+    def __init__(self, columns=None, maxblocks=16, name=None):
+        if maxblocks < 1:
+            raise ValueError('maxblocks must be at least 1')
+        self.columns = list(columns) if columns is not None else None
+        self.maxblocks = maxblocks
+        self.name = name
+        self.cond = threading.Condition()
+        self.blocks = deque()
+        self.closed = False     # No more blocks will be put
+        self.nput = 0           # Statistics: blocks and rows put
+        self.nrows = 0
+
+    def __repr__(self):
+        return '<Stream {0}: {1} rows{2}>'.format(
+            self.name, self.nrows, ', closed' if self.closed else '')
+
+    def put(self, block, timeout=None):
+        """
+        Queue `block`, waiting while the queue is full. Raises
+        `StreamClosed` if the stream is closed, and `StreamFull` if the
+        queue is still full after `timeout` seconds.
+        """
+        columns = self.columns_of(block)
+        deadline = None if timeout is None else time.time() + timeout
+        with self.cond:
+            while not (self.closed or len(self.blocks) < self.maxblocks):
+                remaining = None if deadline is None else \
+                    deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise StreamFull('Stream {0} is full'.format(self.name))
+                self.cond.wait(remaining)
+            if self.closed:
+                raise StreamClosed('Stream {0} is closed'.format(self.name))
+            self.blocks.append(columns)
+            self.nput += 1
+            self.nrows += len(columns[0]) if columns else 0
+
+    def get(self):
+        """Take all of the queued blocks, without waiting. Returns a list of
+        blocks, each a list of column arrays."""
+        with self.cond:
+            blocks = list(self.blocks)
+            self.blocks.clear()
+            self.cond.notify_all()
+        return blocks
+
+    def close(self):
+        """Close the stream. Blocks already queued may still be taken."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def columns_of(self, block):
+        """Convert `block` to a list of column arrays, setting `columns`
+        from the first block if it was not given."""
+        if isinstance(block, dict):
+            if self.columns is None:
+                ordered = _ORDERED_DICTS or isinstance(block, OrderedDict)
+                self.columns = list(block) if ordered else sorted(block)
+            return [np.asarray(block[col]).ravel() for col in self.columns]
+        block = np.asarray(block)
+        if block.ndim == 1:
+            block = block[np.newaxis, :]
+        if block.ndim != 2:
+            raise ValueError('Stream blocks must be dicts, rows or arrays '
+                             'of rows')
+        if self.columns is None:
+            self.columns = list(range(block.shape[1]))
+        if block.shape[1] != len(self.columns):
+            raise ValueError('Stream block has {0} columns instead of '
+                             '{1}'.format(block.shape[1], len(self.columns)))
+        return list(block.T)
+
+
+def isstream(retval, declared=False):
+    """
+    True if the return value `retval` of a command is to be streamed: if it
+    is a generator, or, for commands `declared` with `cp.stream`, any
+    iterable other than a string.
+    """
+    if isinstance(retval, types.GeneratorType):
+        return True
+    if not declared or isinstance(retval, (bytes, type(u''), dict)):
+        return False
+    try:
+        iter(retval)
+    except TypeError:
+        return False
+    return True
+
+
+def pump(iterable, stream):
+    """
+    Put the blocks of `iterable` into `stream` until either is exhausted or
+    closed, then close both. Returns the number of rows put. Runs in the
+    command's worker thread.
+    """
+    try:
+        for block in iterable:
+            stream.put(block)
+    except StreamClosed:
+        pass
+    finally:
+        stream.close()
+        close = getattr(iterable, 'close', None)
+        if close is not None:
+            close()
+    return stream.nrows
+
+
+class StreamReader(IncrementalReader):
+    """
+    Reader of a `Stream`, for plotting it. Implements the reader interface
+    (see `pyoscope.readers.ReaderInterface`) with the stream in place of a
+    file, and supports windows like the other `cpreaders.IncrementalReader`s.
+
+    `update_data` takes the blocks queued since the last update and appends
+    them to its buffer, all at once, which makes room in the queue for the
+    command to continue.
+    """
+    filename = None
+
+    def __init__(self, f, dtype=float, *args, **kwargs):
+        self.dtype = dtype
+        self._open(f)
+
+    def _open(self, f):
+        if not isinstance(f, Stream):
+            raise TypeError('StreamReader reads Streams, not '
+                            '{0!r}'.format(f))
+        self.stream = f
+        self.data = None
+
+    def follows(self, f):
+        return f is self.stream
+
+    def signature(self):
+        """Changes whenever a block was put into the stream, so the plot is
+        only updated when there is new data."""
+        return self.stream.nput
+
+    def close(self):
+        self.stream.close()
+
+    def init_data(self, *args, **kwargs):
+        self.data = None
+        self._read_new()
+        if self.data is None:
+            self.data = self._make_buffer(self.stream.columns or [])
+        self._trim()
+        return self.data
+
+    def update_data(self):
+        self._read_new()
+        self._trim()
+        return self.data
+
+    def _read_new(self):
+        blocks = self.stream.get()
+        if not blocks:
+            return
+        if self.data is None or not len(self.data.columns):
+            self.data = self._make_buffer(self.stream.columns,
+                                          sum(len(b[0]) for b in blocks))
+        if len(blocks) == 1:
+            columns = blocks[0]
+        else:
+            columns = [np.concatenate(column) for column in zip(*blocks)]
+        self.data.append_columns(columns)
+
+
+Stream.reader_class = StreamReader
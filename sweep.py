@@ -0,0 +1,272 @@
+"""
+sweep.py
+jlazear
+
+Batch and sweep execution of cp commands.
+
+A sweep calls a command once for every combination of the values given for
+its swept arguments, e.g. `arg1` over '0:10:0.5' and `arg2` over '1, 2, 5'.
+Each distinct value is conditioned only once, the calls are pipelined with a
+bounded number in flight, and progress is reported at a bounded rate, so the
+cost of a long sweep is that of the instrument calls.
+
+Value syntax (as typed in the GUI):
+
+    '0:10:0.5'  -> 0, 0.5, ..., 10 (start:stop:step, stop included)
+    '0:10'      -> 0, 1, ..., 10
+    '1, 2, 5'   -> 1, 2, 5 (numbers only)
+    anything else -> that single value
+
+Only the values of numeric arguments, i.e. those conditioned by 'int' or
+'float' (see `cp.argument`) or, without conditioning, with a number as their
+default, are parsed in this syntax. The values of other arguments, e.g.
+'10:30' for a string or '1, 2' for a list, are always single values. Any
+argument may be swept over a list of raw values.
+
+Example:
+
+    points = make_points(spec, {'arg1': '0:10:0.5', 'arg2': '1, 2, 5'})
+    results = run(ctrl, spec, points, concurrency=4)
+"""
+
+import itertools
+import numbers
+import re
+import threading
+import time
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import aio
+from dispatch import _invoke
+
+
+_NUMBER = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+_RANGE = re.compile(r'^\s*({0})\s*:\s*({0})\s*(?::\s*({0})\s*)?$'.format(
+    _NUMBER))
+_LIST = re.compile(r'^\s*{0}(?:\s*,\s*{0})+\s*$'.format(_NUMBER))
+_INT = re.compile(r'^\s*[-+]?\d+\s*$')
+
+
+def parse_values(text):
+    """
+    Parse the sweep values `text` (see the module docstring) into a list of
+    raw (string) values. Raises ValueError for an empty or infinite range.
+    """
+    m = _RANGE.match(text)
+    if m is not None:
+        start, stop, step = m.group(1), m.group(2), m.group(3) or '1'
+        if all(_INT.match(s) for s in (start, stop, step)):
+            start, stop, step = int(start), int(stop), int(step)
+            if step == 0:
+                raise ValueError('Sweep step must not be 0: {0!r}'.format(
+                    text))
+            values = [str(v) for v in
+                      range(start, stop + (1 if step > 0 else -1), step)]
+        else:
+            start, stop, step = float(start), float(stop), float(step)
+            if step == 0:
+                raise ValueError('Sweep step must not be 0: {0!r}'.format(
+                    text))
+            # Include stop despite rounding errors
+            n = (stop - start)/step + 1e-9
+            values = ['{0:.12g}'.format(start + i*step)
+                      for i in range(int(n) + 1)] if n >= 0 else []
+        if not values:
+            raise ValueError('Empty sweep range: {0!r}'.format(text))
+        return values
+    if _LIST.match(text):
+        return [value.strip() for value in text.split(',')]
+    return [text]
+
+
+def numeric(arg):
+    """Whether the `registry.ArgSpec` `arg` is a numeric argument, whose
+    values are parsed in the sweep syntax."""
+    from cp import argfuncdict
+    if arg.converter is not None:
+        return arg.converter in (argfuncdict['int'], argfuncdict['float'])
+    return (isinstance(arg.default, numbers.Real)
+            and not isinstance(arg.default, bool))
+
+
+def make_points(spec, sweeps):
+    """
+    Make the conditioned keyword arguments of every call of a sweep of the
+    command `spec` (a `registry.CommandSpec`).
+
+    `sweeps` maps argument names to their raw values: a string, in the
+    sweep syntax for numeric arguments, or a list of raw values. The last
+    argument (in the order of the
+    command's arguments) varies fastest. Arguments that are not in `sweeps`
+    take their defaults. Each distinct raw value of an argument is
+    conditioned once. Raises `cp.ArgumentError` if any value, or range,
+    is invalid.
+    """
+    from cp import ArgumentError
+    args = dict((arg.name, arg) for arg in spec.args)
+    names = [arg.name for arg in spec.args if arg.name in sweeps]
+    names.extend(sorted(name for name in sweeps if name not in names))
+    values = []
+    for name in names:
+        raw = sweeps[name]
+        if isinstance(raw, (str, type(u''))):
+            if name not in args or not numeric(args[name]):
+                raw = [raw]
+            else:
+                try:
+                    raw = parse_values(raw)
+                except ValueError as e:
+                    raise ArgumentError({name: e})
+        values.append(list(raw))
+    conditioned = []
+    conditioner = spec.conditioner
+    for name, raws in zip(names, values):
+        unique = dict((value, None) for value in raws)
+        if conditioner is not None:
+            done = [conditioner({name: value}) for value in unique]
+            unique = dict((value, d[name]) for value, d in zip(unique, done))
+        else:
+            unique = dict((value, value) for value in unique)
+        conditioned.append([unique[value] for value in raws])
+    return [dict(zip(names, combo))
+            for combo in itertools.product(*conditioned)]
+
+
+class Latest(object):
+    """
+    Calls `func(*args)` in a thread of its own for the latest `args` given
+    to `submit`, e.g. to plot the latest result of a sweep from its
+    `progress` function. `args` submitted while `func` is busy replace each
+    other, so a slow `func` (waiting for an output file, say) neither holds
+    up the sweep nor falls behind it.
+    """
+    def __init__(self, func):
+        self.func = func
+        self.lock = threading.Lock()
+        self.pending = None
+        self.idle = threading.Event()
+        self.idle.set()
+
+    def submit(self, *args):
+        with self.lock:
+            self.pending = args
+            if not self.idle.is_set():
+                return
+            self.idle.clear()
+        thread = threading.Thread(target=self._run, name='cp-latest')
+        thread.daemon = True
+        thread.start()
+
+    def _run(self):
+        while True:
+            with self.lock:
+                args, self.pending = self.pending, None
+                if args is None:
+                    self.idle.set()
+                    return
+            try:
+                self.func(*args)
+            except BaseException:
+                with self.lock:
+                    self.idle.set()
+                raise
+
+    def wait(self, timeout=None):
+        """Wait until the latest `args` have been handled. Returns False
+        if `timeout` seconds passed first."""
+        return self.idle.wait(timeout)
+
+
+class SweepStopped(Exception):
+    """Raised by `run` when a sweep was stopped before it completed."""
+    def __init__(self, results):
+        self.results = results
+        Exception.__init__(self, 'Sweep stopped after {0} points'.format(
+            sum(1 for r in results if r is not _PENDING)))
+
+
+_PENDING = object()
+
+
+def run(controller, spec, points, concurrency=None, progress=None,
+        interval=0.2, stop=None, executor=None):
+    """
+    Call the command `spec` of `controller` with each of the keyword
+    argument dicts `points`, with at most `concurrency` calls in flight
+    (default: the command's `concurrency` option, or 1). Returns the list
+    of return values, in the order of `points`.
+
+    Coroutine commands are run on the shared event loop (see `aio`) and
+    other commands on a dedicated thread pool, or, for commands with
+    `executor='process'`, process pool. `executor` overrides the command's
+    executor, e.g. 'thread' for a `worker.WorkerProxy` controller.
+
+    `progress`, if given, is called as `progress(ndone, ntotal, retval)`
+    with the latest return value, at most once per `interval` seconds and
+    once at the end. If the `threading.Event` `stop` is set, no further
+    calls are started and `SweepStopped` is raised once those in flight are
+    done. The first exception raised by a call stops the sweep the same way
+    and is re-raised.
+    """
+    if concurrency is None:
+        concurrency = spec.options.get('concurrency', 1)
+    concurrency = max(int(concurrency), 1)
+    stop = stop if stop is not None else threading.Event()
+    results = [_PENDING]*len(points)
+    executor = executor or spec.executor
+    if executor == 'async':
+        pool = None
+        loop = aio.event_loop()
+        submit = lambda kwargs: loop.submit(
+            _invoke(controller, spec.name, kwargs))
+    elif executor == 'process':
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(concurrency)
+        submit = lambda kwargs: pool.submit(_invoke, controller, spec.name,
+                                            kwargs)
+    else:
+        pool = ThreadPoolExecutor(concurrency)
+        submit = lambda kwargs: pool.submit(_invoke, controller, spec.name,
+                                            kwargs)
+
+    inflight = {}
+    ndone = 0
+    last = 0.
+    error = None
+    try:
+        todo = iter(enumerate(points))
+        while True:
+            while len(inflight) < concurrency and not stop.is_set():
+                try:
+                    i, kwargs = next(todo)
+                except StopIteration:
+                    break
+                inflight[submit(kwargs)] = i
+            if not inflight:
+                break
+            done, _ = wait(list(inflight), return_when=FIRST_COMPLETED)
+            for future in done:
+                i = inflight.pop(future)
+                try:
+                    results[i] = retval = future.result()
+                except Exception as e:
+                    if error is None:
+                        error = e
+                    stop.set()
+                    continue
+                ndone += 1
+                now = time.time()
+                if progress is not None and now - last >= interval:
+                    last = now
+                    progress(ndone, len(points), retval)
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False)
+    if error is not None:
+        raise error
+    if ndone < len(points):
+        raise SweepStopped(results)
+    if progress is not None and points:
+        progress(ndone, len(points), results[-1])
+    return results
@@ -0,0 +1,8 @@
+"""
+Tests of cp. Run from the top of the repository with
+
+    python -m pytest tests
+
+or `python -m unittest discover -s tests -t .`. The GUI is not tested; the
+tests require NumPy but neither wx nor pyoscope.
+"""
@@ -0,0 +1,115 @@
+"""
+test_aio.py
+jlazear
+
+Tests of running coroutine commands (Python 3 only).
+"""
+import sys
+import threading
+import unittest
+
+import aio
+from cp import Controller, command
+from dispatch import Dispatcher
+
+
+PY3 = sys.version_info >= (3, 5)
+
+# `async def` is a syntax error on Python 2, so the coroutine commands are
+# compiled at run time
+SOURCE = '''
+import asyncio
+
+class Ctrl(object):
+    def __init__(self):
+        self.threads = set()
+
+    @command
+    async def wait(self, delay=0.01, value=1):
+        self.threads.add(threading.current_thread().name)
+        await asyncio.sleep(float(delay))
+        return value
+
+    @command
+    async def fail(self):
+        raise RuntimeError('failed')
+'''
+
+if PY3:
+    namespace = {'command': command, 'threading': threading}
+    exec(SOURCE, namespace)
+    Ctrl = namespace['Ctrl']
+
+
+@unittest.skipUnless(PY3, 'coroutine commands need Python 3')
+class TestEventLoopThread(unittest.TestCase):
+    def setUp(self):
+        self.loop = aio.EventLoopThread(name='test-asyncio')
+        self.ctrl = Ctrl()
+
+    def tearDown(self):
+        self.loop.stop(5)
+
+    def test_run(self):
+        self.assertEqual(self.loop.run(self.ctrl.wait(value=3), 5), 3)
+        self.assertEqual(self.ctrl.threads, set(['test-asyncio']))
+
+    def test_concurrent(self):
+        # 20 calls of 0.2 s each run at once on the one loop thread
+        futures = [self.loop.submit(self.ctrl.wait(0.2, i))
+                   for i in range(20)]
+        self.assertEqual([f.result(1.5) for f in futures], list(range(20)))
+
+    def test_error(self):
+        self.assertRaises(RuntimeError, self.loop.run, self.ctrl.fail(), 5)
+        self.assertRaises(TypeError, self.loop.submit, lambda: None)
+
+    def test_stop(self):
+        self.loop.stop(5)
+        self.assertFalse(self.loop.thread.is_alive())
+        self.assertTrue(self.loop.loop.is_closed())
+
+
+@unittest.skipUnless(PY3, 'coroutine commands need Python 3')
+class TestAsyncCommands(unittest.TestCase):
+    def test_command(self):
+        self.assertTrue(aio.iscoroutinefunction(Ctrl.wait))
+        self.assertEqual(Ctrl.wait.cmdopts['executor'], 'async')
+        self.assertRaises(ValueError, command(executor='thread'),
+                          Ctrl.wait.__wrapped__)
+        self.assertRaises(ValueError, command(executor='async'),
+                          lambda self: None)
+
+    def test_shared_loop(self):
+        self.assertIs(aio.event_loop(), aio.event_loop())
+        self.assertEqual(aio.run(Ctrl().wait(value='a'), 5), 'a')
+
+    def test_headless(self):
+        session = Controller(Ctrl).headless()
+        self.assertEqual(session.call('wait', value=2), 2)
+
+    def test_dispatcher(self):
+        ctrl = Ctrl()
+        d = Dispatcher(ctrl, max_workers=1)
+        try:
+            done = threading.Event()
+            futures = [d.submit('wait', {'delay': 0.2, 'value': i},
+                                executor='async',
+                                callback=lambda name, f: done.set())
+                       for i in range(10)]
+            # Not queued behind each other on the single worker thread
+            self.assertEqual(d.state('wait').running, 10)
+            self.assertEqual([f.result(1.5) for f in futures], list(range(10)))
+            self.assertTrue(done.wait(5))
+            self.assertEqual(ctrl.threads, set(['cp-asyncio']))
+            future = d.submit('fail', {}, executor='async')
+            self.assertRaises(RuntimeError, future.result, 5)
+            future = d.submit('wait', {'delay': 0}, executor='async',
+                              finish=lambda value: value + 1)
+            self.assertEqual(future.result(5), 2)
+        finally:
+            d.shutdown(wait=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+"""
+test_benchmarks.py
+jlazear
+
+Tests of the benchmark suite's helpers and a smoke test of run.py.
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = os.path.join(ROOT, 'benchmarks')
+
+sys.path.insert(0, BENCHMARKS)
+try:
+    import harness
+    import run
+finally:
+    sys.path.remove(BENCHMARKS)
+
+
+class TestHarness(unittest.TestCase):
+    def test_measure(self):
+        calls = []
+        stats = harness.measure(lambda: calls.append(1), repeat=3, number=4)
+        self.assertEqual(len(calls), 12)
+        self.assertEqual((stats['repeat'], stats['number']), (3, 4))
+        self.assertTrue(stats['min'] <= stats['median'])
+
+    def test_summarize(self):
+        stats = harness.summarize([3., 1., 2.])
+        self.assertEqual((stats['min'], stats['median'], stats['mean']),
+                         (1., 2., 2.))
+        self.assertEqual(harness.percentiles(list(range(100)), (50, 99)),
+                         {'p50': 50, 'p99': 99, 'max': 99})
+
+    def test_make_controller(self):
+        from registry import registry_for
+        cls = harness.make_controller(12)
+        reg = registry_for(cls)
+        self.assertEqual(len(reg), 12)
+        self.assertEqual(reg.names()[0], 'cmd0000')
+        self.assertEqual(reg['cmd0003'].conditioner({'x': '2', 'n': '3'}),
+                         {'x': 2., 'n': 3})
+        self.assertEqual(harness.parse_sizes('10, 100,'), (10, 100))
+
+
+RESULTS = {'parsing': {'hex': {'median': 2., 'min': 1.},
+                       'gui': {'error': 'ImportError: no wx'}},
+           'startup': {'median': 1., 'cold': {'median': 4.}},
+           'notes': 'not a measurement'}
+
+
+class TestRun(unittest.TestCase):
+    def test_flatten(self):
+        self.assertEqual(run.flatten(RESULTS), {'parsing/hex': 2.,
+                                                'startup': 1.,
+                                                'startup/cold': 4.})
+
+    def test_errors(self):
+        self.assertEqual(run.errors(RESULTS),
+                         {'parsing/gui': 'ImportError: no wx'})
+
+    def test_compare(self):
+        new = {'parsing': {'hex': {'median': 3.}},
+               'startup': {'median': 1.1, 'cold': {'median': 8.}},
+               'added': {'median': 1.}}
+        slower = run.compare({'results': RESULTS}, {'results': new}, 0.2)
+        self.assertEqual(slower, [('startup/cold', 4., 8., 2.),
+                                  ('parsing/hex', 2., 3., 1.5)])
+        self.assertEqual(run.compare({'results': RESULTS},
+                                     {'results': new}, 1.5), [])
+
+
+class TestCommandLine(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def run_script(self, *args):
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(BENCHMARKS, 'run.py')] +
+            list(args), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = process.communicate()
+        return process.returncode, stderr.decode('utf-8')
+
+    def test_quick_run_and_compare(self):
+        output = os.path.join(self.dir, 'new.json')
+        status, _ = self.run_script('--quick', '--only', 'controllers',
+                                    '-o', output)
+        self.assertEqual(status, 0)
+        with open(output) as f:
+            document = json.load(f)
+        self.assertEqual(document['parameters']['benchmarks'],
+                         ['controllers'])
+        flat = run.flatten(document['results'])
+        self.assertTrue(flat)
+
+        # An earlier run that was twice as fast
+        old = os.path.join(self.dir, 'old.json')
+        with open(old, 'w') as f:
+            json.dump({'results': _scaled(document['results'], 0.5)}, f)
+        status, stderr = self.run_script('--quick', '--only', 'controllers',
+                                         '-o', output, '--compare', old,
+                                         '--threshold', '10')
+        self.assertEqual(status, 0)
+        self.assertIn('0 measurements slower', stderr)
+        with open(old, 'w') as f:
+            json.dump({'results': _scaled(document['results'], 1e-6)}, f)
+        status, stderr = self.run_script('--quick', '--only', 'controllers',
+                                         '-o', output, '--compare', old)
+        self.assertEqual(status, 1)
+        self.assertIn('{0} measurements slower'.format(len(flat)), stderr)
+
+    def test_unknown_benchmark(self):
+        status, stderr = self.run_script('--only', 'nonsense')
+        self.assertEqual(status, 2)
+        self.assertIn('unknown benchmarks: nonsense', stderr)
+
+
+def _scaled(results, factor):
+    """`results` with every timing multiplied by `factor`."""
+    scaled = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            value = _scaled(value, factor)
+        elif key in ('min', 'median', 'mean'):
+            value = value*factor
+        scaled[key] = value
+    return scaled
+
+
+if __name__ == '__main__':
+    unittest.main()
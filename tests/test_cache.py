@@ -0,0 +1,191 @@
+"""
+test_cache.py
+jlazear
+
+Tests of the caching of command return values.
+"""
+import threading
+import time
+import unittest
+
+import cache
+from cache import Cache, MISSING, cache_policy, caches, invalidate
+from cp import Controller, argument, command
+from registry import registry_for
+
+
+class Ctrl(object):
+    def __init__(self):
+        self.calls = 0
+
+    @command(cache=True)
+    def idn(self):
+        self.calls += 1
+        return 'scope {0}'.format(self.calls)
+
+    @command(cache={'size': 2})
+    @argument('channel', 'int')
+    def calibration(self, channel=1, scale=1.):
+        self.calls += 1
+        return [channel*scale, self.calls]
+
+    @command(invalidates='idn')
+    def reset(self, fail=False):
+        if fail:
+            raise RuntimeError('failed')
+
+    @command(invalidates=['idn', 'calibration'])
+    def calibrate(self):
+        pass
+
+
+class TestCache(unittest.TestCase):
+    def test_lru(self):
+        c = Cache(size=2)
+        c.put('a', 1)
+        c.put('b', 2)
+        self.assertEqual(c.get('a'), 1)
+        c.put('c', 3)  # Drops b, the least recently used
+        self.assertIs(c.get('b'), MISSING)
+        self.assertEqual((c.get('a'), c.get('c')), (1, 3))
+        self.assertEqual((c.hits, c.misses), (3, 1))
+        self.assertEqual(len(c), 2)
+
+    def test_ttl(self):
+        now = [0.]
+        original = cache._now
+        cache._now = lambda: now[0]
+        try:
+            c = Cache(ttl=5.)
+            c.put('a', 1)
+            now[0] = 4.9
+            self.assertEqual(c.get('a'), 1)
+            now[0] = 5.
+            self.assertIs(c.get('a'), MISSING)
+        finally:
+            cache._now = original
+
+    def test_generation(self):
+        c = Cache()
+        generation = c.generation
+        c.clear()
+        self.assertFalse(c.put('a', 1, generation))
+        self.assertIs(c.get('a'), MISSING)
+        self.assertTrue(c.put('a', 1, c.generation))
+
+    def test_policy(self):
+        self.assertIsNone(cache_policy(None))
+        self.assertIsNone(cache_policy(False))
+        self.assertEqual(cache_policy(True), {})
+        self.assertEqual(cache_policy({'ttl': 1}), {'ttl': 1})
+        self.assertRaises(ValueError, cache_policy, {'maxsize': 1})
+        self.assertRaises(ValueError, cache_policy, 5)
+        self.assertRaises(ValueError, Cache, 0)
+
+
+class TestCachedCommands(unittest.TestCase):
+    def setUp(self):
+        self.ctrl = Ctrl()
+
+    def test_cached(self):
+        self.assertEqual(self.ctrl.idn(), 'scope 1')
+        self.assertEqual(self.ctrl.idn(), 'scope 1')
+        self.assertEqual(Ctrl().idn(), 'scope 1')  # Per instance
+        self.assertEqual(self.ctrl.calls, 1)
+
+    def test_key(self):
+        first = self.ctrl.calibration()
+        self.assertIs(self.ctrl.calibration(1), first)
+        self.assertIs(self.ctrl.calibration(channel=1, scale=1.), first)
+        self.assertIsNot(self.ctrl.calibration(2), first)
+        self.assertEqual(self.ctrl.calls, 2)
+        self.ctrl.calibration(scale=[2])  # Unhashable: not cached
+        self.ctrl.calibration(scale=[2])
+        self.assertEqual(self.ctrl.calls, 4)
+        self.assertEqual(len(caches(self.ctrl)['calibration']), 2)
+
+    def test_invalidates(self):
+        self.ctrl.idn()
+        self.ctrl.reset()
+        self.assertEqual(self.ctrl.idn(), 'scope 2')
+        self.assertRaises(RuntimeError, self.ctrl.reset, True)
+        self.assertEqual(self.ctrl.idn(), 'scope 3')
+        self.ctrl.calibration()
+        self.ctrl.calibrate()
+        self.assertEqual(self.ctrl.idn(), 'scope 5')
+        self.assertEqual(self.ctrl.calibration(), [1, 6])
+
+    def test_invalidate(self):
+        self.ctrl.idn()
+        self.ctrl.calibration()
+        invalidate(self.ctrl, 'idn', 'missing')
+        self.assertEqual(self.ctrl.idn(), 'scope 3')
+        invalidate(self.ctrl)
+        self.assertEqual(self.ctrl.calibration(), [1, 4])
+
+    def test_in_flight_call_not_stored(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        class Slow(object):
+            @command(cache=True)
+            def read(self):
+                started.set()
+                release.wait(5)
+                return 'stale'
+
+        slow = Slow()
+        thread = threading.Thread(target=slow.read)
+        thread.start()
+        self.assertTrue(started.wait(5))
+        invalidate(slow, 'read')
+        release.set()
+        thread.join(5)
+        self.assertEqual(len(caches(slow)['read']), 0)
+
+    def test_options(self):
+        for options in ({'cache': True, 'executor': 'process'},
+                        {'invalidates': ['idn'], 'executor': 'process'}):
+            self.assertRaises(ValueError, command(**options),
+                              lambda self: None)
+        self.assertEqual(Ctrl.reset.cmdopts['invalidates'], ['idn'])
+
+
+class TestValidation(unittest.TestCase):
+    def test_unknown_invalidated_command(self):
+        class Bad(object):
+            @command(invalidates=['idn', 'typo'])
+            def reset(self):
+                pass
+
+            @command(cache=True)
+            def idn(self):
+                pass
+        with self.assertRaises(ValueError) as cm:
+            Controller(Bad)
+        self.assertIn('typo', str(cm.exception))
+        self.assertNotIn('idn,', str(cm.exception))
+
+    def test_unknown_argument(self):
+        class Bad(object):
+            @command
+            @argument('chanel', 'int')
+            def read(self, channel=1):
+                pass
+        self.assertRaises(ValueError, Controller, Bad)
+
+        class Good(object):
+            @command
+            @argument('channel', 'int')
+            def read(self, **kwargs):
+                return kwargs
+        self.assertEqual(registry_for(Good)['read'].conditioner(
+            {'channel': '2'}), {'channel': 2})
+
+    def test_known(self):
+        self.assertEqual(registry_for(Ctrl).names(),
+                         ['calibrate', 'calibration', 'idn', 'reset'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+"""
+test_capture.py
+jlazear
+
+Tests of the binary capture files and their reader.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import capture
+from capture import CaptureError, CaptureWriter, load
+from cpreaders import CaptureReader
+
+
+class CaptureTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.dir, 'data.cap')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def writer(self, **kwargs):
+        return CaptureWriter(self.fname, ['t', 'v'], ['f8', 'i2'], **kwargs)
+
+
+class TestCaptureFiles(CaptureTest):
+    def test_round_trip(self):
+        with self.writer(blockrows=4, meta={'rate': 10}) as w:
+            w.write({'t': np.arange(10.), 'v': np.arange(10)})
+            w.write([[10., 10], [11., 11]])
+        self.assertEqual(w.nrows, 12)
+        self.assertEqual(len(w.index), 2)
+        columns, header = load(self.fname)
+        self.assertEqual(header.columns, ['t', 'v'])
+        self.assertEqual(header.meta, {'rate': 10})
+        self.assertEqual(columns['t'].dtype, np.float64)
+        self.assertEqual(columns['v'].dtype, np.int16)
+        self.assertEqual(columns['t'].tolist(), list(range(12)))
+        self.assertEqual(columns['v'].tolist(), list(range(12)))
+
+    def test_big_endian_input(self):
+        with self.writer() as w:
+            w.write({'t': np.array([1.5], '>f8'), 'v': np.array([-2], '>i2')})
+        columns, _ = load(self.fname)
+        self.assertEqual((columns['t'][0], columns['v'][0]), (1.5, -2))
+
+    def test_unclosed(self):
+        w = self.writer()
+        w.write({'t': [1., 2.], 'v': [1, 2]})
+        w.flush()
+        w.write({'t': [3.], 'v': [3]})  # Buffered only
+        columns, _ = load(self.fname)
+        self.assertEqual(columns['t'].tolist(), [1., 2.])
+        w.close()
+        self.assertEqual(load(self.fname)[0]['t'].tolist(), [1., 2., 3.])
+
+    def test_append(self):
+        with self.writer() as w:
+            w.write({'t': [1.], 'v': [1]})
+        with self.writer(append=True) as w:
+            self.assertEqual(w.nrows, 1)
+            w.write({'t': [2.], 'v': [2]})
+        self.assertEqual(load(self.fname)[0]['v'].tolist(), [1, 2])
+        self.assertRaises(CaptureError, CaptureWriter, self.fname, ['t'],
+                          append=True)
+
+    def test_append_after_crash(self):
+        w = self.writer()
+        w.write({'t': [1.], 'v': [1]})
+        w.flush()
+        w.f.write(capture._TAG.pack(capture.BLOCK, 5) + b'\0'*3)  # Torn
+        w.f.close()
+        with self.writer(append=True) as w:
+            w.write({'t': [2.], 'v': [2]})
+        self.assertEqual(load(self.fname)[0]['v'].tolist(), [1, 2])
+
+    def test_invalid(self):
+        with open(self.fname, 'wb') as f:
+            f.write(b'1, 2\n3, 4\n')
+        self.assertRaises(CaptureError, load, self.fname)
+        self.assertRaises(ValueError, self.writer().write,
+                          {'t': [1., 2.], 'v': [1]})
+        self.assertRaises(ValueError, CaptureWriter, self.fname, ['t', 'v'],
+                          ['f8'])
+
+
+class TestCaptureReader(CaptureTest):
+    def test_incremental(self):
+        w = self.writer()
+        w.write({'t': [1., 2.], 'v': [10, 20]})
+        w.flush()
+        r = CaptureReader(self.fname)
+        data = r.init_data()
+        self.assertEqual(list(data['v']), [10., 20.])
+        w.write({'t': [3.], 'v': [30]})
+        self.assertEqual(len(r.update_data()), 2)  # Not flushed yet
+        w.close()
+        data = r.update_data()
+        self.assertEqual(list(data['t']), [1., 2., 3.])
+        self.assertEqual(list(data.columns), ['t', 'v'])
+        r.close()
+
+    def test_window(self):
+        with self.writer(blockrows=10) as w:
+            for i in range(0, 100, 10):
+                w.write({'t': np.arange(i, i + 10.), 'v': np.arange(10)})
+            first = w.index[0][0]
+        # Only the last two blocks are read, so a broken first block is
+        # never seen
+        with open(self.fname, 'r+b') as f:
+            f.seek(first)
+            f.write(b'XXXX')
+        r = CaptureReader(self.fname)
+        r.set_window(samples=15)
+        data = r.init_data()
+        self.assertEqual(list(data['t']), list(range(85, 100)))
+        r.close()
+
+    def test_meta(self):
+        with self.writer(meta={'units': 'V'}) as w:
+            pass
+        r = CaptureReader(self.fname)
+        self.assertEqual(len(r.init_data()), 0)
+        self.assertEqual(r.meta, {'units': 'V'})
+        r.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
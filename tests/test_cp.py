@@ -0,0 +1,81 @@
+"""
+test_cp.py
+jlazear
+
+Tests of the `command` and `argument` decorators and of the compiled
+argument conditioning.
+"""
+import unittest
+
+from cp import ArgumentError, argument, command, getargspec
+
+
+class Ctrl(object):
+    @command
+    @argument('x', 'float')
+    @argument('n', 'int')
+    @argument('h', 'hex')
+    @argument('f', lambda s: s.upper())
+    def cmd(self, x=1., n=2, h=0, f='a', other=None, *args, **kwargs):
+        return x, n, h, f, other
+
+    @argument('n', 'int')
+    @command
+    def outside(self, n=1):
+        return n
+
+    @command
+    def plain(self, a, b=2):
+        return a, b
+
+
+class TestCommand(unittest.TestCase):
+    def test_metadata(self):
+        self.assertTrue(Ctrl.cmd.command)
+        self.assertEqual(Ctrl.cmd.cmdopts, {'executor': 'thread'})
+        self.assertEqual(Ctrl.cmd.__name__, 'cmd')
+        self.assertEqual(Ctrl().cmd(2., 3), (2., 3, 0, 'a', None))
+
+    def test_options(self):
+        f = command(executor='thread', group='G')(lambda self: None)
+        self.assertEqual(f.cmdopts, {'executor': 'thread', 'group': 'G'})
+        self.assertRaises(ValueError, command(executor='fork'),
+                          lambda self: None)
+
+    def test_getargspec(self):
+        spec = Ctrl.cmd.argspec
+        self.assertEqual(spec.args, ['self', 'x', 'n', 'h', 'f', 'other'])
+        self.assertEqual(spec.varargs, 'args')
+        self.assertEqual(spec.keywords, 'kwargs')
+        self.assertEqual(spec.defaults, (1., 2, 0, 'a', None))
+        self.assertEqual(Ctrl.plain.argspec.args, ['self', 'a', 'b'])
+        self.assertEqual(getargspec(lambda a, b=2: None),
+                         (['a', 'b'], None, None, (2,)))
+
+
+class TestConditioner(unittest.TestCase):
+    def test_convert(self):
+        kwargs = Ctrl.cmd.conditioner({'x': '2.5', 'n': '3', 'h': '1F',
+                                       'f': 'b', 'other': 'raw'})
+        self.assertEqual(kwargs, {'x': 2.5, 'n': 3, 'h': 31, 'f': 'B',
+                                  'other': 'raw'})
+
+    def test_compiled_once(self):
+        self.assertEqual(sorted(Ctrl.cmd.conditioner.converters),
+                         ['f', 'h', 'n', 'x'])
+        self.assertEqual(Ctrl.plain.conditioner({'a': '1'}), {'a': '1'})
+
+    def test_argument_outside_command(self):
+        self.assertEqual(Ctrl.outside.conditioner({'n': '5'}), {'n': 5})
+
+    def test_errors(self):
+        with self.assertRaises(ArgumentError) as cm:
+            Ctrl.cmd.conditioner({'x': 'a', 'n': '1.5', 'h': '1'})
+        e = cm.exception
+        self.assertIsInstance(e, ValueError)
+        self.assertEqual(sorted(e.errors), ['n', 'x'])
+        self.assertTrue(str(e).startswith('n: '))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+"""
+test_cpreaders.py
+jlazear
+
+Tests of the tail mode and memory-mapped readers.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from cpreaders import (TailReader, HexTailReader, MMapDecReader,
+                       MMapHexReader, TAIL_READERS)
+
+
+class ReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.dir, 'data.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, text, mode='a'):
+        with open(self.fname, mode + 'b') as f:
+            f.write(text.encode('ascii'))
+
+    def columns(self, data):
+        return dict((col, list(data[col])) for col in data.columns)
+
+
+class TestTailReader(ReaderTest):
+    def test_incremental(self):
+        self.write('1, 2\n3, 4\n5,')
+        r = TailReader(self.fname)
+        data = r.init_data()
+        self.assertEqual(self.columns(data), {0: [1., 3.], 1: [2., 4.]})
+        self.write(' 6\n7, 8\n')
+        data = r.update_data()
+        self.assertEqual(self.columns(data), {0: [1., 3., 5., 7.],
+                                              1: [2., 4., 6., 8.]})
+        r.close()
+
+    def test_header(self):
+        self.write('# columns: [a, b]\n# navg: 2\n2 4\n6 8\n')
+        r = TailReader(self.fname)
+        data = r.init_data()
+        self.assertEqual(self.columns(data), {'a': [1., 3.], 'b': [2., 4.]})
+        r.close()
+
+    def test_skips_bad_lines(self):
+        self.write('1 2\n3\n4 x\n\n5 6\n# comment\n7 8 9\n')
+        r = TailReader(self.fname)
+        data = r.init_data()
+        self.assertEqual(self.columns(data), {0: [1., 5.], 1: [2., 6.]})
+        r.close()
+
+    def test_rewritten(self):
+        self.write('1 2\n3 4\n')
+        r = TailReader(self.fname)
+        r.init_data()
+        self.write('9 9\n', mode='w')
+        data = r.update_data()
+        self.assertEqual(self.columns(data), {0: [9.], 1: [9.]})
+        self.assertTrue(r.follows(self.fname))
+        r.close()
+
+    def test_hex(self):
+        self.write('000A 00FF\n0010 0001\n')
+        r = HexTailReader(self.fname)
+        data = r.init_data()
+        self.assertEqual(self.columns(data), {'col0': [10., 16.],
+                                              'col1': [255., 1.]})
+        r.close()
+
+    def test_tail_readers(self):
+        self.assertIs(TAIL_READERS['HexReader'], HexTailReader)
+        self.assertIs(TAIL_READERS['DefaultReader'], TailReader)
+
+
+class TestMMapReaders(ReaderTest):
+    def compare(self, mmapclass, tailclass, blocksize=None):
+        """Read the file with both readers, which must agree."""
+        r = mmapclass(self.fname)
+        if blocksize is not None:
+            r.blocksize = blocksize
+        t = tailclass(self.fname)
+        try:
+            expected = self.columns(t.init_data())
+            self.assertEqual(self.columns(r.init_data()), expected)
+            return expected
+        finally:
+            r.close()
+            t.close()
+
+    def test_hex_fixed(self):
+        values = np.arange(3000).reshape(-1, 3)
+        self.write(''.join('{0:04X} {1:04X} {2:04X}\n'.format(*row)
+                           for row in values))
+        data = self.compare(MMapHexReader, HexTailReader, blocksize=100)
+        self.assertEqual(data['col2'], list(values[:, 2].astype(float)))
+
+    def test_hex_variable(self):
+        self.write('a 1ff\nFFFF 0\n12 34\n')
+        data = self.compare(MMapHexReader, HexTailReader)
+        self.assertEqual(data['col0'], [10., 65535., 18.])
+
+    def test_dec(self):
+        self.write('# columns: [x, y]\n0001, 0002\n0003, 0004\n')
+        data = self.compare(MMapDecReader, TailReader)
+        self.assertEqual(data, {'x': [1., 3.], 'y': [2., 4.]})
+
+    def test_dec_ragged(self):
+        self.write('1 2\n3\n4 5\n# comment\n6 7 8\n9 10\n')
+        data = self.compare(MMapDecReader, TailReader)
+        self.assertEqual(data, {0: [1., 4., 9.], 1: [2., 5., 10.]})
+
+    def test_dec_ragged_balanced(self):
+        # As many values as rows*columns, but not two per line
+        self.write('1 2\n3\n4 5\n6 7 8\n9 10\n')
+        data = self.compare(MMapDecReader, TailReader)
+        self.assertEqual(data, {0: [1., 4., 9.], 1: [2., 5., 10.]})
+
+    def test_hex_ragged(self):
+        self.write('1 2\n3\n4 5\n6 7 8\n9 a\n')
+        data = self.compare(MMapHexReader, HexTailReader)
+        self.assertEqual(data, {'col0': [1., 4., 9.], 'col1': [2., 5., 10.]})
+
+    def test_float(self):
+        self.write('1.5, -2\n# comment\n3e2, 4.25\n')
+        data = self.compare(MMapDecReader, TailReader)
+        self.assertEqual(data, {0: [1.5, 300.], 1: [-2., 4.25]})
+
+    def test_float_ragged(self):
+        self.write('1.5 2.5\n3.5\n4.5 5.5\n6.5 7.5 8.5\n9.5 x\n1 2\n')
+        data = self.compare(MMapDecReader, TailReader)
+        self.assertEqual(data, {0: [1.5, 4.5, 1.], 1: [2.5, 5.5, 2.]})
+
+    def test_float_truncated(self):
+        self.write('1.5 2.5\n3.5 4.')
+        r = MMapDecReader(self.fname)
+        self.assertEqual(self.columns(r.init_data()), {0: [1.5], 1: [2.5]})
+        self.write('5\n')
+        self.assertEqual(self.columns(r.update_data()),
+                         {0: [1.5, 3.5], 1: [2.5, 4.5]})
+        r.close()
+
+    def test_appended(self):
+        self.write('0001 0002\n')
+        r = MMapHexReader(self.fname)
+        r.init_data()
+        self.write('0003 0004\n0005 0006\n')
+        data = r.update_data()
+        self.assertEqual(self.columns(data), {'col0': [1., 3., 5.],
+                                              'col1': [2., 4., 6.]})
+        r.close()
+
+    def test_window(self):
+        self.write(''.join('{0:04X} 0000\n'.format(i) for i in range(100)))
+        r = MMapHexReader(self.fname)
+        r.set_window(samples=10)
+        data = r.init_data()
+        self.assertEqual(len(data), 10)
+        self.assertEqual(list(data['col0']), [float(i) for i in
+                                              range(90, 100)])
+        r.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+"""
+test_decimate.py
+jlazear
+
+Tests of the min/max decimation of plotted lines.
+"""
+import unittest
+
+import numpy as np
+
+from gui.decimate import is_sorted, minmax
+
+
+class TestMinMax(unittest.TestCase):
+    def setUp(self):
+        self.x = np.arange(100000, dtype=float)
+        self.y = np.sin(self.x/100.) + (self.x % 7 == 0)
+
+    def test_small(self):
+        x0, y0 = self.x[:10], self.y[:10]
+        x, y = minmax(x0, y0, 0, 10, 100)
+        self.assertIs(x, x0)
+        self.assertIs(y, y0)
+
+    def test_size(self):
+        x, y = minmax(self.x, self.y, 0, 1e5, 500)
+        self.assertLessEqual(len(x), 2*(500 + 8) + 2)
+        self.assertEqual(len(x), len(y))
+
+    def test_envelope(self):
+        x, y = minmax(self.x, self.y, 2e4, 3e4, 200)
+        self.assertEqual((x[0], x[-1]), (self.x[0], self.x[-1]))
+        self.assertEqual((y[0], y[-1]), (self.y[0], self.y[-1]))
+        self.assertEqual(y.max(), self.y.max())
+        self.assertEqual(y.min(), self.y.min())
+        self.assertTrue(is_sorted(x))
+        # Every bin of the view keeps its extremes
+        view = (self.x >= 2e4) & (self.x < 3e4)
+        inside = (x >= 2e4) & (x < 3e4)
+        self.assertEqual(y[inside].max(), self.y[view].max())
+        self.assertEqual(y[inside].min(), self.y[view].min())
+
+    def test_is_sorted(self):
+        self.assertTrue(is_sorted(np.array([1, 1, 2])))
+        self.assertFalse(is_sorted(np.array([1, 0])))
+        self.assertTrue(is_sorted(np.array([])))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+test_dispatch.py
+jlazear
+
+Tests of the worker-pool dispatcher.
+"""
+import threading
+import unittest
+
+from dispatch import Dispatcher
+
+
+class Slow(object):
+    def __init__(self):
+        self.release = threading.Event()
+
+    def wait(self):
+        self.release.wait(5)
+        return 'waited'
+
+    def double(self, x=1):
+        return 2*x
+
+
+class TestDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.ctrl = Slow()
+        self.d = Dispatcher(self.ctrl, max_workers=1)
+
+    def tearDown(self):
+        self.ctrl.release.set()
+        self.d.shutdown(wait=True)
+
+    def test_result_and_callback(self):
+        done = []
+        future = self.d.submit('double', {'x': 3},
+                               callback=lambda name, f: done.append(name))
+        self.assertEqual(future.result(5), 6)
+        self.assertEqual(done, ['double'])
+        self.assertEqual(self.d.in_flight(), 0)
+
+    def test_finish(self):
+        future = self.d.submit('double', {'x': 3}, finish=lambda r: r + 1)
+        self.assertEqual(future.result(5), 7)
+
+    def test_states(self):
+        first = self.d.submit('wait', {})
+        second = self.d.submit('wait', {})
+        state = self.d.state('wait')
+        self.assertTrue(state.busy)
+        self.assertEqual(self.d.in_flight(), 2)
+        self.ctrl.release.set()
+        first.result(5)
+        second.result(5)
+        self.assertEqual((state.queued, state.running), (0, 0))
+
+    def test_cancel_queued(self):
+        first = self.d.submit('wait', {})
+        second = self.d.submit('wait', {})
+        self.assertTrue(second.cancel())
+        self.ctrl.release.set()
+        first.result(5)
+        state = self.d.state('wait')
+        self.assertEqual((state.queued, state.running), (0, 0))
+        self.assertFalse(state.busy)
+        self.assertEqual(self.d.in_flight(), 0)
+
+    def test_cancel_run(self):
+        first = self.d.submit('wait', {})
+        second = self.d.run('sweep', lambda: None)
+        self.assertTrue(second.cancel())
+        self.ctrl.release.set()
+        first.result(5)
+        state = self.d.state('sweep')
+        self.assertEqual((state.queued, state.running), (0, 0))
+
+    def test_unknown_executor(self):
+        self.assertRaises(ValueError, self.d.submit, 'double', {},
+                          executor='gpu')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+"""
+test_headless.py
+jlazear
+
+Tests of running controllers without the GUI.
+"""
+import os
+import sys
+import unittest
+
+from cp import ArgumentError, Controller, argument, command
+from headless import Session, headless_requested, load_controller, main, \
+    make_parser
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+@Controller(headless=True)
+class Ctrl(object):
+    """A headless test controller."""
+    def __init__(self, offset=0):
+        self.offset = offset
+
+    @command
+    @argument('x', 'int')
+    def add(self, x, y=1):
+        """Add the offset to x."""
+        return x + self.offset + int(y)
+
+    @command
+    @argument('command', 'int')
+    @argument('sweep', 'int')
+    def clash(self, command=0, sweep=0, concurrency='c', help='h'):
+        return command, sweep, concurrency, help
+
+    @command
+    def blocks(self, n=2):
+        for i in range(int(n)):
+            yield i
+
+
+class TestSession(unittest.TestCase):
+    def test_made_by_controller(self):
+        session = Ctrl(offset=10)
+        self.assertIsInstance(session, Session)
+        self.assertIsInstance(Ctrl.headless(), Session)
+        self.assertEqual(session.offset, 10)
+        self.assertIn('add', dir(session))
+
+    def test_call(self):
+        with Ctrl(offset=10) as session:
+            self.assertEqual(session.call('add', x='5'), 16)
+            self.assertEqual(session.add(5, 2), 17)
+            self.assertEqual(session.args('add'), [
+                ('x', session.commands['add'].args[0].default), ('y', 1)])
+            self.assertRaises(ArgumentError, session.call, 'add', x='a')
+            self.assertRaises(KeyError, session.call, 'missing')
+
+    def test_sweep(self):
+        session = Ctrl()
+        self.assertEqual(session.sweep('add', x='1:3'), [2, 3, 4])
+
+    def test_requested(self):
+        self.assertTrue(headless_requested(True))
+        self.assertFalse(headless_requested(False))
+        old = os.environ.get('CP_HEADLESS')
+        try:
+            for value, expected in (('1', True), ('no', False), ('', False)):
+                os.environ['CP_HEADLESS'] = value
+                self.assertIs(headless_requested(), expected)
+        finally:
+            if old is None:
+                del os.environ['CP_HEADLESS']
+            else:
+                os.environ['CP_HEADLESS'] = old
+
+
+class TestCommandLine(unittest.TestCase):
+    def run_main(self, *argv):
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            status = main(['tests.test_headless:Ctrl'] + list(argv))
+            return status, sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+    def test_load_controller(self):
+        cls = load_controller('tests.test_headless:Ctrl')
+        self.assertEqual(cls.__name__, 'Ctrl')
+        self.assertFalse(hasattr(cls, 'cls'))
+        self.assertRaises(ValueError, load_controller, 'tests.test_headless')
+
+    def test_call(self):
+        self.assertEqual(self.run_main('add', '--x', '5'), (0, '6\n'))
+        self.assertEqual(self.run_main('add', '--x', '5', '--y', '3'),
+                         (0, '8\n'))
+
+    def test_sweep(self):
+        self.assertEqual(self.run_main('add', '--x', '1,2', '--sweep'),
+                         (0, '2\n3\n'))
+
+    def test_stream(self):
+        self.assertEqual(self.run_main('blocks', '--n', '3'),
+                         (0, '0\n1\n2\n'))
+
+    def test_argument_names_clash_with_options(self):
+        parser = make_parser(Ctrl.cls)
+        options = parser.parse_args(['clash', '--command', '1', '--sweep',
+                                     '2', '--concurrency', '3', '--help',
+                                     '4'])
+        self.assertEqual(options.command, 'clash')
+        self.assertEqual((options.arg_command, options.arg_sweep,
+                          options.arg_concurrency, options.arg_help),
+                         ('1', '2', '3', '4'))
+        self.assertEqual(self.run_main('clash', '--command', '1',
+                                       '--sweep', '2'),
+                         (0, "(1, 2, 'c', 'h')\n"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+"""
+test_imports.py
+jlazear
+
+Tests that importing cp does not import the GUI or NumPy.
+"""
+import os
+import subprocess
+import sys
+import unittest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ('numpy', 'wx', 'matplotlib', 'readers', 'pyoscope')
+
+
+def imported_by(statement):
+    """The heavy modules imported by `statement`, in a fresh
+    interpreter."""
+    code = ('import sys\n{0}\nprint(" ".join(m for m in {1!r} '
+            'if m in sys.modules))'.format(statement, HEAVY))
+    out = subprocess.check_output([sys.executable, '-c', code], cwd=ROOT)
+    return out.decode('ascii').split()
+
+
+class TestLazyImports(unittest.TestCase):
+    def test_cp(self):
+        self.assertEqual(imported_by('import cp'), [])
+
+    def test_decorated_controller(self):
+        self.assertEqual(imported_by(
+            'from cp import Controller, command, argument, reader\n'
+            '@Controller\n'
+            'class Ctrl(object):\n'
+            '    @command\n'
+            '    @reader("HexReader")\n'
+            '    @argument("x", "float_array")\n'
+            '    def cmd(self, x=1):\n'
+            '        pass\n'
+            'Ctrl.headless().call("cmd")'), [])
+
+    def test_literal_on_first_use(self):
+        self.assertEqual(imported_by(
+            'import cp\ncp.argfuncdict["float_array"]("1 2")'), ['numpy'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+"""
+test_literal.py
+jlazear
+
+Tests of the safe literal and array parsers.
+"""
+import unittest
+
+import numpy as np
+
+import literal
+from literal import (float_array, hex_array, int_array, list_of_float,
+                     parse_literal)
+
+
+class TestParseLiteral(unittest.TestCase):
+    def test_literals(self):
+        self.assertEqual(parse_literal(" [1, 2.5, 'a'] "), [1, 2.5, 'a'])
+        self.assertEqual(parse_literal("{'a': (1, None)}"),
+                         {'a': (1, None)})
+        self.assertIs(parse_literal('True'), True)
+
+    def test_never_evaluates(self):
+        for s in ("__import__('os')", '1 + x', '[f() for f in g]'):
+            self.assertRaises(ValueError, parse_literal, s)
+
+    def test_long_flat(self):
+        values = list(range(1000))
+        self.assertEqual(parse_literal(repr(values)), values)
+        self.assertEqual(parse_literal(repr(tuple(values))), tuple(values))
+        floats = [i/4. for i in range(1000)]
+        self.assertEqual(parse_literal(repr(floats)), floats)
+
+    def test_long_nested(self):
+        nested = [[i, i + 1] for i in range(500)]
+        self.assertEqual(parse_literal(repr(nested)), nested)
+        nested = [(i, [i]) for i in range(500)]
+        self.assertEqual(parse_literal(repr(nested)), nested)
+
+    def test_long_not_numbers(self):
+        values = ['a']*1000
+        self.assertEqual(parse_literal(repr(values)), values)
+        self.assertEqual(parse_literal(repr([2**70]*100)), [2**70]*100)
+        for s in ('[' + '1 '*1000 + ']', '[' + '1;'*1000 + '1]',
+                  '[1,,' + '1,'*1000 + '1]'):
+            self.assertRaises(ValueError, parse_literal, s)
+        self.assertEqual(parse_literal('[' + '1, '*1000 + ']'), [1]*1000)
+        self.assertEqual(parse_literal('(' + ' '*1000 + '1)'), 1)
+
+    def test_fast_path_taken(self):
+        s = repr(list(range(1000)))
+        self.assertGreater(len(s), literal._FASTPATH)
+        original = literal.ast.literal_eval
+        literal.ast.literal_eval = None
+        try:
+            self.assertEqual(parse_literal(s), list(range(1000)))
+        finally:
+            literal.ast.literal_eval = original
+
+
+class TestArrays(unittest.TestCase):
+    def test_float_array(self):
+        values = float_array('[1.5, 2;3e3\n-4]')
+        self.assertEqual(values.dtype, np.float64)
+        self.assertEqual(values.tolist(), [1.5, 2., 3000., -4.])
+        self.assertEqual(list_of_float('(1 2)'), [1., 2.])
+        self.assertRaises(ValueError, float_array, '1, a, 3')
+
+    def test_int_array(self):
+        values = int_array('1, 2 -3')
+        self.assertEqual(values.dtype, np.int64)
+        self.assertEqual(values.tolist(), [1, 2, -3])
+        self.assertRaises(ValueError, int_array, '1, 2.5')
+        self.assertEqual(int_array(str(2**63 - 1)).tolist(), [2**63 - 1])
+        self.assertRaises(ValueError, int_array, str(2**63))
+        self.assertRaises(ValueError, int_array, str(-2**63 - 1))
+
+    def test_hex_array(self):
+        self.assertEqual(hex_array('0x1F, 0X20 ff [0x0]').tolist(),
+                         [31, 32, 255, 0])
+        self.assertEqual(hex_array('7fffffffffffffff').tolist(), [2**63 - 1])
+        self.assertRaises(ValueError, hex_array, '8000000000000000')
+
+    def test_hex_prefix_only_starts_numbers(self):
+        for bad in ('A0x10', '10x5', '0x', '1 0x', '0xx1', 'g'):
+            self.assertRaises(ValueError, hex_array, bad)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+test_readiness.py
+jlazear
+
+Tests of the detection of finished output files.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import readiness
+from readiness import wait_ready
+
+
+class TestWaitReady(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.dir, 'out.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_later(self, delay, nwrites=1, interval=0.):
+        def _write():
+            time.sleep(delay)
+            for i in range(nwrites):
+                with open(self.fname, 'a') as f:
+                    f.write('{0}\n'.format(i))
+                time.sleep(interval)
+            self.finished = time.time()
+        thread = threading.Thread(target=_write)
+        thread.start()
+        self.addCleanup(thread.join)
+
+    def test_existing(self):
+        with open(self.fname, 'w') as f:
+            f.write('1\n')
+        start = time.time()
+        self.assertTrue(wait_ready(self.fname))
+        self.assertLess(time.time() - start, 0.5)
+
+    def test_missing(self):
+        start = time.time()
+        self.assertFalse(wait_ready(self.fname, timeout=0.1))
+        self.assertGreaterEqual(time.time() - start, 0.1)
+
+    def test_created_later(self):
+        self.write_later(0.05)
+        self.assertTrue(wait_ready(self.fname, timeout=2.))
+
+    def test_waits_for_writes(self):
+        self.write_later(0., nwrites=10, interval=0.01)
+        self.assertTrue(wait_ready(self.fname, settle=0.05, timeout=2.))
+        self.assertGreaterEqual(time.time(), self.finished)
+
+    def test_polling(self):
+        self.write_later(0.05)
+        deadline = time.time() + 2.
+        self.assertTrue(readiness._wait_polling(self.fname, 0.02, deadline))
+        self.assertFalse(readiness._wait_polling(
+            os.path.join(self.dir, 'missing'), 0.02, time.time() + 0.05))
+
+    def test_ready_hook(self):
+        start = time.time()
+        hook = lambda: time.time() - start > 0.05
+        self.assertTrue(wait_ready(self.fname, ready=hook))
+        self.assertGreaterEqual(time.time() - start, 0.05)
+
+    def test_ready_hook_not_limited_by_file_timeout(self):
+        start = time.time()
+        hook = lambda: time.time() - start > readiness.TIMEOUT + 0.1
+        self.assertTrue(wait_ready(self.fname, ready=hook))
+
+    def test_ready_hook_timeout(self):
+        start = time.time()
+        self.assertFalse(wait_ready(self.fname, timeout=0.1,
+                                    ready=lambda: False))
+        self.assertLess(time.time() - start, 1.)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+"""
+test_registry.py
+jlazear
+
+Tests of the command metadata registry.
+"""
+import unittest
+
+from cp import Controller, command, argument, reader
+from registry import NoDefault, registry_for
+
+
+class Base(object):
+    @command
+    def inherited(self):
+        return 'base'
+
+    @command
+    def overridden(self):
+        return 'base'
+
+
+class Ctrl(Base):
+    @property
+    def hardware(self):
+        raise AssertionError('Properties must not be evaluated')
+
+    @command(group='Setup', ready=True)
+    @reader('HexReader', mode='tail')
+    @argument('arg1', 'int', units='V')
+    def cmd(self, first, arg1=10, arg2='a'):
+        """cmd's docstring"""
+        return first, arg1, arg2
+
+    overridden = None
+
+    def helper(self):
+        pass
+
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        self.reg = registry_for(Ctrl)
+
+    def test_commands(self):
+        self.assertEqual(self.reg.names(), ['cmd', 'inherited'])
+        self.assertEqual(len(self.reg), 2)
+        self.assertIn('cmd', self.reg)
+        self.assertNotIn('helper', self.reg)
+        self.assertEqual([spec.name for spec in self.reg], ['cmd', 'inherited'])
+        self.assertRaises(KeyError, lambda: self.reg['helper'])
+
+    def test_built_once(self):
+        self.assertIs(registry_for(Ctrl), self.reg)
+        # Subclasses get their own registry
+        self.assertIsNot(registry_for(Base), self.reg)
+        self.assertEqual(registry_for(Base).names(),
+                         ['inherited', 'overridden'])
+
+    def test_controller(self):
+        wrapped = Controller(Ctrl)
+        self.assertIs(wrapped.registry, self.reg)
+        self.assertIs(registry_for(wrapped), self.reg)
+
+    def test_spec(self):
+        spec = self.reg['cmd']
+        self.assertEqual(spec.doc, "cmd's docstring")
+        self.assertEqual(spec.options['group'], 'Setup')
+        self.assertEqual(spec.executor, 'thread')
+        self.assertIs(spec.ready, True)
+        self.assertIsNone(spec.ready_timeout)
+        self.assertEqual(spec.reader['mode'], 'tail')
+        self.assertIsNone(spec.stream)
+        self.assertEqual(spec.function(Ctrl(), 'x'), ('x', 10, 'a'))
+        self.assertEqual(self.reg['inherited'].doc, '')
+        self.assertIsNone(self.reg['inherited'].reader)
+
+    def test_args(self):
+        first, arg1, arg2 = self.reg['cmd'].args
+        self.assertEqual([first.name, arg1.name, arg2.name],
+                         ['first', 'arg1', 'arg2'])
+        self.assertTrue(first.required)
+        self.assertIsInstance(first.default, NoDefault)
+        self.assertFalse(arg1.required)
+        self.assertEqual(arg1.default, 10)
+        self.assertEqual(arg1.options, {'units': 'V'})
+        self.assertEqual(arg1.converter('12'), 12)
+        self.assertIsNone(arg2.converter)
+
+    def test_immutable(self):
+        spec = self.reg['cmd']
+        with self.assertRaises(AttributeError):
+            spec.name = 'other'
+        with self.assertRaises(AttributeError):
+            del spec.doc
+        with self.assertRaises(AttributeError):
+            spec.args[0].default = 1
+
+    def test_conditioner(self):
+        kwargs = self.reg['cmd'].conditioner({'first': 'x', 'arg1': '12'})
+        self.assertEqual(kwargs, {'first': 'x', 'arg1': 12})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,246 @@
+"""
+test_remote.py
+jlazear
+
+Tests of the remote control server and client.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+import numpy as np
+
+from cp import argument, command, stream
+from remote import (Client, FrameBuffer, RemoteError, Server, decode, encode,
+                    parse_address)
+
+
+PY3 = sys.version_info >= (3, 5)
+
+
+class TestFraming(unittest.TestCase):
+    def round_trip(self, message):
+        frame = encode(message, b'J')
+        frames = FrameBuffer().feed(frame)
+        self.assertEqual(len(frames), 1)
+        return decode(*frames[0])
+
+    def test_values(self):
+        message = {'id': 1, 'value': [1, 2.5, u'a', None, True],
+                   'bytes': b'\xff\x00', 'text': b'abc', 3: 'key'}
+        self.assertEqual(self.round_trip(message),
+                         {'id': 1, 'value': [1, 2.5, u'a', None, True],
+                          'bytes': b'\xff\x00', 'text': u'abc', '3': 'key'})
+
+    def test_numpy(self):
+        value = np.arange(6, dtype='<i2').reshape(2, 3)
+        decoded = self.round_trip({'a': value, 's': np.float32(1.5)})
+        self.assertEqual(decoded['a'].dtype, value.dtype)
+        self.assertEqual(decoded['a'].tolist(), value.tolist())
+        self.assertEqual(decoded['s'], 1.5)
+
+    def test_object_arrays(self):
+        value = np.array([1, 'a', None, np.float64(2.5)], dtype=object)
+        self.assertEqual(self.round_trip({'a': value})['a'],
+                         [1, 'a', None, 2.5])
+        records = np.array([(1, 2.)], dtype=[('a', 'i4'), ('b', 'f8')])
+        self.assertEqual(self.round_trip({'a': records})['a'], [[1, 2.]])
+
+    def test_unknown(self):
+        self.assertEqual(self.round_trip({'a': object})['a'],
+                         repr(object))
+
+    def test_partial_frames(self):
+        data = encode({'a': 1}, b'J') + encode({'b': 2}, b'J')
+        frames = FrameBuffer()
+        received = []
+        for i in range(len(data)):
+            received.extend(frames.feed(data[i:i + 1]))
+        self.assertEqual([decode(*f) for f in received],
+                         [{'a': 1}, {'b': 2}])
+        self.assertRaises(RemoteError, FrameBuffer().feed, b'\0\0\0\0')
+        self.assertRaises(RemoteError, decode, b'X', b'{}')
+
+    def test_parse_address(self):
+        self.assertEqual(parse_address('5555'), ('127.0.0.1', 5555))
+        self.assertEqual(parse_address('0.0.0.0:80'), ('0.0.0.0', 80))
+        self.assertEqual(parse_address('/tmp/ctrl.sock'), '/tmp/ctrl.sock')
+
+
+class Instrument(object):
+    def __init__(self):
+        self.stopped = threading.Event()
+
+    @command
+    @argument('x', 'float')
+    def scale(self, x=1., factor=2):
+        return x*factor
+
+    @command
+    def slow(self, delay=0.2, value=0):
+        time.sleep(delay)
+        return value
+
+    @command
+    def fail(self):
+        raise KeyError('missing')
+
+    @command
+    def array(self):
+        return np.arange(4.)
+
+    @command
+    @stream(columns=['i', 'twice'])
+    def acquire(self, n=3):
+        return [[i, 2*i] for i in range(n)]
+
+    @command
+    def forever(self):
+        try:
+            i = 0
+            while True:
+                yield {'i': [i]}
+                i += 1
+                time.sleep(0.001)
+        finally:
+            self.stopped.set()
+
+
+if PY3:
+    # `async def` is a syntax error on Python 2
+    namespace = {'command': command}
+    exec('''
+import asyncio
+
+@command
+async def wait(self, value=1):
+    await asyncio.sleep(0.01)
+    return value
+''', namespace)
+    Instrument.wait = namespace['wait']
+
+
+@unittest.skipUnless(PY3, 'the server needs Python 3')
+class TestServer(unittest.TestCase):
+    address = ('127.0.0.1', 0)
+    codec = None
+
+    def setUp(self):
+        self.ctrl = Instrument()
+        self.server = Server(self.ctrl, self.address, workers=8)
+        self.client = Client(self.server.address, timeout=5,
+                             codec=self.codec)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+
+    def test_call(self):
+        self.assertEqual(self.client.ping(), 'pong')
+        self.assertEqual(self.client.call('scale', x='1.5'), 3.)
+        self.assertEqual(self.client.call('scale', x=2, factor=3), 6)
+        self.assertEqual(self.client.call('array').tolist(), [0., 1., 2., 3.])
+        self.assertEqual(self.client.call('wait', value='a'), 'a')
+
+    def test_commands(self):
+        commands = dict((c['name'], c) for c in self.client.commands())
+        self.assertEqual(sorted(commands), ['acquire', 'array', 'fail',
+                                            'forever', 'scale', 'slow',
+                                            'wait'])
+        self.assertEqual(commands['scale']['args'], [
+            {'name': 'x', 'required': False, 'default': 1.},
+            {'name': 'factor', 'required': False, 'default': 2}])
+        self.assertTrue(commands['acquire']['stream'])
+        self.assertEqual(commands['wait']['executor'], 'async')
+
+    def test_errors(self):
+        for name, kwargs, type in (('fail', {}, 'KeyError'),
+                                   ('missing', {}, 'KeyError'),
+                                   ('scale', {'x': 'a'}, 'ArgumentError'),
+                                   ('scale', {'y': 1}, 'TypeError')):
+            with self.assertRaises(RemoteError) as cm:
+                self.client.call(name, **kwargs)
+            self.assertEqual(cm.exception.type, type)
+        self.assertEqual(self.client.call('scale'), 2.)  # Still working
+        self.assertEqual(self.client.pending, {})
+
+    def test_pipelined(self):
+        start = time.time()
+        futures = [self.client.submit('slow', value=i) for i in range(8)]
+        self.assertEqual([f.result(5) for f in futures], list(range(8)))
+        self.assertLess(time.time() - start, 8*0.2)
+
+    def test_threads(self):
+        errors = []
+
+        def _calls(i):
+            for j in range(20):
+                value = self.client.call('scale', x=i, factor=j)
+                if value != i*j:
+                    errors.append((i, j, value))
+        threads = [threading.Thread(target=_calls, args=(i,))
+                   for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(errors, [])
+
+    def test_stream(self):
+        s = self.client.stream('acquire', n=3)
+        blocks = list(s)
+        self.assertEqual(s.columns, ['i', 'twice'])
+        self.assertEqual(s.nrows, 3)
+        self.assertEqual([(b['i'].tolist(), b['twice'].tolist())
+                          for b in blocks],
+                         [([0], [0]), ([1], [2]), ([2], [4])])
+        self.assertEqual(list(self.client.stream('acquire', n=0)), [])
+        self.assertEqual(self.client.pending, {})
+
+    def test_not_streamed(self):
+        self.assertRaises(RemoteError, list, self.client.stream('scale'))
+        with self.assertRaises(RemoteError) as cm:
+            self.client.call('acquire')
+        self.assertEqual(cm.exception.type, 'TypeError')
+        self.assertEqual(self.client.pending, {})
+
+    def test_cancel(self):
+        s = self.client.stream('forever')
+        self.assertEqual(next(s)['i'].tolist(), [0])
+        s.cancel()
+        for block in s:  # Ends soon after the cancel
+            pass
+        self.assertTrue(self.ctrl.stopped.wait(5))
+
+    def test_server_closed(self):
+        future = self.client.submit('slow', delay=0.5)
+        self.server.close()
+        self.assertRaises(RemoteError, future.result, 5)
+        self.client.receiver.join(5)
+        self.assertRaises(RemoteError, self.client.ping)
+
+
+@unittest.skipUnless(PY3, 'the server needs Python 3')
+class TestServerJSON(TestServer):
+    codec = b'J'
+
+
+@unittest.skipUnless(PY3 and hasattr(__import__('socket'), 'AF_UNIX'),
+                     'the server needs Python 3 and Unix sockets')
+class TestServerUnix(TestServer):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.address = os.path.join(self.dir, 'ctrl.sock')
+        TestServer.setUp(self)
+
+    def tearDown(self):
+        TestServer.tearDown(self)
+        shutil.rmtree(self.dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,191 @@
+"""
+test_resources.py
+jlazear
+
+Tests of the connection pools.
+"""
+import socket
+import threading
+import unittest
+
+from resources import (Pool, PoolClosed, TCPTransport, TransportError,
+                       close_resources, resource)
+
+
+class FakeTransport(object):
+    count = 0
+
+    def __init__(self, fail=0):
+        FakeTransport.count += 1
+        self.id = FakeTransport.count
+        self.fail = fail
+        self.closed = False
+        self.ok = True
+
+    def query(self, data):
+        if self.fail:
+            self.fail -= 1
+            raise TransportError('failed')
+        return self.id, data
+
+    def healthy(self):
+        return self.ok
+
+    def close(self):
+        self.closed = True
+
+
+class TestPool(unittest.TestCase):
+    def setUp(self):
+        self.made = []
+        self.pool = Pool(self.factory, size=2)
+
+    def factory(self, fail=0):
+        conn = FakeTransport(fail)
+        self.made.append(conn)
+        return conn
+
+    def test_reuse(self):
+        first = self.pool.query(b'a')
+        second = self.pool.query(b'b')
+        self.assertEqual(first[0], second[0])
+        self.assertEqual(len(self.made), 1)
+        self.assertEqual((self.pool.opened, self.pool.acquired), (1, 2))
+
+    def test_size(self):
+        a = self.pool.acquire()
+        b = self.pool.acquire()
+        self.assertIsNot(a, b)
+        self.assertRaises(TransportError, self.pool.acquire, 0.05)
+        threading.Timer(0.05, self.pool.release, [a]).start()
+        self.assertIs(self.pool.acquire(5), a)
+
+    def test_broken(self):
+        with self.assertRaises(TransportError):
+            with self.pool.connection() as conn:
+                raise TransportError('lost')
+        self.assertTrue(conn.closed)
+        self.assertEqual(self.pool.nopen, 0)
+        self.assertIsNot(self.pool.acquire(), conn)
+
+    def test_error_keeps_connection(self):
+        with self.assertRaises(ValueError):
+            with self.pool.connection() as conn:
+                raise ValueError('bad reply')
+        self.assertFalse(conn.closed)
+        self.assertIs(self.pool.acquire(), conn)
+
+    def test_interrupted(self):
+        with self.assertRaises(KeyboardInterrupt):
+            with self.pool.connection() as conn:
+                raise KeyboardInterrupt
+        self.assertTrue(conn.closed)
+        self.assertEqual((self.pool.nopen, self.pool.idle), (0, []))
+        self.assertIsNot(self.pool.acquire(), conn)
+
+    def test_retries(self):
+        pool = Pool(lambda: self.factory(fail=not self.made), retries=1)
+        self.assertEqual(pool.query(b'a')[1], b'a')
+        self.assertEqual(len(self.made), 2)
+        self.assertTrue(self.made[0].closed)
+        pool = Pool(lambda: self.factory(fail=1))
+        self.assertRaises(TransportError, pool.query, b'a')
+
+    def test_check(self):
+        pool = Pool(self.factory, check_after=0.)
+        conn = pool.acquire()
+        pool.release(conn)
+        self.assertIs(pool.acquire(), conn)
+        pool.release(conn)
+        conn.ok = False
+        self.assertIsNot(pool.acquire(), conn)
+        self.assertTrue(conn.closed)
+
+    def test_factory_fails(self):
+        def factory():
+            raise TransportError('refused')
+        pool = Pool(factory)
+        self.assertRaises(TransportError, pool.acquire)
+        self.assertEqual(pool.nopen, 0)
+
+    def test_close(self):
+        a = self.pool.acquire()
+        b = self.pool.acquire()
+        self.pool.release(a)
+        self.pool.close()
+        self.assertTrue(a.closed)
+        self.assertFalse(b.closed)
+        self.pool.release(b)
+        self.assertTrue(b.closed)
+        self.assertRaises(PoolClosed, self.pool.acquire)
+
+
+class Ctrl(object):
+    def __init__(self):
+        self.made = 0
+
+    @resource(size=3)
+    def inst(self):
+        self.made += 1
+        return FakeTransport()
+
+
+class TestResource(unittest.TestCase):
+    def test_pool_per_instance(self):
+        ctrl = Ctrl()
+        self.assertIsInstance(Ctrl.inst, resource)
+        self.assertIs(ctrl.inst, ctrl.inst)
+        self.assertEqual(ctrl.inst.size, 3)
+        self.assertIsNot(Ctrl().inst, ctrl.inst)
+        ctrl.inst.query(b'a')
+        ctrl.inst.query(b'b')
+        self.assertEqual(ctrl.made, 1)
+
+    def test_close_resources(self):
+        ctrl = Ctrl()
+        conn = ctrl.inst.acquire()
+        ctrl.inst.release(conn)
+        close_resources(ctrl)
+        self.assertTrue(conn.closed)
+        self.assertTrue(ctrl.inst.closed)
+
+
+class TestTCPTransport(unittest.TestCase):
+    def setUp(self):
+        self.server = socket.socket()
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(1)
+        self.thread = threading.Thread(target=self.echo)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def echo(self):
+        conn, _ = self.server.accept()
+        f = conn.makefile('rb')
+        for line in iter(f.readline, b''):
+            conn.sendall(line.upper())
+            if line == b'bye\n':
+                break
+        f.close()
+        conn.close()
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_query(self):
+        t = TCPTransport(*self.server.getsockname())
+        self.assertEqual(t.query(b'idn?'), b'IDN?')
+        t.write(b'a')
+        t.write(b'b')
+        self.assertEqual((t.read(), t.read()), (b'A', b'B'))
+        self.assertTrue(t.healthy())
+        self.assertEqual(t.query(b'bye'), b'BYE')
+        self.thread.join(5)
+        self.assertFalse(t.healthy())
+        self.assertRaises(TransportError, t.read)
+        t.close()
+        self.assertFalse(t.healthy())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+"""
+test_ringbuffer.py
+jlazear
+
+Tests of the fixed-capacity ring buffer.
+"""
+import unittest
+
+import numpy as np
+
+from ringbuffer import RingBuffer
+
+
+class TestRingBuffer(unittest.TestCase):
+    def rows(self, start, stop):
+        return np.column_stack([np.arange(start, stop),
+                                -np.arange(start, stop)])
+
+    def test_append(self):
+        buf = RingBuffer(['a', 'b'], 10)
+        buf.append(self.rows(0, 4))
+        self.assertEqual(len(buf), 4)
+        self.assertEqual(list(buf['b']), [0., -1., -2., -3.])
+
+    def test_wraps(self):
+        buf = RingBuffer(['a', 'b'], 10)
+        for i in range(0, 37, 3):
+            buf.append(self.rows(i, i + 3))
+        self.assertEqual(len(buf), 10)
+        self.assertEqual(list(buf['a']), list(range(29, 39)))
+        self.assertEqual(list(buf['b']), list(-np.arange(29, 39)))
+
+    def test_big_block(self):
+        buf = RingBuffer(['a', 'b'], 10)
+        buf.append(self.rows(0, 25))
+        self.assertEqual(list(buf['a']), list(range(15, 25)))
+
+    def test_append_columns(self):
+        buf = RingBuffer(['a', 'b'], 10)
+        buf.append(self.rows(0, 7))
+        buf.append_columns([np.arange(7, 15), -np.arange(7, 15)])
+        self.assertEqual(list(buf['a']), list(range(5, 15)))
+        self.assertEqual(list(buf['b']), list(-np.arange(5, 15)))
+
+    def test_discard_before(self):
+        buf = RingBuffer(['a', 'b'], 10)
+        buf.append(self.rows(0, 8))
+        buf.discard_before('a', 5)
+        self.assertEqual(list(buf['a']), [5., 6., 7.])
+        buf.clear()
+        self.assertEqual(len(buf), 0)
+
+    def test_shape(self):
+        buf = RingBuffer(['a', 'b'], 10)
+        self.assertRaises(ValueError, buf.append, np.zeros((3, 3)))
+        self.assertRaises(ValueError, RingBuffer, ['a'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+"""
+test_scheduler.py
+jlazear
+
+Tests of the adaptive plot update scheduler.
+"""
+import unittest
+
+from gui.scheduler import UpdateScheduler
+
+
+class TestUpdateScheduler(unittest.TestCase):
+    def test_max_fps(self):
+        s = UpdateScheduler(max_fps=50.)
+        self.assertAlmostEqual(s.drew(0.001), 0.02)
+
+    def test_slow_draws(self):
+        # The GUI gets at least as much idle time as a draw takes
+        s = UpdateScheduler(max_fps=50.)
+        self.assertAlmostEqual(s.drew(0.1), 0.1)
+
+    def test_backoff(self):
+        s = UpdateScheduler(max_fps=10., min_fps=2., backoff=2.)
+        self.assertAlmostEqual(s.idle(), 0.2)
+        self.assertAlmostEqual(s.idle(), 0.4)
+        self.assertAlmostEqual(s.idle(), 0.5)
+        self.assertAlmostEqual(s.idle(), 0.5)
+        self.assertAlmostEqual(s.drew(0.001), 0.1)  # Back to full speed
+
+    def test_stats(self):
+        s = UpdateScheduler()
+        s.drew(0.01)
+        s.drew(0.03)
+        self.assertGreater(s.fps, 0.)
+        self.assertGreater(s.draw_time, 0.01)
+        self.assertLess(s.draw_time, 0.03)
+
+
+if __name__ == '__main__':
+    unittest.main()
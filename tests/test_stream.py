@@ -0,0 +1,153 @@
+"""
+test_stream.py
+jlazear
+
+Tests of streaming data from commands to the plot.
+"""
+import threading
+import unittest
+from collections import OrderedDict
+
+import numpy as np
+
+from cp import command, stream
+from registry import registry_for
+from stream import (Stream, StreamClosed, StreamFull, StreamReader,
+                    isstream, pump)
+
+
+class TestStream(unittest.TestCase):
+    def test_blocks(self):
+        s = Stream()
+        s.put(OrderedDict([('t', [1., 2.]), ('v', [3., 4.])]))
+        s.put([[5., 6.]])
+        s.put([7., 8.])
+        self.assertEqual(s.columns, ['t', 'v'])
+        self.assertEqual((s.nput, s.nrows), (3, 4))
+        blocks = s.get()
+        self.assertEqual([[list(c) for c in b] for b in blocks],
+                         [[[1., 2.], [3., 4.]], [[5.], [6.]], [[7.], [8.]]])
+        self.assertEqual(s.get(), [])
+
+    def test_columns(self):
+        s = Stream()
+        s.put(np.zeros((2, 3)))
+        self.assertEqual(s.columns, [0, 1, 2])
+        self.assertRaises(ValueError, s.put, np.zeros((2, 2)))
+        self.assertRaises(ValueError, s.put, np.zeros((2, 2, 2)))
+        self.assertRaises(ValueError, Stream, maxblocks=0)
+
+    def test_bounded(self):
+        s = Stream(maxblocks=2)
+        s.put([1])
+        s.put([2])
+        self.assertRaises(StreamFull, s.put, [3], 0.01)
+        threading.Timer(0.05, s.get).start()
+        s.put([3], 5)  # Unblocked by the get
+        self.assertEqual(len(s.get()), 1)
+
+    def test_close(self):
+        s = Stream(maxblocks=1)
+        s.put([1])
+        threading.Timer(0.05, s.close).start()
+        self.assertRaises(StreamClosed, s.put, [2])  # Unblocked by the close
+        self.assertEqual(len(s.get()), 1)  # Queued blocks may still be taken
+
+
+class TestPump(unittest.TestCase):
+    def test_exhausted(self):
+        s = Stream()
+        self.assertEqual(pump(iter([[1, 2], [3, 4]]), s), 2)
+        self.assertTrue(s.closed)
+
+    def test_closed_stops_generator(self):
+        s = Stream(maxblocks=1)
+        state = []
+
+        def gen():
+            try:
+                i = 0
+                while True:
+                    yield [i]
+                    i += 1
+            finally:
+                state.append('cleaned up')
+
+        thread = threading.Thread(target=pump, args=(gen(), s))
+        thread.start()
+        s.get()
+        s.close()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(state, ['cleaned up'])
+
+    def test_isstream(self):
+        self.assertTrue(isstream(x for x in ()))
+        self.assertFalse(isstream([1, 2]))
+        self.assertTrue(isstream([1, 2], declared=True))
+        for value in ('a', b'a', {'a': 1}, 1, None):
+            self.assertFalse(isstream(value, declared=True))
+
+
+class TestStreamReader(unittest.TestCase):
+    def test_read(self):
+        s = Stream(['a', 'b'])
+        r = StreamReader(s)
+        data = r.init_data()
+        self.assertEqual(list(data.columns), ['a', 'b'])
+        self.assertEqual(len(data), 0)
+        signature = r.signature()
+        s.put([[1, 2], [3, 4]])
+        s.put([5, 6])
+        self.assertNotEqual(r.signature(), signature)
+        data = r.update_data()
+        self.assertEqual(list(data['a']), [1., 3., 5.])
+        self.assertEqual(list(data['b']), [2., 4., 6.])
+        self.assertTrue(r.follows(s))
+        r.close()
+        self.assertTrue(s.closed)
+        self.assertRaises(TypeError, StreamReader, 'file.txt')
+        self.assertIs(Stream.reader_class, StreamReader)
+
+    def test_window(self):
+        s = Stream()
+        r = StreamReader(s)
+        r.set_window(samples=3)
+        r.init_data()
+        for i in range(10):
+            s.put([i, -i])
+        self.assertEqual(list(r.update_data()[0]), [7., 8., 9.])
+
+
+class Ctrl(object):
+    @command
+    def gen(self, n=3):
+        for i in range(n):
+            yield [i]
+
+    @command
+    @stream(columns=['t', 'v'], maxblocks=4)
+    def declared(self):
+        return [[0, 1], [1, 2]]
+
+
+class TestStreamCommands(unittest.TestCase):
+    def test_specs(self):
+        reg = registry_for(Ctrl)
+        self.assertIsNone(reg['gen'].stream)
+        self.assertEqual(reg['declared'].stream['columns'], ['t', 'v'])
+        self.assertEqual(reg['declared'].stream['maxblocks'], 4)
+
+    def test_pumped(self):
+        s = Stream(['t', 'v'], maxblocks=4)
+        pump(Ctrl().declared(), s)
+        self.assertEqual(s.nrows, 2)
+
+    def test_streams_run_on_threads(self):
+        def gen(self):
+            yield [1]
+        self.assertRaises(ValueError, command(executor='process'), gen)
+
+
+if __name__ == '__main__':
+    unittest.main()
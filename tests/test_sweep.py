@@ -0,0 +1,165 @@
+"""
+test_sweep.py
+jlazear
+
+Tests of batch and sweep execution of commands.
+"""
+import threading
+import time
+import unittest
+
+from cp import ArgumentError, argument, command
+from registry import registry_for
+from sweep import Latest, SweepStopped, make_points, parse_values, run
+
+
+class Ctrl(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.inflight = self.maxinflight = 0
+
+    @command(concurrency=4)
+    @argument('x', 'float')
+    @argument('n', 'int')
+    @argument('name', 'string')
+    @argument('values', 'list')
+    def cmd(self, x=0., n=1, name='a', values=None, raw=2, flag=False):
+        with self.lock:
+            self.inflight += 1
+            self.maxinflight = max(self.maxinflight, self.inflight)
+        time.sleep(0.02)
+        with self.lock:
+            self.inflight -= 1
+        if x < 0:
+            raise RuntimeError('negative')
+        return x*n
+
+
+REG = registry_for(Ctrl)
+
+
+class TestValues(unittest.TestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_values('0:3'), ['0', '1', '2', '3'])
+        self.assertEqual(parse_values('3:0:-2'), ['3', '1'])
+        self.assertEqual(parse_values('0:1:0.25'),
+                         ['0', '0.25', '0.5', '0.75', '1'])
+        self.assertEqual(parse_values('0:0.3:0.1'),
+                         ['0', '0.1', '0.2', '0.3'])
+        self.assertEqual(parse_values(' 1, 2.5 ,-3'), ['1', '2.5', '-3'])
+        self.assertEqual(parse_values('abc'), ['abc'])
+        for bad in ('0:1:0', '1:0', '0:1:-0.5'):
+            self.assertRaises(ValueError, parse_values, bad)
+
+
+class TestPoints(unittest.TestCase):
+    def test_product(self):
+        points = make_points(REG['cmd'], {'n': '1, 2', 'x': '0:1:0.5'})
+        self.assertEqual(points, [{'x': x, 'n': n} for x in (0., .5, 1.)
+                                  for n in (1, 2)])
+
+    def test_only_numeric_expanded(self):
+        points = make_points(REG['cmd'], {'name': '10:30',
+                                          'values': '1, 2', 'raw': '1, 2',
+                                          'flag': '1, 2'})
+        self.assertEqual(points, [{'name': '10:30', 'values': [1, 2],
+                                   'raw': '1', 'flag': '1, 2'},
+                                  {'name': '10:30', 'values': [1, 2],
+                                   'raw': '2', 'flag': '1, 2'}])
+
+    def test_lists(self):
+        points = make_points(REG['cmd'], {'name': ['a', 'b']})
+        self.assertEqual(points, [{'name': 'a'}, {'name': 'b'}])
+
+    def test_conditioned_once(self):
+        calls = []
+        def afunc(value):
+            calls.append(value)
+            return int(value)
+        f = command(argument('x', afunc)(lambda self, x=0: x))
+        spec = registry_for(type('C', (object,), {'f': f}))['f']
+        points = make_points(spec, {'x': ['1', '2', '1', '1']})
+        self.assertEqual([p['x'] for p in points], [1, 2, 1, 1])
+        self.assertEqual(sorted(calls), ['1', '2'])
+
+    def test_errors(self):
+        with self.assertRaises(ArgumentError) as cm:
+            make_points(REG['cmd'], {'x': '0:1:0'})
+        self.assertEqual(list(cm.exception.errors), ['x'])
+        self.assertRaises(ArgumentError, make_points, REG['cmd'],
+                          {'n': '1, 2.5'})
+
+
+class TestRun(unittest.TestCase):
+    def setUp(self):
+        self.ctrl = Ctrl()
+        self.spec = REG['cmd']
+
+    def test_pipelined(self):
+        points = make_points(self.spec, {'x': '0:19'})
+        progress = []
+        results = run(self.ctrl, self.spec, points, interval=0.,
+                      progress=lambda *args: progress.append(args))
+        self.assertEqual(results, [float(x) for x in range(20)])
+        self.assertEqual(self.ctrl.maxinflight, 4)
+        self.assertEqual(progress[-1], (20, 20, 19.))
+        self.assertEqual(len(progress), 21)
+
+    def test_concurrency(self):
+        points = make_points(self.spec, {'x': '0:5'})
+        run(self.ctrl, self.spec, points, concurrency=1)
+        self.assertEqual(self.ctrl.maxinflight, 1)
+
+    def test_error(self):
+        points = make_points(self.spec, {'x': '0:-20:-1'})
+        self.assertRaises(RuntimeError, run, self.ctrl, self.spec, points)
+
+    def test_stop(self):
+        stop = threading.Event()
+        points = make_points(self.spec, {'x': '0:99'})
+        threading.Timer(0.05, stop.set).start()
+        with self.assertRaises(SweepStopped) as cm:
+            run(self.ctrl, self.spec, points, stop=stop)
+        results = cm.exception.results
+        self.assertEqual(len(results), 100)
+        self.assertEqual(results[0], 0.)
+
+
+class TestLatest(unittest.TestCase):
+    def test_latest_only(self):
+        release = threading.Event()
+        seen = []
+        def func(value):
+            release.wait(5)
+            seen.append(value)
+        latest = Latest(func)
+        for value in range(10):
+            latest.submit(value)  # Never blocks
+        release.set()
+        self.assertTrue(latest.wait(5))
+        self.assertEqual(seen, [0, 9])
+        latest.submit(10)
+        self.assertTrue(latest.wait(5))
+        self.assertEqual(seen, [0, 9, 10])
+
+    def test_error(self):
+        def func(value):
+            if value == 'bad':
+                raise ValueError(value)
+        latest = Latest(func)
+        hook = threading.excepthook if hasattr(threading, 'excepthook') \
+            else None
+        if hook is not None:
+            threading.excepthook = lambda args: None
+        try:
+            latest.submit('bad')
+            self.assertTrue(latest.wait(5))
+        finally:
+            if hook is not None:
+                threading.excepthook = hook
+        latest.submit('good')
+        self.assertTrue(latest.wait(5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+"""
+test_worker.py
+jlazear
+
+Tests of the shared memory ring buffers and of controllers running in a
+worker process.
+"""
+import os
+import threading
+import time
+import unittest
+
+import numpy as np
+
+from cp import command, stream
+from worker import RingReader, SharedRing, WorkerError, WorkerProxy
+
+
+class TestSharedRing(unittest.TestCase):
+    def setUp(self):
+        self.ring = SharedRing(2, 4)
+
+    def tearDown(self):
+        self.ring.release()
+        self.ring.unlink()
+
+    def write(self, start, stop):
+        values = np.arange(start, stop, dtype=float)
+        self.ring.write([values, -values])
+
+    def test_read(self):
+        self.write(0, 3)
+        columns, end, dropped = self.ring.read(0)
+        self.assertEqual([list(c) for c in columns],
+                         [[0., 1., 2.], [0., -1., -2.]])
+        self.assertEqual((end, dropped), (3, 0))
+        self.write(3, 5)  # Wraps around
+        columns, end, dropped = self.ring.read(end)
+        self.assertEqual(list(columns[0]), [3., 4.])
+        self.assertEqual((end, dropped), (5, 0))
+        self.assertEqual(len(self.ring.read(end)[0][0]), 0)
+
+    def test_lapped(self):
+        self.write(0, 3)
+        self.write(3, 9)
+        columns, end, dropped = self.ring.read(0)
+        self.assertEqual(list(columns[0]), [5., 6., 7., 8.])
+        self.assertEqual((end, dropped), (9, 5))
+        self.write(9, 20)  # More than the capacity at once
+        columns, end, dropped = self.ring.read(end)
+        self.assertEqual(list(columns[1]), [-16., -17., -18., -19.])
+        self.assertEqual((end, dropped), (20, 7))
+
+    def test_torn_rows_discarded(self):
+        self.write(0, 4)
+        # A writer that has started to overwrite the two oldest rows
+        self.ring._header[4] = 6
+        columns, end, dropped = self.ring.read(0)
+        self.assertEqual(list(columns[0]), [2., 3.])
+        self.assertEqual((end, dropped), (4, 2))
+
+    def test_attach(self):
+        self.write(0, 2)
+        other = SharedRing(name=self.ring.name)
+        try:
+            self.assertEqual((other.ncols, other.capacity), (2, 4))
+            self.assertEqual(list(other.read(0)[0][0]), [0., 1.])
+            self.assertFalse(other.closed)
+            self.ring.close_writer()
+            self.assertTrue(other.closed)
+        finally:
+            other.release()
+
+    def test_size(self):
+        self.assertRaises(ValueError, SharedRing, 0, 4)
+        self.assertRaises(ValueError, SharedRing, 1, 0)
+
+
+class Acquisition(object):
+    """Runs in the worker process."""
+    def __init__(self, offset=0):
+        if offset is None:
+            raise ValueError('offset must be a number')
+        self.offset = offset
+
+    @command
+    def add(self, x=1):
+        return x + self.offset
+
+    @command
+    def pid(self):
+        return os.getpid()
+
+    @command
+    def fail(self):
+        raise KeyError('failed')
+
+    @command
+    def unpicklable(self):
+        return threading.Lock()
+
+    @command
+    @stream(columns=['i', 'square'], capacity=8)
+    def squares(self, n=5):
+        return [[i, i*i] for i in range(n)]
+
+    @command
+    def forever(self):
+        i = 0
+        while True:
+            yield [i]
+            i += 1
+            time.sleep(0.001)
+
+
+class TestWorkerProxy(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.proxy = WorkerProxy(Acquisition, (10,), workers=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.proxy.close()
+
+    def test_call(self):
+        self.assertEqual(self.proxy.add(2), 12)
+        self.assertEqual(self.proxy.call('add', x=3), 13)
+        self.assertNotEqual(self.proxy.pid(), os.getpid())
+        self.assertEqual(self.proxy.offset, 10)
+        self.assertIs(self.proxy.controller_class, Acquisition)
+
+    def test_errors(self):
+        self.assertRaises(KeyError, self.proxy.fail)
+        self.assertRaises(WorkerError, self.proxy.unpicklable)
+        self.assertRaises(AttributeError, getattr, self.proxy, 'missing')
+        self.assertEqual(self.proxy.add(), 11)  # Still working
+
+    def test_stream(self):
+        s = self.proxy.squares(n=5)
+        self.assertIs(s.wait(5), s)
+        self.assertEqual(s.columns, ['i', 'square'])
+        self.assertEqual(s.nrows, 5)
+        self.assertTrue(s.ring.closed)
+        r = RingReader(s)
+        data = r.init_data()
+        self.assertEqual(list(data['square']), [0., 1., 4., 9., 16.])
+        self.assertEqual(r.dropped, 0)
+
+    def test_stream_overrun(self):
+        s = self.proxy.squares(n=20)  # Capacity 8
+        s.wait(5)
+        r = RingReader(s)
+        data = r.init_data()
+        self.assertEqual(list(data['i']), [float(i) for i in range(12, 20)])
+        self.assertEqual(r.dropped, 12)
+
+    def test_stop_stream(self):
+        s = self.proxy.forever()
+        r = RingReader(s)
+        r.init_data()
+        deadline = time.time() + 5
+        while len(r.update_data()) < 10 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertGreaterEqual(len(r.data), 10)
+        r.close()  # Stops the command
+        s.wait(5)
+        self.assertTrue(s.done.is_set())
+        self.assertTrue(s.ring.closed)
+
+
+class TestWorkerLifetime(unittest.TestCase):
+    def test_constructor_error(self):
+        self.assertRaises(ValueError, WorkerProxy, Acquisition, (None,))
+
+    def test_close(self):
+        proxy = WorkerProxy(Acquisition)
+        proxy.close()
+        self.assertFalse(proxy.process.is_alive())
+        proxy.receiver.join(5)
+        self.assertRaises(WorkerError, proxy.add)
+
+
+if __name__ == '__main__':
+    unittest.main()
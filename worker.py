@@ -0,0 +1,566 @@
+"""
+worker.py
+jlazear
+
+Running a cp controller in a separate worker process.
+
+With `@Controller(isolated=True)`, the controller instance lives in a worker
+process, and the GUI talks to it through a `WorkerProxy`. The instrument I/O
+of the commands then runs on its own interpreter (and GIL), so that plotting
+never delays an acquisition, and a busy acquisition never delays plotting.
+
+Commands are sent to the worker over a pipe, and run there on a thread pool
+(coroutine commands on the worker's event loop, see `aio`). Their return
+values are sent back. Streaming commands (see `stream`) instead publish
+their blocks to a `SharedRing`, a ring buffer in shared memory, which the
+GUI maps and reads with a `RingReader`. The worker never waits for the GUI:
+if the GUI falls more than the ring's capacity behind, it skips the oldest
+rows (counted in `RingReader.dropped`) rather than slowing the acquisition.
+
+The ring buffers use `multiprocessing.shared_memory` where available
+(Python 3.8+) and a memory-mapped temporary file otherwise.
+
+The controller class must be importable by the worker (i.e. defined at
+module level), and the arguments given to it must be picklable, as must the
+arguments and return values of its commands.
+"""
+
+import mmap
+import os
+import pickle
+import sys
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+import aio
+from cpreaders import IncrementalReader
+
+
+class WorkerError(RuntimeError):
+    """Raised when the worker process failed or exited."""
+    pass
+
+
+# Ring buffers --------------------------------------------------------------
+
+# int64s: rows written, columns, capacity, writer closed, rows being written
+_HEADER = 5
+
+
+class SharedRing(object):
+    """
+    A fixed-capacity ring buffer of float64 rows in shared memory, written
+    by one process and read by others.
+
+    Made with `ncols` and `capacity` (in rows), it creates the shared memory;
+    made with the `name` of an existing ring, it maps it. Before writing
+    rows, the writer advances the count of rows being written, which says
+    which slots it may be overwriting. It publishes the rows by advancing
+    the row count once they are written. Readers copy the published rows
+    and then check the first count, to discard the rows that may have been
+    overwritten meanwhile, so no lock is needed and the writer never waits.
+    """
+    def __init__(self, ncols=None, capacity=None, name=None):
+        if name is None:
+            if ncols < 1 or capacity < 1:
+                raise ValueError('ncols and capacity must be at least 1')
+            size = 8*(_HEADER + ncols*capacity)
+            self.name, self._buf, self._closer, self._unlinker = \
+                _create(size)
+            self._header = np.ndarray(_HEADER, np.int64, self._buf)
+            self._header[:] = (0, ncols, capacity, 0, 0)
+        else:
+            self.name, self._buf, self._closer, self._unlinker = \
+                _attach(name)
+            self._header = np.ndarray(_HEADER, np.int64, self._buf)
+            ncols, capacity = (int(v) for v in self._header[1:3])
+        self.ncols = ncols
+        self.capacity = capacity
+        self._data = np.ndarray((ncols, capacity), np.float64, self._buf,
+                                8*_HEADER)
+
+    def __repr__(self):
+        return '<SharedRing {0}: {1} columns, {2} rows written>'.format(
+            self.name, self.ncols, self.end)
+
+    @property
+    def end(self):
+        """Number of rows written so far."""
+        return int(self._header[0])
+
+    @property
+    def closed(self):
+        """True once the writer will write no more rows."""
+        return bool(self._header[3])
+
+    def write(self, columns):
+        """Append the rows given by `columns`, one array per column,
+        overwriting the oldest rows if the ring is full."""
+        nrows = len(columns[0])
+        capacity = self.capacity
+        end = self.end
+        if nrows > capacity:
+            end += nrows - capacity
+            columns = [c[-capacity:] for c in columns]
+            nrows = capacity
+        first = end % capacity
+        split = min(nrows, capacity - first)
+        data = self._data
+        self._header[4] = end + nrows  # Slots up to here may be overwritten
+        for i, c in enumerate(columns):
+            data[i, first:first + split] = c[:split]
+            data[i, :nrows - split] = c[split:]
+        self._header[0] = end + nrows  # Publish
+
+    def read(self, start):
+        """
+        Copy the rows written since row `start`. Returns the list of column
+        arrays, the row count to pass as `start` next time, and the number
+        of rows that were overwritten before they could be read.
+        """
+        capacity = self.capacity
+        end = self.end
+        dropped = max(end - capacity - start, 0)
+        start += dropped
+        first = start % capacity
+        nrows = end - start
+        split = min(nrows, capacity - first)
+        data = self._data
+        columns = [np.concatenate((data[i, first:first + split],
+                                   data[i, :nrows - split]))
+                   for i in range(self.ncols)]
+        # Rows overwritten while they were being copied, including by a
+        # write that has not been published yet
+        started = int(self._header[4])
+        overwritten = min(max(started - capacity - start, 0), nrows)
+        if overwritten:
+            columns = [c[overwritten:] for c in columns]
+            dropped += overwritten
+        return columns, end, dropped
+
+    def close_writer(self):
+        self._header[3] = 1
+
+    def release(self):
+        """Unmap the ring."""
+        self._header = self._data = None
+        try:
+            self._closer()
+        except BufferError:  # Still referenced; freed when collected
+            pass
+
+    def unlink(self):
+        """Remove the ring's name. Processes that mapped it keep it."""
+        try:
+            self._unlinker()
+        except OSError:
+            pass
+
+
+def _create(size):
+    """Make shared memory of `size` bytes. Returns its name, buffer, and
+    functions that unmap and remove it."""
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        shared_memory = None
+    if shared_memory is not None:
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        # The reader removes it (see `WorkerProxy._receive`), not the
+        # resource tracker when this process exits.
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+
+        def _unlink():
+            # `unlink` unregisters it again
+            resource_tracker.register(shm._name, 'shared_memory')
+            try:
+                shm.unlink()
+            except OSError:
+                resource_tracker.unregister(shm._name, 'shared_memory')
+                raise
+        return shm.name, shm.buf, shm.close, _unlink
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else None
+    fd, path = tempfile.mkstemp(prefix='cp-ring-', dir=directory)
+    try:
+        os.ftruncate(fd, size)
+        mm = mmap.mmap(fd, size)
+    finally:
+        os.close(fd)
+    return path, mm, mm.close, lambda: os.remove(path)
+
+
+def _attach(name):
+    if os.sep in name:  # Memory-mapped file
+        with open(name, 'r+b') as f:
+            mm = mmap.mmap(f.fileno(), 0)
+        return name, mm, mm.close, lambda: os.remove(name)
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name=name)
+    return shm.name, shm.buf, shm.close, shm.unlink
+
+
+# GUI side ------------------------------------------------------------------
+
+class WorkerProxy(object):
+    """
+    Stands in for a controller instance that runs in a worker process.
+
+    The worker makes the instance with `cls(*args, **kwargs)` and runs its
+    commands on `workers` threads. Commands are called on the proxy as on
+    the controller, and block until the worker returns. Other attributes
+    are fetched from the worker.
+
+    A streaming command returns a `RemoteStream`. `close` stops the worker,
+    which closes the controller's connections (see `resources`).
+    """
+    def __init__(self, cls, args=(), kwargs=None, workers=4):
+        import multiprocessing
+        from registry import registry_for
+        cls = getattr(cls, 'cls', cls)  # Unwrap `Controller`
+        self.controller_class = cls
+        self.registry = registry_for(cls)
+        try:
+            # A fresh interpreter, rather than a fork of the GUI
+            ctx = multiprocessing.get_context('spawn')
+        except AttributeError:
+            ctx = multiprocessing
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(
+            target=serve, name='cp-worker-' + cls.__name__,
+            args=(cls.__module__, cls.__name__, tuple(args),
+                  dict(kwargs or {}), child, workers))
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+
+        self.lock = threading.Lock()  # Guards sending and `pending`
+        self.pending = {}             # Message id -> Future or RemoteStream
+        self.lastid = 0
+        self.closed = False
+        msgid, kind, value = self.conn.recv()
+        if kind == 'error':
+            self.process.join()
+            raise value
+        self.receiver = threading.Thread(target=self._receive,
+                                         name='cp-worker-receiver')
+        self.receiver.daemon = True
+        self.receiver.start()
+
+    def __repr__(self):
+        return '<WorkerProxy for {0} (pid {1})>'.format(
+            self.controller_class.__name__, self.process.pid)
+
+    def __getattr__(self, name):
+        if name.startswith('__') or 'registry' not in self.__dict__:
+            raise AttributeError(name)
+        if name in self.registry:
+            def _call(*args, **kwargs):
+                return self.call(name, *args, **kwargs)
+            _call.__name__ = name
+            return _call
+        return self.request('getattr', name).result()
+
+    def call(self, name, *args, **kwargs):
+        """Call the command `name` in the worker and return its return
+        value, or a `RemoteStream` if it streams."""
+        return self.request('call', (name, args, kwargs)).result()
+
+    def request(self, op, payload):
+        """Send a request to the worker. Returns a Future for the reply."""
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise WorkerError('The worker process has exited')
+            self.lastid += 1
+            msgid = self.lastid
+            self.pending[msgid] = future
+            self.conn.send((msgid, op, payload))
+        return future
+
+    def stop(self, msgid):
+        """Stop the streaming command of request `msgid`."""
+        with self.lock:
+            if not self.closed:
+                self.conn.send((msgid, 'stop', None))
+
+    def _receive(self):
+        """Dispatch the worker's replies. Runs in a daemon thread."""
+        while True:
+            try:
+                msgid, kind, value = self.conn.recv()
+            except (EOFError, OSError, IOError):
+                break
+            with self.lock:
+                waiter = self.pending.get(msgid)
+                if kind != 'stream':
+                    self.pending.pop(msgid, None)
+            if waiter is None:
+                continue
+            if kind == 'stream':
+                name, columns = value
+                stream = RemoteStream(self, msgid, SharedRing(name=name),
+                                      columns)
+                stream.ring.unlink()  # Mapped by both processes now
+                with self.lock:
+                    self.pending[msgid] = stream
+                waiter.set_result(stream)
+            elif isinstance(waiter, RemoteStream):
+                waiter._finish(kind, value)
+            elif kind == 'ok':
+                waiter.set_result(value)
+            else:
+                waiter.set_exception(value)
+        with self.lock:
+            self.closed = True
+            pending, self.pending = self.pending, {}
+        error = WorkerError('The worker process has exited')
+        for waiter in pending.values():
+            if isinstance(waiter, RemoteStream):
+                waiter._finish('error', error)
+            elif not waiter.done():
+                waiter.set_exception(error)
+
+    def close(self, timeout=5.):
+        """Stop the worker process, after the commands it is running."""
+        with self.lock:
+            if not self.closed:
+                try:
+                    self.conn.send((0, 'close', None))
+                except (OSError, IOError):
+                    pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+
+
+class RemoteStream(object):
+    """
+    The data streamed by a command running in the worker: a `SharedRing`
+    and the names of its `columns`. Plotted with a `RingReader`.
+    """
+    def __init__(self, proxy, msgid, ring, columns):
+        self.proxy = proxy
+        self.msgid = msgid
+        self.ring = ring
+        self.columns = columns
+        self.done = threading.Event()
+        self.error = None
+
+    def __repr__(self):
+        return '<RemoteStream: {0} rows{1}>'.format(
+            self.nrows, ', done' if self.done.is_set() else '')
+
+    @property
+    def nrows(self):
+        return self.ring.end
+
+    def wait(self, timeout=None):
+        """Wait for the command to finish. Raises its exception, if any."""
+        self.done.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return self
+
+    def close(self):
+        """Stop the command, if it is still running."""
+        if not self.done.is_set():
+            self.proxy.stop(self.msgid)
+
+    def _finish(self, kind, value):
+        if kind == 'error':
+            self.error = value
+        self.done.set()
+
+
+class RingReader(IncrementalReader):
+    """
+    Reader of a `RemoteStream`, for plotting it. Each update copies the
+    rows written to the ring since the last one. `dropped` counts the rows
+    that were overwritten before they could be read.
+    """
+    filename = None
+
+    def __init__(self, f, dtype=float, *args, **kwargs):
+        self.dtype = dtype
+        self._open(f)
+
+    def _open(self, f):
+        if not isinstance(f, RemoteStream):
+            raise TypeError('RingReader reads RemoteStreams, not '
+                            '{0!r}'.format(f))
+        self.stream = f
+        self.data = None
+
+    def follows(self, f):
+        return f is self.stream
+
+    def signature(self):
+        return self.stream.ring.end
+
+    def close(self):
+        self.stream.close()
+
+    def init_data(self, *args, **kwargs):
+        self.position = 0
+        self.dropped = 0
+        self.data = self._make_buffer(self.stream.columns,
+                                      self.stream.ring.capacity)
+        self._read_new()
+        self._trim()
+        return self.data
+
+    def update_data(self):
+        self._read_new()
+        self._trim()
+        return self.data
+
+    def _read_new(self):
+        if self.stream.ring.end == self.position:
+            return
+        columns, self.position, dropped = self.stream.ring.read(
+            self.position)
+        self.dropped += dropped
+        if len(columns[0]):
+            self.data.append_columns(columns)
+
+
+RemoteStream.reader_class = RingReader
+
+
+# Worker side ---------------------------------------------------------------
+
+def serve(modname, clsname, args, kwargs, conn, workers=4):
+    """
+    The worker process: make the controller and run the commands requested
+    through `conn` until it is closed.
+    """
+    send_lock = threading.Lock()
+
+    def send(msgid, kind, value):
+        with send_lock:
+            try:
+                conn.send((msgid, kind, value))
+            except (pickle.PicklingError, TypeError, AttributeError) as e:
+                conn.send((msgid, 'error', WorkerError(
+                    'Reply could not be pickled: {0!r}'.format(e))))
+
+    try:
+        __import__(modname)
+        cls = getattr(sys.modules[modname], clsname)
+        cls = getattr(cls, 'cls', cls)  # Unwrap `Controller`
+        controller = cls(*args, **kwargs)
+    except Exception as e:
+        send(0, 'error', _picklable(e))
+        return
+    from registry import registry_for
+    registry = registry_for(cls)
+    send(0, 'ok', None)
+
+    pool = ThreadPoolExecutor(workers)
+    stops = {}   # Message id -> threading.Event stopping its stream
+    rings = {}   # Message id -> SharedRing of its stream
+
+    def forget(msgid):
+        # The command finished. The GUI unlinks its ring once mapped.
+        stops.pop(msgid, None)
+        ring = rings.pop(msgid, None)
+        if ring is not None:
+            ring.release()
+
+    try:
+        while True:
+            try:
+                msgid, op, payload = conn.recv()
+            except (EOFError, OSError, IOError):
+                break
+            if op == 'call':
+                stops[msgid] = threading.Event()
+                future = pool.submit(_run, controller, registry, msgid,
+                                     payload, send, stops[msgid], rings)
+                future.add_done_callback(lambda f, msgid=msgid:
+                                         forget(msgid))
+            elif op == 'getattr':
+                pool.submit(_getattr, controller, msgid, payload, send)
+            elif op == 'stop':
+                stop = stops.get(msgid)
+                if stop is not None:
+                    stop.set()
+            elif op == 'close':
+                break
+    finally:
+        for stop in list(stops.values()):
+            stop.set()
+        # The GUI may never map the rings of the streams still running
+        unmapped = list(rings.values())
+        pool.shutdown(wait=True)
+        from resources import close_resources
+        close_resources(controller)
+        for ring in unmapped:
+            ring.unlink()
+        conn.close()
+
+
+def _run(controller, registry, msgid, payload, send, stop, rings):
+    name, args, kwargs = payload
+    from stream import isstream
+    try:
+        retval = getattr(controller, name)(*args, **kwargs)
+        if aio.iscoroutine(retval):
+            retval = aio.run(retval)
+        spec = registry[name] if name in registry else None
+        info = spec.stream if spec is not None else None
+        if isstream(retval, info is not None):
+            retval = _publish(retval, info or {}, msgid, send, stop, rings)
+    except Exception as e:
+        send(msgid, 'error', _picklable(e))
+        return
+    send(msgid, 'ok', retval)
+
+
+def _publish(iterable, info, msgid, send, stop, rings):
+    """Write the blocks of `iterable` to a new `SharedRing`, until it is
+    exhausted or `stop` is set. Returns the number of rows written."""
+    from stream import Stream
+    converter = Stream(info.get('columns'))  # Only converts the blocks
+    ring = None
+    try:
+        for block in iterable:
+            columns = converter.columns_of(block)
+            if ring is None:
+                ring = SharedRing(len(columns),
+                                  info.get('capacity') or 1 << 20)
+                rings[msgid] = ring
+                send(msgid, 'stream', (ring.name, converter.columns))
+            ring.write(columns)
+            if stop.is_set():
+                break
+    finally:
+        close = getattr(iterable, 'close', None)
+        if close is not None:
+            close()
+        if ring is not None:
+            ring.close_writer()
+    return ring.end if ring is not None else 0
+
+
+def _getattr(controller, msgid, name, send):
+    try:
+        value = getattr(controller, name)
+    except Exception as e:
+        send(msgid, 'error', _picklable(e))
+        return
+    send(msgid, 'ok', value)
+
+
+def _picklable(e):
+    """`e`, or a `WorkerError` describing it if it can't be pickled."""
+    try:
+        pickle.loads(pickle.dumps(e))
+        return e
+    except Exception:
+        return WorkerError(repr(e))